@@ -14,15 +14,29 @@ from .routes.export_routes import create_export_routes
 from .routes.auth_routes import create_auth_routes
 from .routes.project_routes import project_bp
 from .routes.docx_routes import docx_bp
+from .routes.formatting_routes import formatting_bp
+from .routes.text_routes import text_bp
 from .routes.password_protection import create_password_protection_routes
 from .routes.stripe_routes import stripe_bp
 from .routes.security_routes import security_bp
 from .middleware.csrf_middleware import csrf
 from .middleware.rate_limiter import create_limiter
 from .middleware.security_headers import init_security_headers
+from .middleware.compression import init_compression
+from .middleware.credit_holds import init_credit_holds
 from .middleware.domain_redirect import init_domain_redirect
-from .services.supabase_service import init_supabase_service
+from .services.supabase_service import init_supabase_service, get_supabase_service
+from .services.user_cache import create_user_cache
+from .services.supabase_client_pool import SupabaseClientPool, init_supabase_client_pool
 from .services.security_service import init_security_service
+from .services.docx_process_pool import init_docx_process_pool
+from .services.io_executor import init_io_executor
+from .services.usage_history_service import init_usage_history_service
+from .services.formatting_render_service import init_formatting_render_service
+from .services.book_text_service import init_book_text_service
+from .services.project_service import init_project_service
+from .services.project_write_buffer import init_project_write_buffer
+from .services.usage_log_writer import init_usage_log_writer
 
 def create_app(config_name=None):
     """
@@ -70,7 +84,7 @@ def create_app(config_name=None):
             origins=allowed_origins,
             supports_credentials=True,
             methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            allow_headers=["Content-Type", "Authorization", "X-Requested-With", "X-CSRF-Token", "X-Temp-Auth"],
+            allow_headers=["Content-Type", "Authorization", "X-Requested-With", "X-CSRF-Token", "X-Temp-Auth", "Content-Encoding"],
             expose_headers=["Content-Disposition", "X-Auth-Status", "X-Session-Status"]
         )
     else:
@@ -108,15 +122,98 @@ def create_app(config_name=None):
             app.config['SUPABASE_URL'],
             app.config['SUPABASE_KEY'],
             app.config['SUPABASE_JWT_SECRET'],
-            app.config.get('SUPABASE_SERVICE_KEY')  # Add service key for webhooks
+            app.config.get('SUPABASE_SERVICE_KEY'),  # Add service key for webhooks
+            token_cache_size=app.config['JWT_CACHE_SIZE'],
+            credit_hold_ttl=app.config['CREDIT_HOLD_TTL_SECONDS'],
+            user_cache=create_user_cache(
+                app.config['USER_CACHE_BACKEND'],
+                ttl=app.config['USER_CACHE_TTL_SECONDS'],
+                max_entries=app.config['USER_CACHE_MAX_ENTRIES'],
+                sqlite_path=app.config['USER_CACHE_SQLITE_PATH'],
+                redis_url=app.config['REDIS_URL']
+            ),
+            client_pool=SupabaseClientPool(
+                app.config['SUPABASE_URL'],
+                app.config['SUPABASE_KEY'],
+                size=app.config['SUPABASE_CLIENT_POOL_SIZE'],
+                max_connections=app.config['SUPABASE_MAX_CONNECTIONS'],
+                keepalive_seconds=app.config['SUPABASE_KEEPALIVE_SECONDS'],
+                acquire_timeout=app.config['SUPABASE_CLIENT_POOL_TIMEOUT'],
+                http2=app.config['SUPABASE_HTTP2']
+            )
         )
-        app.logger.info("✅ Supabase service initialized")
+        app.logger.info(f"✅ Supabase service initialized (user cache: {get_supabase_service().user_cache.backend})")
     else:
         app.logger.warning("⚠️ Supabase configuration not found - authentication features will be disabled")
     
     # Initialize security service
     security_service = init_security_service()
     
+    # Initialize DOCX process pool (worker processes start lazily on first DOCX import)
+    init_docx_process_pool(
+        enabled=app.config['DOCX_PROCESS_POOL_ENABLED'],
+        max_workers=app.config['DOCX_PROCESS_POOL_WORKERS'],
+        timeout=app.config['DOCX_PROCESSING_TIMEOUT'],
+        max_cpu_seconds=app.config['DOCX_MAX_CPU_SECONDS'],
+        max_memory_mb=app.config['DOCX_MAX_MEMORY_MB']
+    )
+    
+    # Initialize shared I/O executor (threads start lazily on first use)
+    init_io_executor(
+        max_workers=app.config['IO_EXECUTOR_WORKERS'],
+        max_pending=app.config['IO_EXECUTOR_MAX_PENDING']
+    )
+    
+    # Initialize usage history pagination (cached totals)
+    init_usage_history_service(
+        count_mode=app.config['USAGE_HISTORY_COUNT_MODE'],
+        count_refresh_seconds=app.config['USAGE_HISTORY_COUNT_REFRESH_SECONDS']
+    )
+    
+    # Initialize formatting render cache (pre-rendered HTML segments for large books)
+    init_formatting_render_service(
+        cache_folder=app.config['RENDER_CACHE_FOLDER'],
+        segment_size=app.config['RENDER_SEGMENT_SIZE'],
+        cache_max_age_hours=app.config['RENDER_CACHE_MAX_AGE_HOURS']
+    )
+    
+    # Initialize book text store (content-addressed chunks, see sql/22)
+    init_book_text_service(
+        chunk_chars=app.config['BOOK_TEXT_CHUNK_CHARS'],
+        max_range_chars=app.config['BOOK_TEXT_MAX_RANGE_CHARS']
+    )
+    
+    # Initialize project persistence (optional compressed storage, see sql/19)
+    project_service = init_project_service(
+        compression=app.config['PROJECT_BLOB_COMPRESSION'],
+        compression_min_bytes=app.config['PROJECT_BLOB_MIN_BYTES']
+    )
+    
+    # Coalesce autosaves in a write-behind spool (disabled unless a window is configured).
+    # Flushes run outside any request, so without the service key RLS would reject them all
+    write_behind_seconds = app.config['PROJECT_WRITE_BEHIND_SECONDS']
+    if write_behind_seconds > 0 and not app.config.get('SUPABASE_SERVICE_KEY'):
+        app.logger.warning("⚠️ PROJECT_WRITE_BEHIND_SECONDS needs SUPABASE_SERVICE_KEY, saving projects directly")
+        write_behind_seconds = 0
+    if init_project_write_buffer(
+        project_service,
+        spool_folder=app.config['PROJECT_SPOOL_FOLDER'],
+        window_seconds=write_behind_seconds,
+        max_delay_seconds=app.config['PROJECT_WRITE_BEHIND_MAX_DELAY_SECONDS'],
+        client_provider=lambda: get_supabase_service().get_service_client()
+    ):
+        app.logger.info("✅ Project write-behind buffer initialized")
+    
+    # Write usage logs in bulk off the request path (needs Supabase)
+    if init_usage_log_writer(
+        client_provider=lambda: get_supabase_service().get_service_client(),
+        spool_folder=app.config['USAGE_LOG_SPOOL_FOLDER'],
+        enabled=app.config['USAGE_LOG_WRITE_BEHIND'] and bool(app.config.get('SUPABASE_URL') and app.config.get('SUPABASE_KEY')),
+        batch_size=app.config['USAGE_LOG_BATCH_SIZE'],
+        flush_seconds=app.config['USAGE_LOG_FLUSH_SECONDS']
+    ):
+        app.logger.info("✅ Usage log writer initialized")
+    
     # Initialize domain redirect middleware (production only)
     init_domain_redirect(app)
     app.logger.info("✅ Domain redirect middleware initialized")
@@ -132,6 +229,16 @@ def create_app(config_name=None):
     # Initialize security headers
     init_security_headers(app)
     
+    # Initialize response compression and gzip request bodies
+    init_compression(app)
+    
+    # Return request-scoped database clients to their pool when a request ends
+    # (registered first so it runs after the other teardown handlers)
+    init_supabase_client_pool(app)
+    
+    # Release credit holds of paid requests that fail or are aborted
+    init_credit_holds(app)
+    
     # Register routes - preserving exact functionality and adding auth
     create_static_routes(app)
     create_upload_routes(app, app.config['UPLOAD_FOLDER'])
@@ -147,6 +254,12 @@ def create_app(config_name=None):
     # Register DOCX processing routes
     app.register_blueprint(docx_bp)
     
+    # Register formatting render routes
+    app.register_blueprint(formatting_bp, url_prefix='/api/formatting')
+    
+    # Register book text store routes
+    app.register_blueprint(text_bp, url_prefix='/api/texts')
+    
     # Register Stripe payment routes (Normal mode only)
     app.register_blueprint(stripe_bp)
     
@@ -43,6 +43,21 @@ class Config:
     SUPABASE_SERVICE_KEY = os.environ.get('SUPABASE_SERVICE_KEY')  # Keep separate service key
     SUPABASE_ANON_KEY = os.environ.get('SUPABASE_ANON_KEY')
     SUPABASE_JWT_SECRET = os.environ.get('JWT_SECRET_KEY')  # Fixed: Match .env variable name
+    JWT_CACHE_SIZE = int(os.environ.get('JWT_CACHE_SIZE', 1024))  # Verified tokens kept until they expire
+    
+    # User profile/credits cache shared by the gunicorn workers: sqlite (per host), redis or local (per process)
+    REDIS_URL = os.environ.get('REDIS_URL')
+    USER_CACHE_BACKEND = os.environ.get('USER_CACHE_BACKEND', 'redis' if os.environ.get('REDIS_URL') else 'sqlite').lower()
+    USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS', 300))
+    USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000))
+    USER_CACHE_SQLITE_PATH = os.environ.get('USER_CACHE_SQLITE_PATH', os.path.join(BASE_DIR, 'user_cache', 'users.sqlite3'))
+    
+    # Request-scoped database clients over keep-alive connections shared per worker (HTTP/2 needs the h2 package)
+    SUPABASE_CLIENT_POOL_SIZE = int(os.environ.get('SUPABASE_CLIENT_POOL_SIZE', 16))
+    SUPABASE_CLIENT_POOL_TIMEOUT = float(os.environ.get('SUPABASE_CLIENT_POOL_TIMEOUT', 2))
+    SUPABASE_MAX_CONNECTIONS = int(os.environ.get('SUPABASE_MAX_CONNECTIONS', 20))
+    SUPABASE_KEEPALIVE_SECONDS = float(os.environ.get('SUPABASE_KEEPALIVE_SECONDS', 30))
+    SUPABASE_HTTP2 = os.environ.get('SUPABASE_HTTP2', 'true').lower() in ['true', '1', 'yes']
     
     # Credits system configuration (for future ElevenLabs integration)
     DEFAULT_CREDITS = int(os.environ.get('DEFAULT_CREDITS', 100))
@@ -91,6 +106,52 @@ class Config:
     CREDIT_COST_DOCX_PROCESSING = int(os.environ.get('CREDIT_COST_DOCX_PROCESSING', 5))
     CREDIT_COST_TXT_UPLOAD = int(os.environ.get('CREDIT_COST_TXT_UPLOAD', 3))
     CREDIT_COST_PREMIUM_EXPORT = int(os.environ.get('CREDIT_COST_PREMIUM_EXPORT', 15))
+    CREDIT_HOLD_TTL_SECONDS = int(os.environ.get('CREDIT_HOLD_TTL_SECONDS', 900))  # Reserved credits free up after this if a job never settles
+
+    # DOCX processing isolation - extraction runs in worker processes with per-document budgets
+    DOCX_PROCESS_POOL_ENABLED = os.environ.get('DOCX_PROCESS_POOL_ENABLED', 'true').lower() in ['true', '1', 'yes']
+    DOCX_PROCESS_POOL_WORKERS = int(os.environ.get('DOCX_PROCESS_POOL_WORKERS', 1))  # Per gunicorn worker
+    DOCX_PROCESSING_TIMEOUT = int(os.environ.get('DOCX_PROCESSING_TIMEOUT', 60))  # Wall-clock seconds
+    DOCX_MAX_CPU_SECONDS = int(os.environ.get('DOCX_MAX_CPU_SECONDS', 45))  # CPU seconds per document
+    DOCX_MAX_MEMORY_MB = int(os.environ.get('DOCX_MAX_MEMORY_MB', 1024))  # Address space per worker
+
+    # Shared thread pool for parallel database calls (per gunicorn worker)
+    IO_EXECUTOR_WORKERS = int(os.environ.get('IO_EXECUTOR_WORKERS', 8))
+    IO_EXECUTOR_MAX_PENDING = int(os.environ.get('IO_EXECUTOR_MAX_PENDING', 64))  # Beyond this calls run inline
+
+    # Usage history totals: estimated, exact or none; cached totals are recounted in the background after this
+    USAGE_HISTORY_COUNT_MODE = os.environ.get('USAGE_HISTORY_COUNT_MODE', 'estimated').lower()
+    USAGE_HISTORY_COUNT_REFRESH_SECONDS = float(os.environ.get('USAGE_HISTORY_COUNT_REFRESH_SECONDS', 60))
+
+    # Server-side formatting render cache (pre-rendered HTML segments for large books)
+    RENDER_CACHE_FOLDER = os.environ.get('RENDER_CACHE_FOLDER', os.path.join(BASE_DIR, 'render_cache'))
+    RENDER_SEGMENT_SIZE = int(os.environ.get('RENDER_SEGMENT_SIZE', 20000))  # Characters per segment
+    RENDER_CACHE_MAX_AGE_HOURS = int(os.environ.get('RENDER_CACHE_MAX_AGE_HOURS', 24))
+
+    # Project storage - compressed blobs need sql/19_project_blob_compression.sql
+    PROJECT_BLOB_COMPRESSION = os.environ.get('PROJECT_BLOB_COMPRESSION', 'none').lower()  # none, gzip or zstd
+    PROJECT_BLOB_MIN_BYTES = int(os.environ.get('PROJECT_BLOB_MIN_BYTES', 16384))  # Smaller projects stay plain JSONB
+
+    # Write-behind autosave coalescing - needs sql/21_project_parts_version.sql; 0 disables
+    PROJECT_WRITE_BEHIND_SECONDS = float(os.environ.get('PROJECT_WRITE_BEHIND_SECONDS', 0))
+    PROJECT_WRITE_BEHIND_MAX_DELAY_SECONDS = float(os.environ.get('PROJECT_WRITE_BEHIND_MAX_DELAY_SECONDS', 30))
+    PROJECT_SPOOL_FOLDER = os.environ.get('PROJECT_SPOOL_FOLDER', os.path.join(BASE_DIR, 'project_spool'))
+
+    # Usage logs written in bulk from a background thread; unwritable rows are spooled and replayed
+    USAGE_LOG_WRITE_BEHIND = os.environ.get('USAGE_LOG_WRITE_BEHIND', 'true').lower() in ['true', '1', 'yes']
+    USAGE_LOG_BATCH_SIZE = int(os.environ.get('USAGE_LOG_BATCH_SIZE', 100))  # Rows per bulk insert
+    USAGE_LOG_FLUSH_SECONDS = float(os.environ.get('USAGE_LOG_FLUSH_SECONDS', 2))  # Longest a row waits for its batch
+    USAGE_LOG_SPOOL_FOLDER = os.environ.get('USAGE_LOG_SPOOL_FOLDER', os.path.join(BASE_DIR, 'usage_spool'))
+
+    # Server-side book text store - needs sql/22_book_text_store.sql
+    BOOK_TEXT_CHUNK_CHARS = int(os.environ.get('BOOK_TEXT_CHUNK_CHARS', 65536))  # Characters per stored chunk
+    BOOK_TEXT_MAX_RANGE_CHARS = int(os.environ.get('BOOK_TEXT_MAX_RANGE_CHARS', 1048576))  # Largest range per request
+
+    # HTTP compression - brotli is offered when the brotli package is installed
+    RESPONSE_COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION_ENABLED', 'true').lower() == 'true'
+    RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', 1024))  # Smaller bodies are sent as-is
+    RESPONSE_COMPRESSION_LEVEL = int(os.environ.get('RESPONSE_COMPRESSION_LEVEL', 6))  # gzip level 1-9
+    REQUEST_DECOMPRESSION_PATHS = ('/api/projects/save', '/api/export', '/api/texts')  # Accept Content-Encoding: gzip bodies
 
     # Enhanced Security Configuration
     SECURITY_HEADERS_ENABLED = os.environ.get('SECURITY_HEADERS_ENABLED', 'true').lower() == 'true'
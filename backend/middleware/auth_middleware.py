@@ -84,7 +84,7 @@ def require_auth(f: Callable) -> Callable:
             token = extract_token_from_header()
             
             # DEBUG: Log token extraction
-            logger.info(f"🔍 DEBUG: Token extracted - exists: {bool(token)}, length: {len(token) if token else 0}")
+            logger.debug(f"🔍 DEBUG: Token extracted - exists: {bool(token)}, length: {len(token) if token else 0}")
             
             if not token:
                 logger.warning("🔍 DEBUG: No token found in header")
@@ -104,13 +104,13 @@ def require_auth(f: Callable) -> Callable:
                 }), 503
             
             # DEBUG: Log before token verification
-            logger.info(f"🔍 DEBUG: About to verify token for user")
+            logger.debug(f"🔍 DEBUG: About to verify token for user")
             
             # Verify token and extract user
             user = supabase_service.get_user_from_token(token)
             
             # DEBUG: Log verification result
-            logger.info(f"🔍 DEBUG: Token verification result - user found: {bool(user)}")
+            logger.debug(f"🔍 DEBUG: Token verification result - user found: {bool(user)}")
             
             if not user:
                 logger.warning("🔍 DEBUG: Token verification failed - user is None")
@@ -207,11 +207,11 @@ def require_credits(min_credits: int = 1):
                 supabase_service = get_supabase_service()
                 
                 # Check user's credit balance
-                # CRITICAL FIX: Always get fresh credits for pre-action checks AND pass auth token
+                # Cached balance is enough for the pre-check; debits re-check it atomically
                 auth_token = getattr(g, 'auth_token', None)
-                current_credits = supabase_service.get_user_credits(user_id, use_cache=False, auth_token=auth_token)
+                has_credits, current_credits = supabase_service.check_credits(user_id, min_credits, auth_token=auth_token)
                 
-                if current_credits < min_credits:
+                if not has_credits:
                     return jsonify({
                         'error': 'Insufficient credits',
                         'message': f'This action requires {min_credits} credits. You have {current_credits} credits.',
@@ -271,19 +271,16 @@ def consume_credits(credits_to_consume: int, action: str):
                     # Get Supabase service
                     supabase_service = get_supabase_service()
                     
-                    # Consume credits
-                    success = supabase_service.update_user_credits(g.user_id, -credits_to_consume)
+                    # Check, debit and log the usage in one atomic call
+                    debit = supabase_service.debit_credits(
+                        g.user_id, 
+                        credits_to_consume,
+                        action, 
+                        {'endpoint': request.endpoint, 'method': request.method},
+                        auth_token=getattr(g, 'auth_token', None)
+                    )
                     
-                    if success:
-                        # Cache is now automatically cleared in update_user_credits()
-                        
-                        # Log the usage
-                        supabase_service.log_usage(
-                            g.user_id, 
-                            action, 
-                            credits_to_consume,
-                            {'endpoint': request.endpoint, 'method': request.method}
-                        )
+                    if debit['success']:
                         logger.info(f"✅ Consumed {credits_to_consume} credits for {action} by user {g.user_id}")
                     else:
                         logger.warning(f"⚠️ Failed to consume credits for user {g.user_id}")
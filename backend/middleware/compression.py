@@ -0,0 +1,222 @@
+"""
+Compression Middleware
+Compresses large responses for clients that accept it and decodes gzip request bodies
+"""
+
+import io
+import zlib
+
+from flask import request, jsonify
+
+try:
+    import brotli
+except ImportError:  # Optional dependency - gzip is always available
+    brotli = None
+
+# Responses of these types are worth compressing; audio, images and archives are not
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+    'text/css',
+    'text/html',
+    'text/javascript',
+    'text/plain',
+    'text/xml'
+}
+
+BROTLI_QUALITY = 5
+STREAM_CHUNK_SIZE = 64 * 1024
+DECOMPRESSION_ERROR_KEY = 'audiobook.request_decompression_error'
+
+
+class _GzipStream:
+    """Incremental gzip compressor with the brotli Compressor interface"""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def _new_compressor(encoding: str, level: int):
+    if encoding == 'br':
+        return brotli.Compressor(quality=BROTLI_QUALITY)
+    return _GzipStream(level)
+
+
+def negotiate_encoding(accept_encodings) -> str:
+    """Pick the best response encoding the client accepts, or None for identity"""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return accept_encodings.best_match(offered)
+
+
+def _is_compressible(response) -> bool:
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    return response.mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def _compress_stream(chunks, compressor):
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        compressed = compressor.process(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.finish()
+
+
+def compress_response(response, min_bytes: int, level: int):
+    """Compress the response body in place when it is large and compressible enough"""
+    if not _is_compressible(response):
+        return response
+
+    # The body now depends on Accept-Encoding, even when this client gets it uncompressed
+    response.vary.add('Accept-Encoding')
+
+    encoding = negotiate_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+
+    if response.is_streamed or response.direct_passthrough:
+        # Files and generators are compressed chunk by chunk instead of being buffered
+        if response.content_length is not None and response.content_length < min_bytes:
+            return response
+        original = response.response
+        response.response = _compress_stream(original, _new_compressor(encoding, level))
+        if hasattr(original, 'close'):
+            response.call_on_close(original.close)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        compressor = _new_compressor(encoding, level)
+        compressed = compressor.process(data) + compressor.finish()
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+    # Byte ranges refer to the uncompressed file
+    response.headers.pop('Accept-Ranges', None)
+    # A strong ETag names exact bytes; the compressed body is only semantically equivalent
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class GzipRequestMiddleware:
+    """
+    WSGI middleware decoding `Content-Encoding: gzip` request bodies on selected paths
+
+    Runs before Flask so every body reader (get_json, form parsing, CSRF checks)
+    sees plain bytes. Failures are not answered here but recorded in the environ
+    and turned into JSON errors by a before_request hook, so the response still
+    passes through CORS and security headers.
+    """
+
+    def __init__(self, wsgi_app, paths, max_bytes: int):
+        self.wsgi_app = wsgi_app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding and encoding != 'identity' and environ.get('PATH_INFO') in self.paths:
+            self._decode_body(environ, encoding)
+        return self.wsgi_app(environ, start_response)
+
+    def _decode_body(self, environ, encoding: str) -> None:
+        body = b''
+        if encoding != 'gzip':
+            environ[DECOMPRESSION_ERROR_KEY] = (415, f'Unsupported Content-Encoding: {encoding}')
+        else:
+            try:
+                body = self._gunzip(environ)
+            except _BodyTooLarge:
+                environ[DECOMPRESSION_ERROR_KEY] = (413, 'Decompressed request body is too large')
+            except (zlib.error, EOFError, ValueError):
+                environ[DECOMPRESSION_ERROR_KEY] = (400, 'Request body is not valid gzip')
+
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        environ.pop('HTTP_CONTENT_ENCODING', None)
+        environ.pop('wsgi.input_terminated', None)
+
+    def _gunzip(self, environ) -> bytes:
+        """Decompress the request body, never holding more than max_bytes of output"""
+        stream = environ['wsgi.input']
+        remaining = None
+        if environ.get('CONTENT_LENGTH'):
+            remaining = int(environ['CONTENT_LENGTH'])
+        elif not environ.get('wsgi.input_terminated'):
+            return b''  # No length and no terminated stream: there is no body to read
+        if remaining is not None and remaining > self.max_bytes:
+            raise _BodyTooLarge()
+
+        decompressor = zlib.decompressobj(31)
+        output = bytearray()
+        while remaining is None or remaining > 0:
+            chunk = stream.read(STREAM_CHUNK_SIZE if remaining is None else min(remaining, STREAM_CHUNK_SIZE))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            data = chunk
+            while data:
+                output += decompressor.decompress(data, self.max_bytes + 1 - len(output))
+                if len(output) > self.max_bytes:
+                    raise _BodyTooLarge()
+                data = decompressor.unconsumed_tail
+        output += decompressor.flush()
+        if not decompressor.eof:
+            raise EOFError('Truncated gzip body')
+        if len(output) > self.max_bytes:
+            raise _BodyTooLarge()
+        return bytes(output)
+
+
+def init_compression(app):
+    """Initialize response compression and gzip request bodies for the app"""
+    app.wsgi_app = GzipRequestMiddleware(
+        app.wsgi_app,
+        paths=app.config.get('REQUEST_DECOMPRESSION_PATHS', ()),
+        max_bytes=app.config.get('MAX_CONTENT_LENGTH') or 100 * 1024 * 1024
+    )
+
+    @app.before_request
+    def reject_undecodable_body():
+        error = request.environ.get(DECOMPRESSION_ERROR_KEY)
+        if error:
+            status, message = error
+            return jsonify({'error': message}), status
+
+    if app.config.get('RESPONSE_COMPRESSION_ENABLED', True):
+        min_bytes = app.config.get('RESPONSE_COMPRESSION_MIN_BYTES', 1024)
+        level = app.config.get('RESPONSE_COMPRESSION_LEVEL', 6)
+
+        @app.after_request
+        def apply_compression(response):
+            return compress_response(response, min_bytes, level)
+
+    app.logger.info(
+        f"✅ Compression middleware initialized "
+        f"({'br, gzip' if brotli is not None else 'gzip'}; responses "
+        f"{'enabled' if app.config.get('RESPONSE_COMPRESSION_ENABLED', True) else 'disabled'})"
+    )
+    return app
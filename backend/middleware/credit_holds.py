@@ -0,0 +1,66 @@
+"""
+Credit Hold Middleware
+Reserves the credits of a paid request up front and settles the hold when it ends
+"""
+
+import logging
+from typing import Any, Dict, Optional
+
+from flask import g
+
+from ..services.supabase_service import get_supabase_service
+
+logger = logging.getLogger(__name__)
+
+
+def reserve_request_credits(user_id: str, amount: int, action: str,
+                            auth_token: str = None) -> Dict[str, Any]:
+    """
+    Reserve credits for the current request (see SupabaseService.reserve_credits)
+
+    A successful hold is kept on `g` until commit_request_credits(); if the
+    request ends without committing (error response, exception, aborted
+    stream) the hold is released when the request is torn down.
+    """
+    hold = get_supabase_service().reserve_credits(user_id, amount, action, auth_token=auth_token)
+    if hold['success']:
+        g.credit_hold = hold
+        g.credit_hold_token = auth_token
+    return hold
+
+
+def commit_request_credits(metadata: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+    """
+    Debit the credits held by the current request and log its usage
+
+    Returns the debit result, or None when the request holds no credits.
+    """
+    hold = g.pop('credit_hold', None)
+    if hold is None:
+        return None
+    return get_supabase_service().commit_credit_hold(
+        hold, metadata, auth_token=g.pop('credit_hold_token', None)
+    )
+
+
+def release_request_credits() -> None:
+    """Give back the credits held by the current request, if any"""
+    hold = g.pop('credit_hold', None)
+    if hold is None:
+        return
+    try:
+        get_supabase_service().release_credit_hold(hold, auth_token=g.pop('credit_hold_token', None))
+    except Exception as e:
+        # The hold still expires on its own
+        logger.warning(f"⚠️ Could not release credit hold: {e}")
+
+
+def init_credit_holds(app):
+    """Release holds of requests that ended without committing them"""
+
+    @app.teardown_request
+    def release_unsettled_credit_hold(exc):
+        release_request_credits()
+
+    app.logger.info("✅ Credit hold middleware initialized")
+    return app
@@ -9,7 +9,10 @@ from typing import Dict, Any
 
 from ..services.supabase_service import get_supabase_service
 from ..services.security_service import get_security_service
-from ..middleware.auth_middleware import require_auth, optional_auth, get_current_user
+from ..services.usage_log_writer import get_usage_log_writer
+from ..services.io_executor import get_io_executor
+from ..services.usage_history_service import get_usage_history_service
+from ..middleware.auth_middleware import require_auth, optional_auth, get_current_user, extract_token_from_header
 
 logger = logging.getLogger(__name__)
 
@@ -484,55 +487,43 @@ def create_auth_routes() -> Blueprint:
     @auth_bp.route('/usage-history', methods=['GET'])
     @require_auth
     def get_usage_history(current_user):
-        """Get paginated usage history for the current user"""
+        """
+        Get a page of the current user's usage history, newest first
+        
+        Query parameters: per_page, action_filter, and cursor (the next_cursor of
+        the previous page). page is echoed back; without a cursor it selects the
+        page by offset (older clients).
+        """
         try:
-            import math
-            
             # Get pagination parameters
-            page = int(request.args.get('page', 1))
-            per_page = min(int(request.args.get('per_page', 20)), 100)
-            action_filter = request.args.get('action_filter')
+            page = max(1, int(request.args.get('page', 1)))
+            per_page = max(1, min(int(request.args.get('per_page', 20)), 100))
+            action_filter = request.args.get('action_filter') or None
+            cursor = request.args.get('cursor') or None
             
             user_id = current_user['id']
             
             # Get Supabase service
             supabase_service = get_supabase_service()
+            token = extract_token_from_header()
             
-            # Build query with filters
-            query = supabase_service.client.table('usage_logs')\
-                .select('*')\
-                .eq('user_id', user_id)\
-                .order('created_at', desc=True)
-                
-            if action_filter:
-                query = query.eq('action', action_filter)
-                
-            # Execute with pagination
-            offset = (page - 1) * per_page
-            result = query.range(offset, offset + per_page - 1).execute()
-            
-            # Get total count for pagination
-            count_query = supabase_service.client.table('usage_logs')\
-                .select('*', count='exact')\
-                .eq('user_id', user_id)
-                
-            if action_filter:
-                count_query = count_query.eq('action', action_filter)
-                
-            count_result = count_query.execute()
-            total_count = count_result.count
+            history = get_usage_history_service().get_page(
+                supabase_service.client_for(token),
+                user_id,
+                per_page=per_page,
+                cursor=cursor,
+                action=action_filter,
+                page=page,
+                background_client=lambda: supabase_service.client_for(token, detached=True)
+            )
             
             return jsonify({
                 'success': True,
-                'data': result.data,
-                'pagination': {
-                    'page': page,
-                    'per_page': per_page,
-                    'total': total_count,
-                    'pages': math.ceil(total_count / per_page) if total_count > 0 else 1
-                }
+                **history
             })
             
+        except ValueError as e:
+            return jsonify({'error': 'Invalid pagination parameters', 'message': str(e)}), 400
         except Exception as e:
             logger.error(f"Usage history error: {e}")
             return jsonify({'error': 'Failed to fetch usage history'}), 500
@@ -712,7 +703,13 @@ def create_auth_routes() -> Blueprint:
                         'login_attempt_protection': True,
                         'captcha_protection': Config.RECAPTCHA['ENABLED'],
                         'jwt_verification': True
-                    }
+                    },
+                    'jwt_cache': get_supabase_service().get_token_cache_stats(),
+                    'user_cache': get_supabase_service().get_cache_stats(),
+                    'supabase_client_pool': get_supabase_service().get_client_pool_stats(),
+                    'usage_log_writer': get_usage_log_writer().get_stats() if get_usage_log_writer() else None,
+                    'io_executor': get_io_executor().get_stats(),
+                    'usage_history': get_usage_history_service().get_stats()
                 }
             })
             
@@ -784,6 +781,7 @@ def create_auth_routes() -> Blueprint:
             
             # Get Supabase service
             supabase_service = get_supabase_service()
+            client = supabase_service.client_for(extract_token_from_header())
             
             # Get user's email from current user or profile
             user_email = current_user.get('email')
@@ -823,7 +821,7 @@ def create_auth_routes() -> Blueprint:
             # Get list of user's uploaded files before deletion
             try:
                 # Query file_uploads table for user's files
-                file_result = supabase_service.client.table('file_uploads').select('file_path').eq('user_id', user_id).execute()
+                file_result = client.table('file_uploads').select('file_path').eq('user_id', user_id).execute()
                 user_files = [f['file_path'] for f in file_result.data] if file_result.data else []
                 
                 # Clean up user's audio files from filesystem
@@ -839,35 +837,36 @@ def create_auth_routes() -> Blueprint:
             try:
                 # Delete user's projects
                 try:
-                    project_result = supabase_service.client.table('audiobook_projects').delete().eq('user_id', user_id).execute()
+                    project_result = client.table('audiobook_projects').delete().eq('user_id', user_id).execute()
                     logger.info(f"Deleted {len(project_result.data) if project_result.data else 0} projects for user {user_id}")
                 except Exception as e:
                     logger.error(f"Error deleting projects: {e}")
                 
                 # Delete user's file upload records
                 try:
-                    files_result = supabase_service.client.table('file_uploads').delete().eq('user_id', user_id).execute()
+                    files_result = client.table('file_uploads').delete().eq('user_id', user_id).execute()
                     logger.info(f"Deleted {len(files_result.data) if files_result.data else 0} file records for user {user_id}")
                 except Exception as e:
                     logger.error(f"Error deleting file records: {e}")
                 
                 # Delete user's usage logs
                 try:
-                    usage_result = supabase_service.client.table('usage_logs').delete().eq('user_id', user_id).execute()
+                    usage_result = client.table('usage_logs').delete().eq('user_id', user_id).execute()
                     logger.info(f"Deleted {len(usage_result.data) if usage_result.data else 0} usage logs for user {user_id}")
                 except Exception as e:
                     logger.error(f"Error deleting usage logs: {e}")
                 
                 # Delete user's credits
                 try:
-                    credits_result = supabase_service.client.table('user_credits').delete().eq('user_id', user_id).execute()
+                    credits_result = client.table('user_credits').delete().eq('user_id', user_id).execute()
+                    supabase_service.invalidate_user_cache(user_id)
                     logger.info(f"Deleted credits record for user {user_id}")
                 except Exception as e:
                     logger.error(f"Error deleting credits: {e}")
                 
                 # Delete user's profile
                 try:
-                    profile_result = supabase_service.client.table('profiles').delete().eq('id', user_id).execute()
+                    profile_result = client.table('profiles').delete().eq('id', user_id).execute()
                     logger.info(f"Deleted profile for user {user_id}")
                 except Exception as e:
                     logger.error(f"Error deleting profile: {e}")
@@ -959,9 +958,10 @@ def create_auth_routes() -> Blueprint:
         try:
             user_id = g.user_id
             supabase_service = get_supabase_service()
+            client = supabase_service.client_for(extract_token_from_header())
             
             # Check for unacknowledged gifts in credit_transactions
-            result = supabase_service.client.table('credit_transactions').select('*').eq(
+            result = client.table('credit_transactions').select('*').eq(
                 'user_id', user_id
             ).eq('transaction_type', 'bonus').eq(
                 'metadata->>acknowledged', False
@@ -991,9 +991,10 @@ def create_auth_routes() -> Blueprint:
         try:
             user_id = g.user_id
             supabase_service = get_supabase_service()
+            client = supabase_service.client_for(extract_token_from_header())
             
             # First get the current metadata
-            result = supabase_service.client.table('credit_transactions').select('metadata').eq(
+            result = client.table('credit_transactions').select('metadata').eq(
                 'id', gift_id
             ).eq('user_id', user_id).single().execute()
             
@@ -1003,7 +1004,7 @@ def create_auth_routes() -> Blueprint:
                 current_metadata['acknowledged'] = True
                 
                 # Update the record
-                update_result = supabase_service.client.table('credit_transactions').update({
+                update_result = client.table('credit_transactions').update({
                     'metadata': current_metadata
                 }).eq('id', gift_id).eq('user_id', user_id).execute()
                 
@@ -1,12 +1,15 @@
 # AudioBook Organizer - DOCX Upload Routes
 
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, g, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import os
+import json
 import tempfile
 import time
-from backend.services.docx_service import DocxService
+from backend.services.docx_service import DocxService, DocxProcessingLimitError
+from backend.services.docx_process_pool import get_docx_process_pool
 from backend.middleware.auth_middleware import require_auth
+from backend.middleware.credit_holds import reserve_request_credits, commit_request_credits
 from backend.routes.password_protection import require_temp_auth
 from backend.services.supabase_service import get_supabase_service
 
@@ -18,6 +21,7 @@ docx_service = DocxService()
 
 # Configuration
 MAX_DOCX_SIZE = 25 * 1024 * 1024  # 25MB
+STREAM_CHUNK_PARAGRAPHS = 200  # Paragraphs per NDJSON chunk in streaming mode
 ALLOWED_EXTENSIONS = {'.docx'}
 
 
@@ -33,13 +37,174 @@ def allowed_file(filename):
     return file_ext in ALLOWED_EXTENSIONS
 
 
+def _wants_ndjson_stream():
+    """Check if the client asked for a progressive NDJSON response"""
+    if request.args.get('stream', '').lower() == 'ndjson':
+        return True
+    return 'application/x-ndjson' in request.headers.get('Accept', '')
+
+
+def _remove_temp_file(path):
+    """Remove a temporary upload file, logging (not raising) on failure"""
+    try:
+        if os.path.exists(path):
+            os.unlink(path)
+    except Exception as cleanup_error:
+        current_app.logger.warning(f'Failed to cleanup temp file: {cleanup_error}')
+
+
+def _ndjson_line(record):
+    """Serialise one NDJSON record"""
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def _store_docx_text(text):
+    """
+    Store and index extracted text in the book text store (normal mode only)
+    Returns its reference, or None when the store is unavailable
+    """
+    if current_app.config.get('TESTING_MODE') or not text:
+        return None
+    try:
+        from backend.middleware.auth_middleware import extract_token_from_header
+        from backend.services.book_text_index_service import store_and_index_text
+        supabase_service = get_supabase_service()
+        if not supabase_service.is_configured():
+            return None
+        client = supabase_service.client_for(extract_token_from_header())
+        return store_and_index_text(client, g.user_id, text)
+    except Exception as e:
+        # The upload still succeeds with the text inline
+        current_app.logger.warning(f'⚠️ Could not store DOCX text in the book text store: {e}')
+        return None
+
+
+def _consume_docx_credits(filename, file_size, text_length, formatting_ranges, processing_time):
+    """
+    Commit the DOCX processing credits held for this request and log usage (normal mode only)
+    Returns the insufficient-credits error body when the debit was refused, else None
+    """
+    if current_app.config.get('TESTING_MODE'):
+        current_app.logger.info('✅ Testing mode - Skipping credit deduction and usage logging')
+        return None
+    
+    try:
+        credits_to_consume = current_app.config['CREDIT_COST_DOCX_PROCESSING']
+        # Debit the credits held since the request started and log the usage in one atomic call
+        debit = commit_request_credits({
+            'filename': filename,
+            'file_size': file_size,
+            'text_length': text_length,
+            'formatting_ranges': formatting_ranges,
+            'processing_time': processing_time
+        })
+        if debit is None:
+            return None
+        if debit['insufficient']:
+            # The hold expired and its credits were spent by another request
+            return {
+                'error': 'Insufficient credits',
+                'message': f'This action requires {credits_to_consume} credits. You have {debit["credits"]} credits.',
+                'current_credits': debit['credits'],
+                'required_credits': credits_to_consume
+            }
+        if not debit['success']:
+            current_app.logger.warning('Failed to deduct credits for DOCX processing')
+    except Exception as log_error:
+        current_app.logger.warning(f'Failed to log usage: {log_error}')
+    return None
+
+
+def _build_ndjson_response(records, temp_path, filename, file_size, start_time):
+    """
+    Build a streaming response that emits one JSON record per line:
+    'chunk' records (offset, text, ranges) followed by a final 'metadata' record,
+    or an 'error' record if processing fails part-way through.
+    """
+    def generate():
+        text_length = 0
+        ranges_count = 0
+        text_pieces = []
+        try:
+            for record in records:
+                if record['type'] == 'chunk':
+                    text_length += len(record['text'])
+                    text_pieces.append(record['text'])
+                    ranges_count += len(record['ranges'])
+                    yield _ndjson_line(record)
+                    
+                elif record['type'] == 'metadata':
+                    processing_time = time.time() - start_time
+                    credits_error = _consume_docx_credits(filename, file_size, text_length, ranges_count, processing_time)
+                    if credits_error:
+                        yield _ndjson_line({'type': 'error', 'success': False, 'status': 402, **credits_error})
+                        return
+                    
+                    current_app.logger.info(
+                        f'DOCX streamed successfully: {filename} -> '
+                        f'{text_length} chars, {ranges_count} formatting ranges in {record["chunks"]} chunks'
+                    )
+                    
+                    metadata_record = {
+                        'type': 'metadata',
+                        'success': True,
+                        'formatting_data': {
+                            'comments': record['comments'],
+                            'outline': record['outline'],
+                            'version': '1.0',
+                            'source': 'docx_import'
+                        },
+                        'metadata': {
+                            'filename': filename,
+                            'file_size': file_size,
+                            'processing_time': round(processing_time, 2),
+                            'text_length': text_length,
+                            'formatting_ranges_count': ranges_count,
+                            'headings_count': len(record['outline']),
+                            'paragraphs_processed': record['metadata']['total_paragraphs'],
+                            'chunks': record['chunks'],
+                            'processing_notes': record['metadata'].get('processing_notes', [])
+                        }
+                    }
+                    text_ref = _store_docx_text(''.join(text_pieces))
+                    if text_ref:
+                        metadata_record['text_ref'] = text_ref
+                    yield _ndjson_line(metadata_record)
+                    
+        except DocxProcessingLimitError as limit_error:
+            current_app.logger.warning(f'DOCX processing budget exceeded for {filename}: {limit_error}')
+            yield _ndjson_line({
+                'type': 'error',
+                'success': False,
+                'status': 413,
+                'error': 'File too large to process. Please try a smaller document.'
+            })
+        except Exception as processing_error:
+            current_app.logger.error(f'DOCX streaming error: {str(processing_error)}')
+            yield _ndjson_line({
+                'type': 'error',
+                'success': False,
+                'status': 500,
+                'error': 'Failed to process DOCX file. Please ensure it\'s a valid Word document.',
+                'details': str(processing_error) if current_app.debug else None
+            })
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let proxies buffer the stream
+    response.call_on_close(lambda: _remove_temp_file(temp_path))
+    return response
+
+
 @docx_bp.route('/api/upload/docx', methods=['POST'])
 def upload_docx():
     """
     Handle DOCX file upload with formatting extraction and proper auth/credit management
     
     Returns:
-        JSON response with text and formatting data
+        JSON response with text and formatting data, or - with ?stream=ndjson or
+        Accept: application/x-ndjson - newline-delimited JSON chunks of text and
+        ranges followed by a final metadata record
     """
     start_time = time.time()
     
@@ -82,9 +247,10 @@ def upload_docx():
             
             # Check credits (configurable cost for DOCX processing)
             required_credits = current_app.config['CREDIT_COST_DOCX_PROCESSING']
-            # CRITICAL FIX: Always get fresh credits for pre-action checks AND pass auth token
-            current_credits = supabase_service.get_user_credits(user['id'], use_cache=False, auth_token=token)
-            if current_credits < required_credits:
+            # Hold the credits for the duration of the request (committed on success, released otherwise)
+            hold = reserve_request_credits(user['id'], required_credits, 'docx_processed', auth_token=token)
+            has_credits, current_credits = hold['success'], hold['credits']
+            if not has_credits:
                 return jsonify({
                     'error': 'Insufficient credits',
                     'message': f'This action requires {required_credits} credits. You have {current_credits} credits.',
@@ -136,6 +302,7 @@ def upload_docx():
         filename = secure_filename(file.filename)
         
         # Process the file
+        stream_owns_temp_file = False
         with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as temp_file:
             try:
                 # Save uploaded file to temporary location
@@ -144,8 +311,29 @@ def upload_docx():
                 
                 current_app.logger.info(f'Processing DOCX file: {filename} ({file_size} bytes)')
                 
-                # Validate DOCX file before processing
-                validation = docx_service.validate_docx_file(temp_file.name)
+                # Progressive mode: stream NDJSON chunks as paragraphs are extracted
+                if _wants_ndjson_stream():
+                    records = get_docx_process_pool().stream(
+                        'process_with_formatting', temp_file.name, STREAM_CHUNK_PARAGRAPHS
+                    )
+                    validation = next(records)['validation']
+                    if not validation['valid']:
+                        records.close()
+                        return jsonify({
+                            'success': False,
+                            'error': f'Invalid DOCX file: {validation.get("error", "Unknown error")}',
+                            'error_type': validation.get('error_type', 'ValidationError')
+                        }), 400
+                    
+                    response = _build_ndjson_response(records, temp_file.name, filename, file_size, start_time)
+                    stream_owns_temp_file = True  # Removed when the response is closed
+                    return response
+                
+                # Validate and extract text content WITH formatting in an isolated worker process
+                # (keeps CPU-bound parsing off the request threads and enforces CPU/memory/time budgets)
+                processed = get_docx_process_pool().run('process_with_formatting', temp_file.name)
+                
+                validation = processed['validation']
                 if not validation['valid']:
                     return jsonify({
                         'success': False,
@@ -153,12 +341,8 @@ def upload_docx():
                         'error_type': validation.get('error_type', 'ValidationError')
                     }), 400
                 
-                # Get processing information
-                processing_info = docx_service.get_processing_info(temp_file.name)
-                current_app.logger.info(f'DOCX processing info: {processing_info}')
-                
-                # Extract text content WITH formatting
-                result = docx_service.extract_content_with_formatting(temp_file.name)
+                current_app.logger.info(f'DOCX validation info: {validation}')
+                result = processed['result']
                 
                 # Debug logging to understand what's being processed
                 current_app.logger.info(f'DOCX text length: {len(result["text"])}')
@@ -177,6 +361,7 @@ def upload_docx():
                     'formatting_data': {
                         'ranges': result['formatting_ranges'],
                         'comments': result['comments'],
+                        'outline': result['outline'],
                         'version': '1.0',
                         'source': 'docx_import'
                     },
@@ -186,43 +371,22 @@ def upload_docx():
                         'processing_time': round(processing_time, 2),
                         'text_length': len(result['text']),
                         'formatting_ranges_count': len(result['formatting_ranges']),
+                        'headings_count': len(result['outline']),
                         'paragraphs_processed': result['metadata']['total_paragraphs'],
                         'processing_notes': result['metadata'].get('processing_notes', [])
                     }
                 }
                 
                 # Consume credits and log successful processing (only in normal mode)
-                if not current_app.config.get('TESTING_MODE'):
-                    supabase_service = get_supabase_service()
-                    if supabase_service and supabase_service.is_configured():
-                        try:
-                            # Get current user from auth middleware
-                            from flask import g
-                            user_id = getattr(g, 'user_id', None)
-                            credits_to_consume = current_app.config['CREDIT_COST_DOCX_PROCESSING']
-                            if user_id:
-                                # Deduct credits for DOCX processing
-                                credit_success = supabase_service.update_user_credits(user_id, -credits_to_consume)
-                                if not credit_success:
-                                    current_app.logger.warning('Failed to deduct credits for DOCX processing')
-                                
-                                # Log usage
-                                supabase_service.log_usage(
-                                    user_id,
-                                    'docx_processed',
-                                    credits_used=credits_to_consume,
-                                metadata={
-                                    'filename': filename,
-                                    'file_size': file_size,
-                                    'text_length': len(result['text']),
-                                    'formatting_ranges': len(result['formatting_ranges']),
-                                    'processing_time': processing_time
-                                }
-                            )
-                        except Exception as log_error:
-                            current_app.logger.warning(f'Failed to log usage: {log_error}')
-                else:
-                    current_app.logger.info('✅ Testing mode - Skipping credit deduction and usage logging')
+                credits_error = _consume_docx_credits(filename, file_size, len(result['text']),
+                                                      len(result['formatting_ranges']), processing_time)
+                if credits_error:
+                    return jsonify(credits_error), 402
+                
+                # Keep the text in the book text store, indexed for search
+                text_ref = _store_docx_text(result['text'])
+                if text_ref:
+                    response_data['text_ref'] = text_ref
                 
                 current_app.logger.info(
                     f'DOCX processed successfully: {filename} -> '
@@ -231,6 +395,14 @@ def upload_docx():
                 
                 return jsonify(response_data), 200
                 
+            except DocxProcessingLimitError as limit_error:
+                # Oversized or pathological document - worker was stopped at its budget
+                current_app.logger.warning(f'DOCX processing budget exceeded for {filename}: {limit_error}')
+                return jsonify({
+                    'success': False,
+                    'error': 'File too large to process. Please try a smaller document.'
+                }), 413
+                
             except Exception as processing_error:
                 current_app.logger.error(f'DOCX processing error: {str(processing_error)}')
                 
@@ -259,12 +431,9 @@ def upload_docx():
                     }), 500
                     
             finally:
-                # Clean up temporary file
-                try:
-                    if os.path.exists(temp_file.name):
-                        os.unlink(temp_file.name)
-                except Exception as cleanup_error:
-                    current_app.logger.warning(f'Failed to cleanup temp file: {cleanup_error}')
+                # Clean up temporary file (streamed responses clean up when they close)
+                if not stream_owns_temp_file:
+                    _remove_temp_file(temp_file.name)
     
     except Exception as e:
         current_app.logger.error(f'Unexpected error in DOCX upload: {str(e)}')
@@ -315,43 +484,30 @@ def validate_docx():
                 'error': f'File too large. Maximum size is {MAX_DOCX_SIZE // (1024*1024)}MB'
             }), 400
         
-        # Quick validation
-        with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as temp_file:
-            try:
-                file.save(temp_file.name)
-                temp_file.flush()
-                
-                # Get processing information
-                processing_info = docx_service.get_processing_info(temp_file.name)
-                
-                if not processing_info['valid']:
-                    return jsonify({
-                        'success': False,
-                        'error': f'Invalid DOCX file: {processing_info.get("error", "Unknown error")}'
-                    }), 400
-                
-                return jsonify({
-                    'success': True,
-                    'validation': processing_info,
-                    'file_info': {
-                        'filename': secure_filename(file.filename),
-                        'size': file_size,
-                        'size_human': f'{file_size / (1024*1024):.1f}MB' if file_size > 1024*1024 else f'{file_size / 1024:.1f}KB'
-                    },
-                    'processing_estimate': {
-                        'time': processing_info.get('estimated_processing_time', 'Unknown'),
-                        'complexity': processing_info.get('estimated_size', 'Unknown'),
-                        'credits_required': 5
-                    }
-                }), 200
-                
-            finally:
-                # Clean up
-                try:
-                    if os.path.exists(temp_file.name):
-                        os.unlink(temp_file.name)
-                except Exception:
-                    pass
+        # Quick validation straight from the upload stream: only the zip
+        # directory and a bounded sample of document.xml are read
+        processing_info = docx_service.inspect_docx_archive(file.stream)
+        
+        if not processing_info['valid']:
+            return jsonify({
+                'success': False,
+                'error': f'Invalid DOCX file: {processing_info.get("error", "Unknown error")}'
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'validation': processing_info,
+            'file_info': {
+                'filename': secure_filename(file.filename),
+                'size': file_size,
+                'size_human': f'{file_size / (1024*1024):.1f}MB' if file_size > 1024*1024 else f'{file_size / 1024:.1f}KB'
+            },
+            'processing_estimate': {
+                'time': processing_info.get('estimated_processing_time', 'Unknown'),
+                'complexity': processing_info.get('estimated_size', 'Unknown'),
+                'credits_required': 5
+            }
+        }), 200
     
     except Exception as e:
         current_app.logger.error(f'DOCX validation error: {str(e)}')
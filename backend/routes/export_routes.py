@@ -3,6 +3,7 @@ import os
 from ..services.export_service import ExportService
 from ..routes.password_protection import require_temp_auth
 from ..middleware.auth_middleware import require_auth, require_credits, consume_credits
+from ..middleware.credit_holds import reserve_request_credits, commit_request_credits
 
 def create_export_routes(app, upload_folder, export_folder):
     """
@@ -75,12 +76,11 @@ def create_export_routes(app, upload_folder, export_folder):
             # Check credits for normal mode
             if not current_app.config.get('TESTING_MODE') and credit_cost > 0:
                 from flask import g
-                from ..services.supabase_service import get_supabase_service
                 
-                supabase_service = get_supabase_service()
-                # CRITICAL FIX: Always get fresh credits for pre-action checks AND pass auth token
-                current_credits = supabase_service.get_user_credits(g.user_id, use_cache=False, auth_token=token)
-                if current_credits < credit_cost:
+                # Hold the credits for the duration of the export (committed on success, released otherwise)
+                hold = reserve_request_credits(g.user_id, credit_cost, export_type.replace(' ', '_'), auth_token=token)
+                has_credits, current_credits = hold['success'], hold['credits']
+                if not has_credits:
                     return jsonify({
                         'error': 'Insufficient credits',
                         'message': f'This action requires {credit_cost} credits. You have {current_credits} credits.',
@@ -99,25 +99,25 @@ def create_export_routes(app, upload_folder, export_folder):
             # Consume credits after successful export (normal mode only)
             if not current_app.config.get('TESTING_MODE') and credit_cost > 0:
                 from flask import g
-                from ..services.supabase_service import get_supabase_service
                 
-                supabase_service = get_supabase_service()
-                success = supabase_service.update_user_credits(g.user_id, -credit_cost)
-                if success:
-                    # Cache is now automatically cleared in update_user_credits()
-                    supabase_service.log_usage(
-                        g.user_id, 
-                        export_type.replace(' ', '_'), 
-                        credit_cost,
-                        {
-                            'endpoint': request.endpoint, 
-                            'method': request.method,
-                            'export_audio': export_audio,
-                            'merge_audio': merge_audio,
-                            'export_metadata': export_metadata,
-                            'export_book_content': export_book_content
-                        }
-                    )
+                # Debit the held credits and log the usage in one atomic call
+                debit = commit_request_credits({
+                    'endpoint': request.endpoint, 
+                    'method': request.method,
+                    'export_audio': export_audio,
+                    'merge_audio': merge_audio,
+                    'export_metadata': export_metadata,
+                    'export_book_content': export_book_content
+                })
+                if debit['insufficient']:
+                    # The hold expired and its credits were spent by another request
+                    return jsonify({
+                        'error': 'Insufficient credits',
+                        'message': f'This action requires {credit_cost} credits. You have {debit["credits"]} credits.',
+                        'current_credits': debit['credits'],
+                        'required_credits': credit_cost
+                    }), 402
+                if debit['success']:
                     app.logger.info(f"✅ Consumed {credit_cost} credits for {export_type} by user {g.user_id}")
                 else:
                     app.logger.warning(f"⚠️ Failed to consume credits for user {g.user_id}")
@@ -0,0 +1,82 @@
+"""
+Formatting Routes - server-rendered HTML segments for large books
+The client posts text + formatting ranges once, then fetches segments lazily by content hash
+"""
+
+import logging
+from flask import Blueprint, request, jsonify
+from backend.middleware.auth_middleware import require_auth
+from backend.services.formatting_render_service import get_formatting_render_service
+
+logger = logging.getLogger(__name__)
+
+# Create blueprint for formatting render routes
+formatting_bp = Blueprint('formatting', __name__)
+
+# Segments are content-addressed, so a cached copy never goes stale
+SEGMENT_CACHE_CONTROL = 'private, max-age=86400, immutable'
+
+
+@formatting_bp.route('/render', methods=['POST'])
+@require_auth
+def render_formatting(current_user):
+    """
+    Render book text and formatting ranges into cached HTML segments
+
+    Expected JSON payload:
+    {
+        "text": "...",
+        "ranges": [{"start": 0, "end": 10, "type": "bold"}, ...]
+    }
+
+    Returns the segment manifest (content_hash plus start/end of every segment).
+    Segment HTML is fetched from /render/<content_hash>/<index>.
+    """
+    try:
+        payload = request.get_json(silent=True)
+
+        if not payload or not isinstance(payload.get('text'), str):
+            return jsonify({'error': 'Missing text in render request'}), 400
+
+        ranges = payload.get('ranges', [])
+        if not isinstance(ranges, list):
+            return jsonify({'error': 'ranges must be a list'}), 400
+
+        manifest = get_formatting_render_service().render(payload['text'], ranges)
+
+        return jsonify({
+            'success': True,
+            **manifest
+        })
+
+    except Exception as e:
+        logger.error(f"❌ Error rendering formatting for user {current_user.get('id', 'unknown')}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@formatting_bp.route('/render/<content_hash>/<int:index>', methods=['GET'])
+@require_auth
+def get_render_segment(current_user, content_hash, index):
+    """
+    Get one pre-rendered HTML segment
+
+    Returns 404 when the segment is not cached (never rendered or pruned);
+    the client then posts the text again to /render.
+    """
+    try:
+        segment = get_formatting_render_service().get_segment(content_hash, index)
+
+        if segment is None:
+            return jsonify({'success': False, 'error': 'Segment not found'}), 404
+
+        response = jsonify({
+            'success': True,
+            'content_hash': content_hash,
+            **segment
+        })
+        response.headers['Cache-Control'] = SEGMENT_CACHE_CONTROL
+        return response
+
+    except Exception as e:
+        logger.error(f"❌ Error loading render segment for user {current_user.get('id', 'unknown')}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
@@ -4,15 +4,59 @@ Handles automatic saving and loading of user projects to/from database
 """
 
 import logging
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response
 from backend.middleware.auth_middleware import require_auth
 from backend.services.supabase_service import get_supabase_service
+from backend.services.project_service import (
+    get_project_service, ProjectNotFoundError, ProjectVersionConflict, ProjectPreconditionFailed,
+    StaleProjectWrite
+)
+from backend.services.book_text_service import get_book_text_service
+from backend.services.book_text_index_service import get_book_text_index_service
+from backend.utils.json_patch import JsonPatchError
+from backend.utils.project_parts import parse_parts_param
 
 logger = logging.getLogger(__name__)
 
 # Create blueprint for project routes
 project_bp = Blueprint('projects', __name__)
 
+# Browsers may keep the latest project but must revalidate it (If-None-Match) before reuse
+LATEST_PROJECT_CACHE_CONTROL = 'private, no-cache'
+
+class _UnknownTextRef(Exception):
+    """A project would be stored without a loadable book text"""
+    pass
+
+def _unknown_text_ref_response():
+    return jsonify({
+        'success': False,
+        'error': 'Referenced book text is not stored',
+        'code': 'unknown_text_ref'
+    }), 422
+
+def _check_text_ref(client, user_id, project_data):
+    """Raise _UnknownTextRef unless the project embeds its text or references a stored one"""
+    if 'bookText' in project_data:
+        return
+    text_ref = project_data.get('bookTextRef')
+    text_hash = text_ref.get('hash') if isinstance(text_ref, dict) else None
+    if not isinstance(text_hash, str) or \
+            get_book_text_service().get_manifest(client, user_id, text_hash) is None:
+        raise _UnknownTextRef()
+
+def _get_project_client():
+    """
+    Get a Supabase client authenticated with the user's token for RLS (this request only)
+    Returns None when the database service is not available
+    """
+    supabase = get_supabase_service()
+    if not supabase or not supabase.is_configured():
+        return None
+    
+    from ..middleware.auth_middleware import extract_token_from_header
+    return supabase.client_for(extract_token_from_header())
+
 @project_bp.route('/save', methods=['POST'])
 @require_auth
 def save_project(current_user):
@@ -28,6 +72,14 @@ def save_project(current_user):
         "formattingData": {...},
         "projectMetadata": {...}
     }
+    
+    Instead of bookText the project may carry "bookTextRef": {"hash": ..., ...}
+    naming a text in the book text store (see text_routes); an unknown hash is
+    rejected with 422 and the client should resend the text.
+    
+    An If-Match header with the hash of the last known project makes the save
+    conditional (412 if the stored project changed). Saves whose content matches
+    the stored hash are no-ops and report "unchanged": true.
     """
     try:
         project_data = request.get_json()
@@ -36,74 +88,136 @@ def save_project(current_user):
             return jsonify({'error': 'No project data provided'}), 400
         
         # Validate required fields
-        if 'bookText' not in project_data:
+        text_ref = project_data.get('bookTextRef')
+        if 'bookText' not in project_data and not isinstance(text_ref, dict):
             return jsonify({'error': 'Missing bookText in project data'}), 400
         
-        # Get Supabase service
-        supabase = get_supabase_service()
-        if not supabase or not supabase.is_configured():
+        client = _get_project_client()
+        if client is None:
             return jsonify({'error': 'Database service not available'}), 503
         
-        # FIX: Authenticate the postgrest client with user's token for RLS
-        from ..middleware.auth_middleware import extract_token_from_header
-        token = extract_token_from_header()
-        if token and hasattr(supabase.client, 'postgrest'):
-            supabase.client.postgrest.auth(token)
-        
-        # Generate project title from bookText (first 50 characters or default)
-        book_text = project_data.get('bookText', '')
-        project_title = 'Auto-saved Project'
-        if book_text and len(book_text.strip()) > 0:
-            # Use first line or first 50 characters as title
-            first_line = book_text.split('\n')[0].strip()
-            if first_line:
-                project_title = first_line[:50] + ('...' if len(first_line) > 50 else '')
-        
-        # Prepare data for database storage
-        project_record = {
-            'user_id': current_user['id'],
-            'title': project_title,
-            'description': f'Auto-saved project ({len(project_data.get("chapters", []))} chapters)',
-            'status': 'draft',
-            'settings': project_data,  # Store complete project data in settings field
-            'chapters': project_data.get('chapters', [])  # Also store in dedicated field for queries
-        }
+        try:
+            _check_text_ref(client, current_user['id'], project_data)
+        except _UnknownTextRef:
+            return _unknown_text_ref_response()
         
-        # Check if user already has a project
-        existing_result = supabase.client.table('audiobook_projects')\
-            .select('id')\
-            .eq('user_id', current_user['id'])\
-            .execute()
+        saved = get_project_service().save_project(
+            client, current_user['id'], project_data,
+            if_match=request.if_match if request.if_match else None
+        )
         
-        if existing_result.data and len(existing_result.data) > 0:
-            # Update existing project
-            project_id = existing_result.data[0]['id']
-            project_record['id'] = project_id
-            result = supabase.client.table('audiobook_projects')\
-                .update(project_record)\
-                .eq('id', project_id)\
-                .execute()
+        if saved['unchanged']:
+            logger.info(f"⏭️ Project unchanged for user {current_user['id']}, skipped write")
         else:
-            # Insert new project
-            result = supabase.client.table('audiobook_projects')\
-                .insert(project_record)\
-                .execute()
-        
-        if result.data:
-            logger.info(f"✅ Project auto-saved for user {current_user['id']}")
-            return jsonify({
-                'success': True,
-                'message': 'Project saved successfully',
-                'project_id': result.data[0]['id'] if result.data else None
-            })
-        else:
-            logger.error(f"❌ Failed to save project for user {current_user['id']}: No data returned")
-            return jsonify({'error': 'Failed to save project'}), 500
-            
+            logger.info(f"✅ Project auto-saved for user {current_user['id']} (version {saved['version']})")
+        return _saved_project_response(saved)
+        
+    except ProjectPreconditionFailed as failed:
+        logger.info(f"⚠️ Conditional project save rejected for user {current_user['id']}")
+        response = make_response(jsonify({
+            'success': False,
+            'error': 'Project has been modified since it was last loaded',
+            'current_version': failed.current_version
+        }), 412)
+        if failed.content_hash:
+            response.set_etag(failed.content_hash)
+        return response
+    except StaleProjectWrite as stale:
+        logger.info(f"⚠️ Out-of-order project save rejected for user {current_user['id']}")
+        response = make_response(jsonify({
+            'success': False,
+            'error': 'A newer save of this project is already pending',
+            'current_version': stale.current_version
+        }), 409)
+        if stale.content_hash:
+            response.set_etag(stale.content_hash)
+        return response
     except Exception as e:
         logger.error(f"❌ Error saving project for user {current_user.get('id', 'unknown')}: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@project_bp.route('/save/delta', methods=['POST'])
+@require_auth
+def save_project_delta(current_user):
+    """
+    Apply an incremental update to the stored project
+    
+    Expected JSON payload:
+    {
+        "base_version": 12,
+        "operations": [
+            {"op": "replace", "path": "/chapters/0/name", "value": "Intro"},
+            {"op": "add", "path": "/highlights/-", "value": {...}}
+        ]
+    }
+    
+    Returns 409 with current_version when base_version is stale; the client
+    should then fall back to a full save. A patch leaving the project without
+    bookText or a stored bookTextRef is rejected with 422 (unknown_text_ref).
+    """
+    try:
+        payload = request.get_json()
+        
+        if not payload:
+            return jsonify({'error': 'No delta provided'}), 400
+        
+        base_version = payload.get('base_version')
+        operations = payload.get('operations')
+        if not isinstance(base_version, int) or isinstance(base_version, bool):
+            return jsonify({'error': 'Missing or invalid base_version'}), 400
+        if not isinstance(operations, list):
+            return jsonify({'error': 'Missing or invalid operations'}), 400
+        
+        client = _get_project_client()
+        if client is None:
+            return jsonify({'error': 'Database service not available'}), 503
+        
+        saved = get_project_service().apply_project_delta(
+            client, current_user['id'], base_version, operations,
+            validate=lambda project_data: _check_text_ref(client, current_user['id'], project_data)
+        )
+        
+        logger.info(f"✅ Project delta ({len(operations)} ops) saved for user {current_user['id']} (version {saved['version']})")
+        return _saved_project_response(saved)
+        
+    except ProjectVersionConflict as conflict:
+        logger.info(f"⚠️ Stale project delta for user {current_user['id']}: now at version {conflict.current_version}")
+        return jsonify({
+            'success': False,
+            'error': 'Project has been modified since base_version',
+            'current_version': conflict.current_version
+        }), 409
+    except ProjectNotFoundError:
+        return jsonify({'success': False, 'error': 'No saved project to update'}), 404
+    except _UnknownTextRef:
+        return _unknown_text_ref_response()
+    except JsonPatchError as patch_error:
+        return jsonify({'success': False, 'error': f'Invalid patch: {patch_error}'}), 400
+    except Exception as e:
+        logger.error(f"❌ Error saving project delta for user {current_user.get('id', 'unknown')}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def _saved_project_response(saved):
+    """JSON response for a completed save, carrying the new hash as ETag"""
+    response = jsonify({
+        'success': True,
+        'message': 'Project unchanged' if saved['unchanged'] else 'Project saved successfully',
+        'project_id': saved['id'],
+        'version': saved['version'],
+        'content_hash': saved['content_hash'],
+        'unchanged': saved['unchanged'],
+        'written_parts': saved.get('written_parts'),
+        'buffered': saved.get('buffered', False)
+    })
+    response.set_etag(saved['content_hash'])
+    return response
+
+def _not_modified_response(content_hash):
+    response = make_response('', 304)
+    response.set_etag(content_hash)
+    response.headers['Cache-Control'] = LATEST_PROJECT_CACHE_CONTROL
+    return response
+
 @project_bp.route('/latest', methods=['GET'])
 @require_auth
 def get_latest_project(current_user):
@@ -111,50 +225,71 @@ def get_latest_project(current_user):
     Get user's latest project from database
     
     Returns the complete project data structure that can be loaded
-    using existing loadProjectDirectly() function
+    using existing loadProjectDirectly() function. The response carries the
+    project hash as ETag; a matching If-None-Match gets 304 without the
+    project blob being read.
+    
+    Query parameters:
+        parts: Optional comma-separated subset of text, structure, annotations;
+               only the fields of those parts are returned (e.g. ?parts=structure
+               skips the book text)
     """
     try:
+        try:
+            parts = parse_parts_param(request.args.get('parts'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         logger.info(f"🔍 Getting latest project for user: {current_user}")
         
-        # Get Supabase service
-        supabase = get_supabase_service()
-        if not supabase or not supabase.is_configured():
+        client = _get_project_client()
+        if client is None:
             logger.error("❌ Supabase service not configured or not available")
             return jsonify({'error': 'Database service not available'}), 503
         
-        # FIX: Authenticate the postgrest client with user's token for RLS
-        from ..middleware.auth_middleware import extract_token_from_header
-        token = extract_token_from_header()
-        if token and hasattr(supabase.client, 'postgrest'):
-            supabase.client.postgrest.auth(token)
+        project_service = get_project_service()
+        
+        # Cheap hash-only lookup first when the client already holds a copy
+        if request.if_none_match:
+            stored_hash = project_service.get_latest_project_hash(client, current_user['id'])
+            if stored_hash and request.if_none_match.contains_weak(stored_hash):
+                logger.info(f"✅ Latest project not modified for user {current_user['id']}")
+                return _not_modified_response(stored_hash)
         
         # Query for user's latest project
-        result = supabase.client.table('audiobook_projects')\
-            .select('id, title, settings, updated_at')\
-            .eq('user_id', current_user['id'])\
-            .order('updated_at', desc=True)\
-            .limit(1)\
-            .execute()
+        project = project_service.get_latest_project(client, current_user['id'], parts=parts)
         
-        if result.data and len(result.data) > 0:
-            project = result.data[0]
+        if project:
             project_data = project.get('settings', {})
             
-            # Validate that we have meaningful project data
-            if project_data and (
+            # Validate that we have meaningful project data (partial loads are returned as stored)
+            if parts or (project_data and (
                 project_data.get('bookText', '').strip() or 
+                project_data.get('bookTextRef') or
                 len(project_data.get('chapters', [])) > 0
-            ):
+            )):
+                # Rows saved before content hashes existed get theirs computed on the fly
+                content_hash = project.get('content_hash') or project_service.compute_content_hash(project_data)
+                if request.if_none_match.contains_weak(content_hash):
+                    return _not_modified_response(content_hash)
+                
                 logger.info(f"✅ Latest project retrieved for user {current_user['id']}")
-                return jsonify({
+                response = jsonify({
                     'success': True,
                     'project': project_data,
                     'metadata': {
                         'id': project['id'],
                         'title': project['title'],
-                        'updated_at': project['updated_at']
+                        'version': project.get('version'),
+                        'content_hash': content_hash,
+                        'updated_at': project['updated_at'],
+                        'parts': project.get('parts'),
+                        'requested_parts': parts
                     }
                 })
+                response.set_etag(content_hash)
+                response.headers['Cache-Control'] = LATEST_PROJECT_CACHE_CONTROL
+                return response
             else:
                 # Project exists but has no meaningful content
                 logger.info(f"📭 Empty project found for user {current_user['id']}")
@@ -168,6 +303,94 @@ def get_latest_project(current_user):
         logger.error(f"❌ Error retrieving latest project for user {current_user.get('id', 'unknown')}: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def _project_text(client, user_id):
+    """
+    (manifest, contents) of the book text of the user's latest project, or None without a project
+
+    contents is None for a stored text (bookTextRef). A text still embedded in the
+    project (bookText) is only split into chunks in memory, contents maps their
+    hashes to their text, and nothing is written. The hash of a stored text is
+    remembered per project hash, so repeated searches only look up the project hash.
+    """
+    project_service = get_project_service()
+    index_service = get_book_text_index_service()
+    text_service = get_book_text_service()
+    
+    project_hash = project_service.get_latest_project_hash(client, user_id)
+    text_hash = index_service.get_project_text_hash(user_id, project_hash)
+    if text_hash:
+        manifest = text_service.get_manifest(client, user_id, text_hash)
+        if manifest is not None:
+            return manifest, None
+    
+    project = project_service.get_latest_project(client, user_id, parts=['text'])
+    if not project:
+        return None
+    project_data = project.get('settings') or {}
+    text_ref = project_data.get('bookTextRef')
+    if not (isinstance(text_ref, dict) and isinstance(text_ref.get('hash'), str)):
+        # Searching must not write; embedded texts move to the store when the client saves a ref
+        manifest, rows = text_service.build_manifest(project_data.get('bookText') or '')
+        return manifest, {row['chunk_hash']: row['content'] for row in rows}
+    manifest = text_service.get_manifest(client, user_id, text_ref['hash'])
+    if manifest is None:
+        return None
+    index_service.remember_project_text(user_id, project.get('content_hash'), manifest['text_hash'])
+    return manifest, None
+
+@project_bp.route('/search', methods=['GET'])
+@require_auth
+def search_project(current_user):
+    """
+    Full-text search in the book text of the user's latest project
+    
+    Query parameters:
+        q:        Search text; words are matched case- and accent-insensitively
+        mode:     'all' (default) - all words close together, exact phrases first;
+                  'phrase' - the words in order, adjacent
+        page:     1-based page of ranked matches (default 1)
+        per_page: Matches per page (default 20, at most 100)
+    
+    Each match carries its character offset and length in the book text and a
+    snippet around it. Texts not indexed yet are indexed on the first search.
+    """
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query (q)'}), 400
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 20))
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    
+    try:
+        client = _get_project_client()
+        if client is None:
+            return jsonify({'error': 'Database service not available'}), 503
+        
+        user_id = current_user['id']
+        project_text = _project_text(client, user_id)
+        if project_text is None:
+            return jsonify({'success': False, 'message': 'No project text to search'}), 404
+        manifest, contents = project_text
+        
+        index_service = get_book_text_index_service()
+        if contents is None:
+            index_service.index_text(client, user_id, manifest)
+        try:
+            result = index_service.search(
+                client, user_id, manifest, query,
+                mode=request.args.get('mode', 'all'), page=page, per_page=per_page, contents=contents
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({'success': True, 'text_hash': manifest['text_hash'], **result})
+        
+    except Exception as e:
+        logger.error(f"❌ Error searching project for user {current_user.get('id', 'unknown')}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @project_bp.route('/status', methods=['GET'])
 @require_auth
 def get_project_status(current_user):
@@ -185,7 +408,7 @@ def get_project_status(current_user):
         logger.info(f"✅ Supabase service is configured, checking projects for user: {current_user['id']}")
         
         # Get count of user's projects
-        result = supabase.client.table('audiobook_projects')\
+        result = _get_project_client().table('audiobook_projects')\
             .select('id, title, updated_at', count='exact')\
             .eq('user_id', current_user['id'])\
             .execute()
@@ -198,6 +421,7 @@ def get_project_status(current_user):
             'user_email': current_user.get('email', 'unknown'),
             'project_count': len(result.data) if result.data else 0,
             'projects': result.data if result.data else [],
+            'storage_stats': get_project_service().get_stats(),
             'supabase_configured': True
         })
         
@@ -0,0 +1,149 @@
+"""
+Book Text Routes - API endpoints for the server-side book text store
+Stores imported text once and serves it in character, line or paragraph ranges
+"""
+
+import logging
+import re
+from flask import Blueprint, request, jsonify
+from backend.middleware.auth_middleware import require_auth
+from backend.services.supabase_service import get_supabase_service
+from backend.services.book_text_service import get_book_text_service, BookTextNotFound
+from backend.services.book_text_index_service import store_and_index_text
+
+logger = logging.getLogger(__name__)
+
+# Create blueprint for book text routes
+text_bp = Blueprint('texts', __name__)
+
+TEXT_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Stored texts never change, so any range of one can be cached indefinitely
+TEXT_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+def _get_text_client():
+    """
+    Get a Supabase client authenticated with the user's token for RLS (this request only)
+    Returns None when the database service is not available
+    """
+    supabase = get_supabase_service()
+    if not supabase or not supabase.is_configured():
+        return None
+
+    from ..middleware.auth_middleware import extract_token_from_header
+    return supabase.client_for(extract_token_from_header())
+
+def _int_arg(name, default=None, minimum=0):
+    """Parse a non-negative integer query parameter; raises ValueError when invalid"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        if default is None:
+            raise ValueError(f'Missing {name}')
+        return default
+    parsed = int(value)
+    if parsed < minimum:
+        raise ValueError(f'{name} must be at least {minimum}')
+    return parsed
+
+@text_bp.route('', methods=['POST'])
+@require_auth
+def store_text(current_user):
+    """
+    Store a book text, index it for search and return its reference
+
+    Expected JSON payload: {"text": "..."}
+    Storing the same text again returns the existing reference. An edited text
+    shares most chunks with the original, so only the changed ones are indexed.
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        text = payload.get('text')
+        if not isinstance(text, str) or not text:
+            return jsonify({'error': 'Missing text'}), 400
+
+        client = _get_text_client()
+        if client is None:
+            return jsonify({'error': 'Database service not available'}), 503
+
+        return jsonify({'success': True, 'text_ref': store_and_index_text(client, current_user['id'], text)})
+
+    except Exception as e:
+        logger.error(f"❌ Error storing book text for user {current_user.get('id', 'unknown')}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@text_bp.route('/<text_hash>', methods=['GET'])
+@require_auth
+def get_text_info(current_user, text_hash):
+    """Get length, line/paragraph counts and title of a stored text"""
+    if not TEXT_HASH_PATTERN.match(text_hash):
+        return jsonify({'error': 'Invalid text hash'}), 400
+
+    try:
+        client = _get_text_client()
+        if client is None:
+            return jsonify({'error': 'Database service not available'}), 503
+
+        text_service = get_book_text_service()
+        manifest = text_service.get_manifest(client, current_user['id'], text_hash)
+        if manifest is None:
+            return jsonify({'success': False, 'error': 'Text not found'}), 404
+
+        response = jsonify({'success': True, 'text_ref': text_service.describe(manifest)})
+        response.headers['Cache-Control'] = TEXT_CACHE_CONTROL
+        return response
+
+    except Exception as e:
+        logger.error(f"❌ Error reading book text {text_hash[:12]} for user {current_user.get('id', 'unknown')}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@text_bp.route('/<text_hash>/range', methods=['GET'])
+@require_auth
+def get_text_range(current_user, text_hash):
+    """
+    Get part of a stored text
+
+    Query parameters (one form per request):
+        offset, length:   characters [offset, offset + length)
+        line, count:      lines [line, line + count), line breaks included
+        paragraph, count: paragraphs [paragraph, paragraph + count), each with the
+                          blank lines that follow it
+
+    Ranges are clamped to the text and to BOOK_TEXT_MAX_RANGE_CHARS; the response
+    carries the offset and length actually returned, so callers page by
+    continuing from offset + length.
+    """
+    if not TEXT_HASH_PATTERN.match(text_hash):
+        return jsonify({'error': 'Invalid text hash'}), 400
+
+    try:
+        client = _get_text_client()
+        if client is None:
+            return jsonify({'error': 'Database service not available'}), 503
+
+        text_service = get_book_text_service()
+        user_id = current_user['id']
+        try:
+            if 'paragraph' in request.args:
+                result = text_service.read_paragraphs(
+                    client, user_id, text_hash, _int_arg('paragraph'), _int_arg('count', 1, minimum=1)
+                )
+            elif 'line' in request.args:
+                result = text_service.read_lines(
+                    client, user_id, text_hash, _int_arg('line'), _int_arg('count', 1, minimum=1)
+                )
+            else:
+                result = text_service.read_range(
+                    client, user_id, text_hash, _int_arg('offset', 0), _int_arg('length', text_service.max_range_chars)
+                )
+        except ValueError as e:
+            return jsonify({'error': f'Invalid range: {e}'}), 400
+
+        response = jsonify({'success': True, **result})
+        response.headers['Cache-Control'] = TEXT_CACHE_CONTROL
+        return response
+
+    except BookTextNotFound:
+        return jsonify({'success': False, 'error': 'Text not found'}), 404
+    except Exception as e:
+        logger.error(f"❌ Error reading book text {text_hash[:12]} for user {current_user.get('id', 'unknown')}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
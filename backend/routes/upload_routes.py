@@ -3,6 +3,8 @@ import os
 from ..services.audio_service import AudioService
 from ..routes.password_protection import require_temp_auth
 from ..middleware.auth_middleware import require_auth, require_credits, consume_credits
+from ..middleware.credit_holds import reserve_request_credits, commit_request_credits
+from ..utils.text_decoding import TextStreamDecoder, TextDecodeError
 
 def create_upload_routes(app, upload_folder):
     """
@@ -72,10 +74,11 @@ def create_upload_routes(app, upload_folder):
             
             # Check credits (configurable cost for audio upload)
             required_credits = current_app.config['CREDIT_COST_AUDIO_UPLOAD']
-            # CRITICAL FIX: Always get fresh credits for pre-action checks AND pass auth token
-            current_credits = supabase_service.get_user_credits(user['id'], use_cache=False, auth_token=token)
+            # Hold the credits for the duration of the request (committed on success, released otherwise)
+            hold = reserve_request_credits(user['id'], required_credits, 'audio_upload', auth_token=token)
+            has_credits, current_credits = hold['success'], hold['credits']
             app.logger.info(f"Credit check - User: {user['id']}, Current: {current_credits}, Required: {required_credits}")
-            if current_credits < required_credits:
+            if not has_credits:
                 return jsonify({
                     'error': 'Insufficient credits',
                     'message': f'This action requires {required_credits} credits. You have {current_credits} credits.',
@@ -151,18 +154,19 @@ def create_upload_routes(app, upload_folder):
             # Consume credits after successful upload (normal mode only)
             if not current_app.config.get('TESTING_MODE'):
                 from flask import g
-                from ..services.supabase_service import get_supabase_service
                 
                 credits_to_consume = current_app.config['CREDIT_COST_AUDIO_UPLOAD']
-                supabase_service = get_supabase_service()
-                success = supabase_service.update_user_credits(g.user_id, -credits_to_consume)
-                if success:
-                    supabase_service.log_usage(
-                        g.user_id, 
-                        'audio_upload', 
-                        credits_to_consume,
-                        {'endpoint': request.endpoint, 'method': request.method, 'filename': file.filename}
-                    )
+                # Debit the held credits and log the usage in one atomic call
+                debit = commit_request_credits({'endpoint': request.endpoint, 'method': request.method, 'filename': file.filename})
+                if debit['insufficient']:
+                    # The hold expired and its credits were spent by another request
+                    return jsonify({
+                        'error': 'Insufficient credits',
+                        'message': f'This action requires {credits_to_consume} credits. You have {debit["credits"]} credits.',
+                        'current_credits': debit['credits'],
+                        'required_credits': credits_to_consume
+                    }), 402
+                if debit['success']:
                     app.logger.info(f"✅ Consumed {credits_to_consume} credits for audio_upload by user {g.user_id}")
                 else:
                     app.logger.warning(f"⚠️ Failed to consume credits for user {g.user_id}")
@@ -181,6 +185,19 @@ def create_upload_routes(app, upload_folder):
                 'error': str(e)
             }), 500 
 
+    def _store_book_text(supabase_service, token, user_id, text_content):
+        """Store and index uploaded text in the book text store; returns its reference or None"""
+        if not supabase_service.is_configured():
+            return None
+        try:
+            from ..services.book_text_index_service import store_and_index_text
+            client = supabase_service.client_for(token)
+            return store_and_index_text(client, user_id, text_content)
+        except Exception as e:
+            # The upload still succeeds with the text inline
+            app.logger.warning(f'⚠️ Could not store uploaded text in the book text store: {e}')
+            return None
+    
     @app.route('/api/upload/txt', methods=['POST', 'OPTIONS'])
     def upload_txt():
         """
@@ -233,9 +250,10 @@ def create_upload_routes(app, upload_folder):
             
             # Check credits (configurable cost for text upload)
             required_credits = current_app.config['CREDIT_COST_TXT_UPLOAD']
-            # CRITICAL FIX: Always get fresh credits for pre-action checks AND pass auth token
-            current_credits = supabase_service.get_user_credits(user['id'], use_cache=False, auth_token=token)
-            if current_credits < required_credits:
+            # Hold the credits for the duration of the request (committed on success, released otherwise)
+            hold = reserve_request_credits(user['id'], required_credits, 'txt_upload', auth_token=token)
+            has_credits, current_credits = hold['success'], hold['credits']
+            if not has_credits:
                 return jsonify({
                     'error': 'Insufficient credits',
                     'message': f'This action requires {required_credits} credits. You have {current_credits} credits.',
@@ -279,14 +297,18 @@ def create_upload_routes(app, upload_folder):
                     'error': 'File is empty'
                 }), 400
             
-            # Read text content
+            # Decode the upload in pieces (UTF-8/16/32 with or without BOM, cp1252,
+            # latin-1) with line endings normalised; the raw bytes are never read whole
+            decoder = TextStreamDecoder(file.stream)
             try:
-                text_content = file.read().decode('utf-8')
-                app.logger.debug(f'Text file processed: {len(text_content)} characters')
-            except UnicodeDecodeError:
+                text_content = ''.join(decoder)
+                app.logger.debug(
+                    f'Text file processed: {decoder.char_count} characters ({decoder.encoding})'
+                )
+            except TextDecodeError as e:
                 return jsonify({
                     'success': False,
-                    'error': 'Invalid text file encoding. Please use UTF-8 encoding.'
+                    'error': f'Could not read text file: {e}'
                 }), 400
             
             # Prepare response
@@ -296,33 +318,43 @@ def create_upload_routes(app, upload_folder):
                 'metadata': {
                     'filename': file.filename,
                     'file_size': file_size,
-                    'text_length': len(text_content),
-                    'processing_method': 'backend_txt'
+                    'text_length': decoder.char_count,
+                    'processing_method': 'backend_txt',
+                    **decoder.describe()
                 }
             }
             
             # Consume credits after successful upload (normal mode only)
             if not current_app.config.get('TESTING_MODE'):
                 from flask import g
-                from ..services.supabase_service import get_supabase_service
                 
                 credits_to_consume = current_app.config['CREDIT_COST_TXT_UPLOAD']
-                supabase_service = get_supabase_service()
-                success = supabase_service.update_user_credits(g.user_id, -credits_to_consume)
-                if success:
-                    supabase_service.log_usage(
-                        g.user_id, 
-                        'txt_upload', 
-                        credits_to_consume,
-                        {
-                            'endpoint': request.endpoint, 
-                            'method': request.method, 
-                            'filename': file.filename,
-                            'file_size': file_size,
-                            'text_length': len(text_content)
-                        }
-                    )
+                # Debit the held credits and log the usage in one atomic call
+                debit = commit_request_credits({
+                    'endpoint': request.endpoint, 
+                    'method': request.method, 
+                    'filename': file.filename,
+                    'file_size': file_size,
+                    'text_length': len(text_content)
+                })
+                if debit['insufficient']:
+                    # The hold expired and its credits were spent by another request
+                    return jsonify({
+                        'error': 'Insufficient credits',
+                        'message': f'This action requires {credits_to_consume} credits. You have {debit["credits"]} credits.',
+                        'current_credits': debit['credits'],
+                        'required_credits': credits_to_consume
+                    }), 402
+                if debit['success']:
                     app.logger.info(f"✅ Consumed {credits_to_consume} credits for txt_upload by user {g.user_id}")
+                    
+                    # Keep the paid-for text in the book text store so projects can reference it
+                    # by hash; with ?inline=0 the client pages it in via /api/texts
+                    text_ref = _store_book_text(supabase_service, token, g.user_id, text_content)
+                    if text_ref:
+                        result['text_ref'] = text_ref
+                        if request.args.get('inline') == '0':
+                            del result['text']
                 else:
                     app.logger.warning(f"⚠️ Failed to consume credits for user {g.user_id}")
             
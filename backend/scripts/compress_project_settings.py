@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Compress existing audiobook_projects rows into settings_blob
+
+Requires sql/19_project_blob_compression.sql. Rows are also compressed lazily on
+their next save once PROJECT_BLOB_COMPRESSION is enabled; this script converts
+the backlog up front and reports size and timing before and after.
+
+Usage (from the repository root):
+    python -m backend.scripts.compress_project_settings            # dry run
+    python -m backend.scripts.compress_project_settings --execute
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from backend.config import Config
+from backend.services.project_service import PROJECTS_TABLE
+from backend.services.supabase_service import SupabaseService
+from backend.utils.project_blob import (
+    build_project_summary, decode_project_blob, encode_project_blob, resolve_codec, serialize_project
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class ProjectCompressor:
+    def __init__(self, codec: str, min_bytes: int, batch_size: int = 20, dry_run: bool = True):
+        """Initialize the compressor
+
+        Args:
+            codec: 'gzip' or 'zstd'
+            min_bytes: Projects smaller than this are left as plain JSONB
+            batch_size: Rows fetched per query (project rows can be several MB each)
+            dry_run: If True, only measure without writing
+        """
+        self.codec = resolve_codec(codec)
+        if self.codec == 'none':
+            raise ValueError("A compression codec is required")
+        self.min_bytes = min_bytes
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.client = SupabaseService(
+            Config.SUPABASE_URL, Config.SUPABASE_KEY, Config.SUPABASE_JWT_SECRET, Config.SUPABASE_SERVICE_KEY
+        ).get_service_client()
+        self.stats = {
+            'scanned': 0,
+            'compressed': 0,
+            'below_threshold': 0,
+            'skipped_concurrent_save': 0,
+            'failed': 0,
+            'raw_bytes': 0,
+            'stored_bytes': 0,
+            'encode_ms': 0.0,
+            'decode_ms': 0.0
+        }
+
+    def fetch_batch(self, after_id):
+        """Next batch of uncompressed rows, in id order"""
+        query = self.client.table(PROJECTS_TABLE)\
+            .select('id, version, settings')\
+            .is_('settings_encoding', 'null')\
+            .order('id')\
+            .limit(self.batch_size)
+        if after_id:
+            query = query.gt('id', after_id)
+        return query.execute().data or []
+
+    def compress_row(self, row) -> None:
+        project_data = row.get('settings') or {}
+        raw = serialize_project(project_data)
+        if len(raw) < self.min_bytes:
+            self.stats['below_threshold'] += 1
+            return
+
+        started = time.perf_counter()
+        blob, encoding = encode_project_blob(raw, self.codec)
+        encoded_at = time.perf_counter()
+        if decode_project_blob(blob, encoding) != project_data:
+            raise ValueError("Round-trip check failed")
+        self.stats['encode_ms'] += (encoded_at - started) * 1000
+        self.stats['decode_ms'] += (time.perf_counter() - encoded_at) * 1000
+        self.stats['raw_bytes'] += len(raw)
+        self.stats['stored_bytes'] += len(blob)
+
+        if self.dry_run:
+            logger.info(f"[DRY RUN] {row['id']}: {len(raw) // 1024}KB -> {len(blob) // 1024}KB")
+            self.stats['compressed'] += 1
+            return
+
+        # Only replace the row if no save landed since it was read
+        result = self.client.table(PROJECTS_TABLE)\
+            .update({
+                'settings': {},
+                'chapters': [],
+                'settings_blob': blob,
+                'settings_encoding': encoding,
+                'settings_size': len(raw),
+                'summary': build_project_summary(project_data)
+            })\
+            .eq('id', row['id'])\
+            .eq('version', row['version'])\
+            .is_('settings_encoding', 'null')\
+            .execute()
+
+        if result.data:
+            logger.info(f"✓ {row['id']}: {len(raw) // 1024}KB -> {len(blob) // 1024}KB ({encoding})")
+            self.stats['compressed'] += 1
+        else:
+            self.stats['skipped_concurrent_save'] += 1
+
+    def run(self):
+        """Compress every uncompressed row"""
+        logger.info(f"Starting project compression (codec={self.codec}, min_bytes={self.min_bytes}, dry_run={self.dry_run})")
+
+        after_id = None
+        while True:
+            batch = self.fetch_batch(after_id)
+            if not batch:
+                break
+            for row in batch:
+                self.stats['scanned'] += 1
+                try:
+                    self.compress_row(row)
+                except Exception as e:
+                    logger.error(f"✗ Failed to compress project {row['id']}: {e}")
+                    self.stats['failed'] += 1
+            after_id = batch[-1]['id']
+
+        # Print summary
+        raw_mb = self.stats['raw_bytes'] / (1024 * 1024)
+        stored_mb = self.stats['stored_bytes'] / (1024 * 1024)
+        compressed = self.stats['compressed'] or 1
+        logger.info("\n" + "="*60)
+        logger.info("Compression Summary:")
+        logger.info(f"  Rows scanned: {self.stats['scanned']}")
+        logger.info(f"  Compressed: {self.stats['compressed']}")
+        logger.info(f"  Below threshold: {self.stats['below_threshold']}")
+        logger.info(f"  Skipped (saved during run): {self.stats['skipped_concurrent_save']}")
+        logger.info(f"  Failed: {self.stats['failed']}")
+        logger.info(f"  Size before: {raw_mb:.2f} MB, after: {stored_mb:.2f} MB")
+        logger.info(f"  Avg encode: {self.stats['encode_ms'] / compressed:.1f} ms, "
+                    f"avg decode: {self.stats['decode_ms'] / compressed:.1f} ms")
+
+        if self.dry_run:
+            logger.info("\nThis was a DRY RUN. No rows were changed.")
+            logger.info("Run with --execute to compress the rows.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compress stored projects into settings_blob')
+    parser.add_argument('--execute', action='store_true',
+                       help='Actually write the compressed rows (default is dry run)')
+    parser.add_argument('--codec', default=None,
+                       help='gzip or zstd (default: PROJECT_BLOB_COMPRESSION, else gzip)')
+    parser.add_argument('--min-bytes', type=int, default=Config.PROJECT_BLOB_MIN_BYTES,
+                       help='Leave projects smaller than this uncompressed')
+    parser.add_argument('--batch-size', type=int, default=20,
+                       help='Rows fetched per query')
+    args = parser.parse_args()
+
+    codec = args.codec or (Config.PROJECT_BLOB_COMPRESSION if Config.PROJECT_BLOB_COMPRESSION != 'none' else 'gzip')
+
+    try:
+        compressor = ProjectCompressor(
+            codec=codec,
+            min_bytes=args.min_bytes,
+            batch_size=args.batch_size,
+            dry_run=not args.execute
+        )
+        compressor.run()
+    except KeyboardInterrupt:
+        logger.info("\nCompression interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"Compression failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+# AudioBook Organizer - Book Text Index Service
+
+"""
+Positional full-text search over the book text store.
+
+Every chunk of a stored text (see book_text_service) is tokenized once per user:
+book_text_postings (sql/23) holds one row per (token, chunk) with the ordinal and
+character offset of each occurrence. Chunks are content-addressed and their cut
+points content-defined, so when an edited text is stored only the chunks around
+the edit are new and only those get indexed; the postings of all other chunks
+are reused as they are.
+
+A search reads the postings of its query tokens only, keeps the chunks of the
+text being searched and maps chunk offsets to text offsets through the text's
+manifest. Its cost follows the number of occurrences of the query words, not the
+length of the book. Matches never span chunk boundaries (a chunk always ends
+after a word), so a phrase cut by a boundary is not found.
+
+A text that is not stored (a project still embedding its bookText) can be
+searched in memory from its chunk contents; nothing is written for it.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..utils.text_tokens import TOKEN_PATTERN, tokenize, query_tokens
+from .book_text_service import get_book_text_service
+
+logger = logging.getLogger(__name__)
+
+CHUNK_INDEX_TABLE = 'book_text_chunk_index'
+POSTINGS_TABLE = 'book_text_postings'
+INDEX_RPC = 'index_book_text_chunks'
+
+# Hashes per `in` filter, keeping request URLs short
+HASH_LOOKUP_BATCH = 50
+# Chunks loaded and tokenized at a time, and tokens per index RPC call
+INDEX_LOAD_BATCH = 16
+INDEX_BATCH_TOKENS = 200000
+# PostgREST caps rows per response; postings are read in pages of this size
+POSTINGS_PAGE_SIZE = 1000
+
+SEARCH_MODES = ('all', 'phrase')
+MAX_QUERY_TOKENS = 16
+MAX_PER_PAGE = 100
+# In 'all' mode the query words must fall within this many extra words of each other
+ALL_MODE_MAX_GAP = 8
+SNIPPET_CONTEXT_CHARS = 60
+
+CACHE_ENTRIES = 256
+
+
+class BookTextIndexService:
+    """Builds the per-chunk search index and answers ranked, paginated searches"""
+
+    def __init__(self, cache_entries: int = CACHE_ENTRIES):
+        self.cache_entries = cache_entries
+        self._cache_lock = threading.Lock()
+        # (user_id, text_hash) of texts known to be fully indexed
+        self._indexed_texts: OrderedDict = OrderedDict()
+        # (user_id, text_hash, tokens, mode) -> ranked matches; texts never change
+        self._results: OrderedDict = OrderedDict()
+        # (user_id, project content_hash) -> text_hash of the project's book text
+        self._project_texts: OrderedDict = OrderedDict()
+
+    def _cache_get(self, cache: OrderedDict, key):
+        with self._cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _cache_put(self, cache: OrderedDict, key, value) -> None:
+        with self._cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cache_entries:
+                cache.popitem(last=False)
+
+    # Indexing
+
+    def index_chunk(self, content: str) -> Tuple[int, List[list]]:
+        """(token count, [[token, ordinals, offsets], ...]) for one chunk"""
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        count = 0
+        for ordinal, (token, start, _) in enumerate(tokenize(content)):
+            ordinals, offsets = postings.setdefault(token, ([], []))
+            ordinals.append(ordinal)
+            offsets.append(start)
+            count = ordinal + 1
+        return count, [[token, ordinals, offsets] for token, (ordinals, offsets) in postings.items()]
+
+    def _indexed_chunks(self, client, user_id: str, hashes: List[str]) -> set:
+        indexed = set()
+        for i in range(0, len(hashes), HASH_LOOKUP_BATCH):
+            result = client.table(CHUNK_INDEX_TABLE)\
+                .select('chunk_hash')\
+                .eq('user_id', user_id)\
+                .in_('chunk_hash', hashes[i:i + HASH_LOOKUP_BATCH])\
+                .execute()
+            indexed.update(row['chunk_hash'] for row in result.data or [])
+        return indexed
+
+    def index_text(self, client, user_id: str, manifest: Dict[str, Any]) -> int:
+        """
+        Index the chunks of a stored text that are not indexed yet
+
+        Returns:
+            Number of chunks tokenized by this call
+        """
+        key = (user_id, manifest['text_hash'])
+        if self._cache_get(self._indexed_texts, key):
+            return 0
+
+        hashes = list(dict.fromkeys(chunk['hash'] for chunk in manifest['chunks']))
+        indexed = self._indexed_chunks(client, user_id, hashes)
+        missing = [chunk_hash for chunk_hash in hashes if chunk_hash not in indexed]
+
+        text_service = get_book_text_service()
+        batch, batch_tokens = [], 0
+        for i in range(0, len(missing), INDEX_LOAD_BATCH):
+            group = missing[i:i + INDEX_LOAD_BATCH]
+            contents = text_service.load_chunks(client, user_id, group)
+            for chunk_hash in group:
+                token_count, postings = self.index_chunk(contents[chunk_hash])
+                batch.append({'hash': chunk_hash, 'token_count': token_count, 'postings': postings})
+                batch_tokens += token_count
+                if batch_tokens >= INDEX_BATCH_TOKENS:
+                    self._send_index_batch(client, user_id, batch)
+                    batch, batch_tokens = [], 0
+        if batch:
+            self._send_index_batch(client, user_id, batch)
+
+        self._cache_put(self._indexed_texts, key, True)
+        if missing:
+            logger.info(
+                f"🔎 Indexed {len(missing)} of {len(hashes)} chunks of book text {manifest['text_hash'][:12]}"
+            )
+        return len(missing)
+
+    def _send_index_batch(self, client, user_id: str, batch: List[Dict[str, Any]]) -> None:
+        client.rpc(INDEX_RPC, {'p_user_id': user_id, 'p_chunks': batch}).execute()
+
+    # Projects
+
+    def get_project_text_hash(self, user_id: str, project_hash: Optional[str]) -> Optional[str]:
+        """Text hash remembered for a project version, if any"""
+        if not project_hash:
+            return None
+        return self._cache_get(self._project_texts, (user_id, project_hash))
+
+    def remember_project_text(self, user_id: str, project_hash: Optional[str], text_hash: str) -> None:
+        if project_hash:
+            self._cache_put(self._project_texts, (user_id, project_hash), text_hash)
+
+    # Search
+
+    def _fetch_postings(self, client, user_id: str, tokens: List[str],
+                        chunk_hashes: set) -> Dict[str, Dict[str, Tuple[List[int], List[int]]]]:
+        """{chunk_hash: {token: (ordinals, offsets)}} for the given chunks"""
+        postings: Dict[str, Dict[str, Tuple[List[int], List[int]]]] = {}
+        hashes = sorted(chunk_hashes)
+        # Only the searched text's chunks are read, however many texts the user stored
+        for i in range(0, len(hashes), HASH_LOOKUP_BATCH):
+            batch = hashes[i:i + HASH_LOOKUP_BATCH]
+            start = 0
+            while True:
+                result = client.table(POSTINGS_TABLE)\
+                    .select('token, chunk_hash, ordinals, offsets')\
+                    .eq('user_id', user_id)\
+                    .in_('chunk_hash', batch)\
+                    .in_('token', tokens)\
+                    .order('token')\
+                    .order('chunk_hash')\
+                    .range(start, start + POSTINGS_PAGE_SIZE - 1)\
+                    .execute()
+                rows = result.data or []
+                for row in rows:
+                    postings.setdefault(row['chunk_hash'], {})[row['token']] = (row['ordinals'], row['offsets'])
+                if len(rows) < POSTINGS_PAGE_SIZE:
+                    break
+                start += POSTINGS_PAGE_SIZE
+        return postings
+
+    def _chunk_matches(self, tokens: List[str], postings: Dict[str, Tuple[List[int], List[int]]],
+                       mode: str) -> List[Tuple[float, int, int]]:
+        """(score, start offset, offset of the last matched word) of the matches in one chunk"""
+        if any(token not in postings for token in tokens):
+            return []
+
+        if mode == 'phrase' or len(tokens) == 1:
+            first_ordinals, first_offsets = postings[tokens[0]]
+            following = [set(postings[token][0]) for token in tokens[1:]]
+            last_offsets = dict(zip(*postings[tokens[-1]]))
+            matches = []
+            for ordinal, offset in zip(first_ordinals, first_offsets):
+                if all(ordinal + k + 1 in ordinals for k, ordinals in enumerate(following)):
+                    matches.append((1.0, offset, last_offsets[ordinal + len(tokens) - 1]))
+            return matches
+
+        # Minimal windows holding every query word, in the order of the text
+        occurrences = sorted(
+            (ordinal, index, offset)
+            for index, token in enumerate(tokens)
+            for ordinal, offset in zip(*postings[token])
+        )
+        needed = len(tokens)
+        max_span = needed + ALL_MODE_MAX_GAP
+        counts = [0] * needed
+        covered = 0
+        left = 0
+        matches = []
+        for right, (right_ordinal, right_index, right_offset) in enumerate(occurrences):
+            if counts[right_index] == 0:
+                covered += 1
+            counts[right_index] += 1
+            # Drop words from the left while the window still holds every query word
+            while counts[occurrences[left][1]] > 1:
+                counts[occurrences[left][1]] -= 1
+                left += 1
+            if covered < needed:
+                continue
+
+            left_ordinal, _, left_offset = occurrences[left]
+            span = right_ordinal - left_ordinal + 1
+            if span <= max_span:
+                in_order = span == needed and [index for _, index, _ in occurrences[left:right + 1]] == list(range(needed))
+                score = 1.0 if in_order else round(0.9 * needed / span, 4)
+                matches.append((score, left_offset, right_offset))
+            # Move past the leftmost word so the next match starts after it
+            counts[occurrences[left][1]] -= 1
+            covered -= 1
+            left += 1
+        return matches
+
+    def _memory_postings(self, tokens: List[str],
+                         contents: Dict[str, str]) -> Dict[str, Dict[str, Tuple[List[int], List[int]]]]:
+        """Postings of the query tokens, tokenized from chunk contents instead of the index"""
+        wanted = set(tokens)
+        postings: Dict[str, Dict[str, Tuple[List[int], List[int]]]] = {}
+        for chunk_hash, content in contents.items():
+            _, chunk_postings = self.index_chunk(content)
+            found = {token: (ordinals, offsets) for token, ordinals, offsets in chunk_postings if token in wanted}
+            if found:
+                postings[chunk_hash] = found
+        return postings
+
+    def _rank(self, client, user_id: str, manifest: Dict[str, Any], tokens: List[str], mode: str,
+              contents: Optional[Dict[str, str]] = None) -> List[Tuple[float, int, int, int, int]]:
+        """All matches of a text as (score, text offset, chunk index, chunk start, last word offset)"""
+        key = (user_id, manifest['text_hash'], tuple(tokens), mode)
+        cached = self._cache_get(self._results, key)
+        if cached is not None:
+            return cached
+
+        chunk_positions: Dict[str, List[int]] = {}
+        for index, chunk in enumerate(manifest['chunks']):
+            chunk_positions.setdefault(chunk['hash'], []).append(index)
+
+        if contents is not None:
+            postings = self._memory_postings(tokens, contents)
+        else:
+            postings = self._fetch_postings(client, user_id, list(dict.fromkeys(tokens)), set(chunk_positions))
+        matches = []
+        for chunk_hash, chunk_postings in postings.items():
+            found = self._chunk_matches(tokens, chunk_postings, mode)
+            if not found:
+                continue
+            # Identical chunks share postings; each copy in the text is a separate hit
+            for index in chunk_positions[chunk_hash]:
+                chunk_offset = manifest['chunks'][index]['offset']
+                for score, start, last in found:
+                    matches.append((score, chunk_offset + start, index, start, last))
+
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        # Results of a partly indexed text would miss matches once it is complete
+        if contents is not None or self._cache_get(self._indexed_texts, (user_id, manifest['text_hash'])):
+            self._cache_put(self._results, key, matches)
+        return matches
+
+    def search(self, client, user_id: str, manifest: Dict[str, Any], query: str,
+               mode: str = 'all', page: int = 1, per_page: int = 20,
+               contents: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Search a stored text
+
+        Args:
+            mode: 'all' - every query word within a few words of each other (exact
+                  phrases rank first), 'phrase' - the words in order, adjacent
+            page: 1-based page of the ranked matches
+            contents: {chunk hash: content} of a text that is not stored; it is
+                      searched in memory instead of through the index
+
+        Returns:
+            {'query', 'mode', 'total', 'page', 'per_page', 'has_more', 'results':
+            [{'offset', 'length', 'score', 'snippet', 'snippet_offset'}, ...]};
+            offsets count characters from the start of the text
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode must be one of {', '.join(SEARCH_MODES)}")
+        tokens = query_tokens(query)[:MAX_QUERY_TOKENS]
+        if not tokens:
+            raise ValueError('Query has no searchable words')
+        if mode == 'all':
+            tokens = list(dict.fromkeys(tokens))
+        page = max(1, page)
+        per_page = min(max(1, per_page), MAX_PER_PAGE)
+
+        matches = self._rank(client, user_id, manifest, tokens, mode, contents)
+        selected = matches[(page - 1) * per_page:page * per_page]
+
+        if contents is None:
+            contents = get_book_text_service().load_chunks(
+                client, user_id, [manifest['chunks'][index]['hash'] for _, _, index, _, _ in selected]
+            )
+        results = []
+        for score, offset, index, start, last in selected:
+            content = contents[manifest['chunks'][index]['hash']]
+            word = TOKEN_PATTERN.match(content, last)
+            end = word.end() if word else last
+            snippet_start = max(0, start - SNIPPET_CONTEXT_CHARS)
+            results.append({
+                'offset': offset,
+                'length': end - start,
+                'score': score,
+                'snippet': content[snippet_start:end + SNIPPET_CONTEXT_CHARS],
+                'snippet_offset': offset - (start - snippet_start)
+            })
+
+        return {
+            'query': query,
+            'mode': mode,
+            'total': len(matches),
+            'page': page,
+            'per_page': per_page,
+            'has_more': page * per_page < len(matches),
+            'results': results
+        }
+
+
+def store_and_index_text(client, user_id: str, text: str) -> Dict[str, Any]:
+    """
+    Store a text in the book text store, index it for search and return its reference
+
+    Indexing failures are logged and leave the text unindexed; searches index it
+    on demand.
+    """
+    text_service = get_book_text_service()
+    manifest = text_service.store_text(client, user_id, text)
+    try:
+        get_book_text_index_service().index_text(client, user_id, manifest)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not index book text {manifest['text_hash'][:12]}: {e}")
+    return text_service.describe(manifest)
+
+
+# Global instance
+_book_text_index_service = None
+
+def get_book_text_index_service() -> BookTextIndexService:
+    """Get the global book text index service instance"""
+    global _book_text_index_service
+    if _book_text_index_service is None:
+        _book_text_index_service = BookTextIndexService()
+    return _book_text_index_service
+
+def init_book_text_index_service(cache_entries: int = CACHE_ENTRIES) -> BookTextIndexService:
+    """Initialize the global book text index service with custom configuration"""
+    global _book_text_index_service
+    _book_text_index_service = BookTextIndexService(cache_entries)
+    return _book_text_index_service
@@ -0,0 +1,406 @@
+# AudioBook Organizer - Book Text Service
+
+"""
+Server-side store for imported book text.
+
+A text is split into chunks of roughly chunk_chars characters and each chunk is
+stored once per user under the SHA-256 of its content (book_text_chunks,
+sql/22). Cut points are content-defined: a chunk ends after a word whose
+preceding characters hash to a boundary value, so an edit only changes the
+chunks around it and the rest of the text keeps its chunks (and their search
+index, see book_text_index_service). The book_texts row for the text keeps the
+ordered chunk list together with the character offset, line number and
+paragraph number every chunk starts at. That sparse index is enough to answer
+offset, line and paragraph ranges by fetching only the chunks involved.
+
+Lines end at '\\n'. A paragraph is a run of non-blank lines; blank (empty or
+whitespace-only) lines separate paragraphs. Offsets and lengths count Unicode
+characters.
+
+Texts and chunks never change once written, so manifests and chunk contents are
+cached in-process without invalidation.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from postgrest.types import ReturnMethod
+
+logger = logging.getLogger(__name__)
+
+TEXTS_TABLE = 'book_texts'
+CHUNKS_TABLE = 'book_text_chunks'
+
+MANIFEST_COLUMNS = 'text_hash, char_length, line_count, paragraph_count, title, chunks'
+
+# Content-defined chunking: chunks are between 1/2 and 2x chunk_chars long and end
+# at a word end whose preceding CUT_WINDOW characters hash to 0 mod chunk_chars/24
+CUT_WINDOW = 32
+CUT_CANDIDATE_PATTERN = re.compile(r'(?<=\S)\s')
+# Characters of chunk content sent per insert request
+INSERT_BATCH_CHARS = 1024 * 1024
+TITLE_MAX_LENGTH = 50
+
+
+class BookTextNotFound(Exception):
+    """Raised when a text hash is not stored for the user"""
+    pass
+
+
+def hash_text(text: str) -> str:
+    """Content address of a text or chunk"""
+    return hashlib.sha256(text.encode('utf-8', errors='surrogatepass')).hexdigest()
+
+
+def _is_blank(line: str) -> bool:
+    return not line.strip()
+
+
+def _line_starts(content: str, continues_line: bool) -> Iterable[int]:
+    """Offsets within a chunk where a new line begins"""
+    if not continues_line and content:
+        yield 0
+    position = content.find('\n')
+    while position != -1 and position + 1 < len(content):
+        yield position + 1
+        position = content.find('\n', position + 1)
+
+
+def _paragraph_starts(content: str, blank_before: bool, continues_line: bool) -> Tuple[List[int], bool]:
+    """
+    Offsets within a chunk where a paragraph begins
+
+    Returns:
+        (offsets, whether the chunk's last complete line is blank)
+    """
+    starts = []
+    previous_blank = blank_before if not continues_line else False
+    for start in _line_starts(content, continues_line):
+        end = content.find('\n', start)
+        line = content[start:] if end == -1 else content[start:end]
+        blank = _is_blank(line)
+        if not blank and previous_blank:
+            starts.append(start)
+        previous_blank = blank
+    return starts, previous_blank
+
+
+class BookTextService:
+    """Stores book text as content-addressed chunks and serves character, line and paragraph ranges"""
+
+    def __init__(self, chunk_chars: int = 65536, max_range_chars: int = 1048576, cache_chunks: int = 128):
+        self.chunk_chars = max(1024, chunk_chars)
+        self.max_range_chars = max(self.chunk_chars, max_range_chars)
+        self.cache_chunks = cache_chunks
+
+        self._cache_lock = threading.Lock()
+        self._manifests: 'OrderedDict[Tuple[str, str], Dict[str, Any]]' = OrderedDict()
+        self._chunks: 'OrderedDict[Tuple[str, str], str]' = OrderedDict()
+
+    # Building the index
+
+    def split_text(self, text: str) -> List[Tuple[int, int]]:
+        """(start, end) character spans of the chunks; every chunk but the last ends after a word"""
+        min_chars = self.chunk_chars // 2
+        max_chars = self.chunk_chars * 2
+        divisor = max(1, self.chunk_chars // 24)
+
+        spans = []
+        start = 0
+        length = len(text)
+        while start < length:
+            if length - start <= max_chars:
+                spans.append((start, length))
+                break
+
+            end = None
+            fallback = None
+            for candidate in CUT_CANDIDATE_PATTERN.finditer(text, start + min_chars, start + max_chars):
+                position = candidate.start()
+                fallback = position
+                window = text[max(0, position - CUT_WINDOW):position]
+                if zlib.crc32(window.encode('utf-8', errors='surrogatepass')) % divisor == 0:
+                    end = position
+                    break
+            if end is None:
+                # No content-defined boundary: last word end in range, else a hard cut
+                end = fallback if fallback is not None else start + max_chars
+            spans.append((start, end))
+            start = end
+        return spans
+
+    def build_manifest(self, text: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Index a text without storing it
+
+        Returns:
+            (manifest, chunk rows) where chunk rows carry chunk_hash, content and char_length
+        """
+        chunks = []
+        rows = {}
+        line = 0
+        paragraph = 0
+        blank_before = True
+        continues_line = False
+
+        for start, end in self.split_text(text):
+            content = text[start:end]
+            chunk_hash = hash_text(content)
+            chunks.append({
+                'hash': chunk_hash,
+                'offset': start,
+                'length': end - start,
+                'line': line,
+                'paragraph': paragraph,
+                'blank_before': blank_before,
+                'continues_line': continues_line
+            })
+            rows.setdefault(chunk_hash, {'chunk_hash': chunk_hash, 'content': content, 'char_length': end - start})
+
+            starts, last_blank = _paragraph_starts(content, blank_before, continues_line)
+            line += content.count('\n')
+            paragraph += len(starts)
+            continues_line = not content.endswith('\n')
+            blank_before = last_blank
+
+        first_line = text.split('\n', 1)[0].strip()
+        manifest = {
+            'text_hash': hash_text(text),
+            'char_length': len(text),
+            # A trailing line break does not start another line
+            'line_count': text.count('\n') + (0 if not text or text.endswith('\n') else 1),
+            'paragraph_count': paragraph,
+            'title': (first_line[:TITLE_MAX_LENGTH] + ('...' if len(first_line) > TITLE_MAX_LENGTH else '')) or None,
+            'chunks': chunks
+        }
+        return manifest, list(rows.values())
+
+    # Storage
+
+    def store_text(self, client, user_id: str, text: str) -> Dict[str, Any]:
+        """
+        Store a text (idempotent) and return its manifest
+
+        Chunks are written before the text row, so a stored manifest never
+        references a missing chunk; chunks the user already has are left as they are.
+        """
+        manifest, rows = self.build_manifest(text)
+        existing = self.get_manifest(client, user_id, manifest['text_hash'])
+        if existing:
+            return existing
+
+        batch, batch_chars = [], 0
+        for row in rows:
+            batch.append(dict(row, user_id=user_id))
+            batch_chars += row['char_length']
+            if batch_chars >= INSERT_BATCH_CHARS:
+                self._insert_chunks(client, batch)
+                batch, batch_chars = [], 0
+        if batch:
+            self._insert_chunks(client, batch)
+
+        client.table(TEXTS_TABLE)\
+            .upsert(dict(manifest, user_id=user_id), on_conflict='user_id,text_hash',
+                    ignore_duplicates=True, returning=ReturnMethod.minimal)\
+            .execute()
+
+        with self._cache_lock:
+            for row in rows:
+                self._cache_put(self._chunks, (user_id, row['chunk_hash']), row['content'], self.cache_chunks)
+        self._remember_manifest(user_id, manifest)
+
+        logger.info(
+            f"📚 Stored book text {manifest['text_hash'][:12]} ({manifest['char_length']} chars, {len(rows)} chunks)"
+        )
+        return manifest
+
+    def _insert_chunks(self, client, rows: List[Dict[str, Any]]) -> None:
+        client.table(CHUNKS_TABLE)\
+            .upsert(rows, on_conflict='user_id,chunk_hash', ignore_duplicates=True, returning=ReturnMethod.minimal)\
+            .execute()
+
+    def _cache_put(self, cache: OrderedDict, key, value, limit: int) -> None:
+        """Insert into an LRU dict (caller holds the cache lock)"""
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def _remember_manifest(self, user_id: str, manifest: Dict[str, Any]) -> None:
+        with self._cache_lock:
+            self._cache_put(self._manifests, (user_id, manifest['text_hash']), manifest, self.cache_chunks)
+
+    def get_manifest(self, client, user_id: str, text_hash: str) -> Optional[Dict[str, Any]]:
+        """Manifest of a stored text, or None if the user has no text with this hash"""
+        with self._cache_lock:
+            manifest = self._manifests.get((user_id, text_hash))
+            if manifest is not None:
+                self._manifests.move_to_end((user_id, text_hash))
+                return manifest
+
+        result = client.table(TEXTS_TABLE)\
+            .select(MANIFEST_COLUMNS)\
+            .eq('user_id', user_id)\
+            .eq('text_hash', text_hash)\
+            .execute()
+        if not result.data:
+            return None
+        manifest = result.data[0]
+        self._remember_manifest(user_id, manifest)
+        return manifest
+
+    def _require_manifest(self, client, user_id: str, text_hash: str) -> Dict[str, Any]:
+        manifest = self.get_manifest(client, user_id, text_hash)
+        if manifest is None:
+            raise BookTextNotFound(f"No stored text {text_hash}")
+        return manifest
+
+    def load_chunks(self, client, user_id: str, hashes: List[str]) -> Dict[str, str]:
+        """Chunk contents by hash, from the cache where possible"""
+        contents = {}
+        with self._cache_lock:
+            for chunk_hash in hashes:
+                content = self._chunks.get((user_id, chunk_hash))
+                if content is not None:
+                    self._chunks.move_to_end((user_id, chunk_hash))
+                    contents[chunk_hash] = content
+
+        missing = [chunk_hash for chunk_hash in dict.fromkeys(hashes) if chunk_hash not in contents]
+        if missing:
+            result = client.table(CHUNKS_TABLE)\
+                .select('chunk_hash, content')\
+                .eq('user_id', user_id)\
+                .in_('chunk_hash', missing)\
+                .execute()
+            with self._cache_lock:
+                for row in result.data or []:
+                    contents[row['chunk_hash']] = row['content']
+                    self._cache_put(self._chunks, (user_id, row['chunk_hash']), row['content'], self.cache_chunks)
+
+        absent = [chunk_hash for chunk_hash in hashes if chunk_hash not in contents]
+        if absent:
+            raise BookTextNotFound(f"Text chunk {absent[0]} is missing")
+        return contents
+
+    # Ranges
+
+    def read_range(self, client, user_id: str, text_hash: str, offset: int, length: int) -> Dict[str, Any]:
+        """
+        Characters [offset, offset + length) of a stored text, clamped to the text
+        and to max_range_chars
+
+        Raises:
+            BookTextNotFound: No such text for the user
+        """
+        manifest = self._require_manifest(client, user_id, text_hash)
+        return self._read(client, user_id, manifest, offset, offset + length)
+
+    def read_lines(self, client, user_id: str, text_hash: str, line: int, count: int) -> Dict[str, Any]:
+        """Lines [line, line + count) including their line breaks"""
+        manifest = self._require_manifest(client, user_id, text_hash)
+        start = self._line_offset(client, user_id, manifest, line)
+        end = self._line_offset(client, user_id, manifest, line + count)
+        result = self._read(client, user_id, manifest, start, end)
+        result.update({'line': line, 'line_count': manifest['line_count']})
+        return result
+
+    def read_paragraphs(self, client, user_id: str, text_hash: str, paragraph: int, count: int) -> Dict[str, Any]:
+        """Paragraphs [paragraph, paragraph + count), each with the blank lines that follow it"""
+        manifest = self._require_manifest(client, user_id, text_hash)
+        start = self._paragraph_offset(client, user_id, manifest, paragraph)
+        end = self._paragraph_offset(client, user_id, manifest, paragraph + count)
+        result = self._read(client, user_id, manifest, start, end)
+        result.update({'paragraph': paragraph, 'paragraph_count': manifest['paragraph_count']})
+        return result
+
+    def _read(self, client, user_id: str, manifest: Dict[str, Any], start: int, end: int) -> Dict[str, Any]:
+        total = manifest['char_length']
+        start = min(max(0, start), total)
+        end = min(max(start, end), total, start + self.max_range_chars)
+
+        chunks = manifest['chunks']
+        offsets = [chunk['offset'] for chunk in chunks]
+        first = max(0, bisect_right(offsets, start) - 1)
+        last = max(first, bisect_left(offsets, end) - 1)
+        selected = chunks[first:last + 1] if end > start else []
+
+        contents = self.load_chunks(client, user_id, [chunk['hash'] for chunk in selected])
+        pieces = []
+        for chunk in selected:
+            content = contents[chunk['hash']]
+            pieces.append(content[max(0, start - chunk['offset']):max(0, end - chunk['offset'])])
+
+        return {
+            'text_hash': manifest['text_hash'],
+            'offset': start,
+            'length': end - start,
+            'total_length': total,
+            'text': ''.join(pieces)
+        }
+
+    def _line_offset(self, client, user_id: str, manifest: Dict[str, Any], line: int) -> int:
+        """Character offset where a line starts (text length past the last line)"""
+        if line <= 0:
+            return 0
+        if line >= manifest['line_count']:
+            return manifest['char_length']
+        chunks = manifest['chunks']
+        # The chunk holding the line break that ends line - 1
+        index = bisect_left([chunk['line'] for chunk in chunks], line) - 1
+        chunk = chunks[index]
+        content = self.load_chunks(client, user_id, [chunk['hash']])[chunk['hash']]
+        position = -1
+        for _ in range(line - chunk['line']):
+            position = content.find('\n', position + 1)
+        return chunk['offset'] + position + 1
+
+    def _paragraph_offset(self, client, user_id: str, manifest: Dict[str, Any], paragraph: int) -> int:
+        """Character offset where a paragraph starts (text length past the last paragraph)"""
+        if paragraph >= manifest['paragraph_count']:
+            return manifest['char_length']
+        chunks = manifest['chunks']
+        paragraph = max(0, paragraph)
+        index = bisect_right([chunk['paragraph'] for chunk in chunks], paragraph) - 1
+        chunk = chunks[index]
+        content = self.load_chunks(client, user_id, [chunk['hash']])[chunk['hash']]
+        starts, _ = _paragraph_starts(content, chunk['blank_before'], chunk['continues_line'])
+        return chunk['offset'] + starts[paragraph - chunk['paragraph']]
+
+    def describe(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """Public summary of a manifest (without the chunk list)"""
+        return {
+            'hash': manifest['text_hash'],
+            'length': manifest['char_length'],
+            'line_count': manifest['line_count'],
+            'paragraph_count': manifest['paragraph_count'],
+            'chunk_count': len(manifest['chunks']),
+            'title': manifest.get('title')
+        }
+
+
+# Global instance
+_book_text_service = None
+
+def get_book_text_service() -> BookTextService:
+    """Get the global book text service instance"""
+    global _book_text_service
+    if _book_text_service is None:
+        from ..config import config
+        app_config = config['default']()
+        _book_text_service = BookTextService(
+            chunk_chars=app_config.BOOK_TEXT_CHUNK_CHARS,
+            max_range_chars=app_config.BOOK_TEXT_MAX_RANGE_CHARS
+        )
+    return _book_text_service
+
+def init_book_text_service(chunk_chars: int = 65536, max_range_chars: int = 1048576) -> BookTextService:
+    """Initialize the global book text service with custom configuration"""
+    global _book_text_service
+    _book_text_service = BookTextService(chunk_chars, max_range_chars)
+    return _book_text_service
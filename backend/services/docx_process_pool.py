@@ -0,0 +1,467 @@
+# AudioBook Organizer - DOCX Process Pool
+
+"""
+Runs DocxService extraction in dedicated worker processes.
+
+DOCX parsing is CPU-bound pure-Python work that holds the GIL, so running it on
+the gthread request threads stalls every other request in the same gunicorn
+worker. Documents are handed to a small pool of worker processes instead, with a
+per-document CPU budget (RLIMIT_CPU), a per-worker memory cap (RLIMIT_AS) and a
+wall-clock timeout.
+
+Each worker runs one document at a time and talks to the pool over its own pipe.
+The wall-clock budget starts when the worker reports that it picked the document
+up, so time spent waiting for a free worker never counts against it. A worker
+that blows its budget (or dies) is killed and replaced on its own; documents
+running in the other workers are not affected.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import signal
+import pickle
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .docx_service import DocxService, DocxProcessingLimitError
+
+try:
+    import resource  # POSIX only - limits are skipped on other platforms
+except ImportError:  # pragma: no cover - Windows development machines
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Worker-process state (populated by _worker_init in each child process)
+_worker_docx_service: Optional[DocxService] = None
+
+
+def _on_cpu_budget_exceeded(signum, frame):
+    """SIGXCPU handler - turns the soft CPU limit into a catchable error"""
+    raise DocxProcessingLimitError('Document exceeded the CPU time budget for processing')
+
+
+def _worker_init(max_memory_mb: int) -> None:
+    """Initialise a worker process: memory cap, CPU signal handler and service instance"""
+    global _worker_docx_service
+    _worker_docx_service = DocxService()
+
+    if resource is None:
+        return
+
+    try:
+        signal.signal(signal.SIGXCPU, _on_cpu_budget_exceeded)
+        if max_memory_mb and max_memory_mb > 0:
+            _, hard = resource.getrlimit(resource.RLIMIT_AS)
+            limit = max_memory_mb * 1024 * 1024
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (ValueError, OSError) as e:
+        logger.warning(f"Could not apply DOCX worker resource limits: {e}")
+
+
+def _set_cpu_budget(cpu_seconds: int) -> None:
+    """Set the soft CPU limit to the CPU time used so far plus this document's budget"""
+    if resource is None or not cpu_seconds or cpu_seconds <= 0:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = usage.ru_utime + usage.ru_stime
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(used) + int(cpu_seconds) + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _clear_cpu_budget() -> None:
+    """Lift the soft CPU limit so an idle worker is never signalled"""
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+def _process_with_formatting(service: DocxService, file_path: str) -> Dict[str, Any]:
+    """Validate and extract text + formatting in a single worker round trip"""
+    validation = service.validate_docx_file(file_path)
+    if not validation['valid']:
+        return {'validation': validation, 'result': None}
+    return {
+        'validation': validation,
+        'result': service.extract_content_with_formatting(file_path)
+    }
+
+
+def _process_text_only(service: DocxService, file_path: str) -> Dict[str, Any]:
+    """Validate and extract plain text in a single worker round trip"""
+    validation = service.validate_docx_file(file_path)
+    if not validation['valid']:
+        return {'validation': validation, 'result': None}
+    return {
+        'validation': validation,
+        'result': service.extract_text_only(file_path)
+    }
+
+
+_TASKS = {
+    'process_with_formatting': _process_with_formatting,
+    'process_text_only': _process_text_only,
+}
+
+
+def _run_task(task: str, file_path: str, cpu_seconds: int) -> Dict[str, Any]:
+    """Run a task inside the worker process"""
+    service = _worker_docx_service or DocxService()
+    _set_cpu_budget(cpu_seconds)
+    try:
+        return _TASKS[task](service, file_path)
+    except MemoryError:
+        raise DocxProcessingLimitError('Document exceeds the memory budget for processing')
+    finally:
+        _clear_cpu_budget()
+
+
+def _iter_stream_records(service: DocxService, task: str, file_path: str, chunk_paragraphs: int) -> Iterator[Dict[str, Any]]:
+    """Yield the validation record followed by the extraction records of a streaming task"""
+    validation = service.validate_docx_file(file_path)
+    yield {'type': 'validation', 'validation': validation}
+    if not validation['valid']:
+        return
+    if task != 'process_with_formatting':
+        raise ValueError(f"Streaming is not supported for DOCX task: {task}")
+    yield from service.iter_content_with_formatting(file_path, chunk_paragraphs)
+
+
+def _run_stream_task(conn, task: str, file_path: str, cpu_seconds: int, chunk_paragraphs: int) -> None:
+    """Run a streaming task inside the worker process - records are sent as they are produced"""
+    service = _worker_docx_service or DocxService()
+    _set_cpu_budget(cpu_seconds)
+    try:
+        for record in _iter_stream_records(service, task, file_path, chunk_paragraphs):
+            conn.send(('record', record))
+    except MemoryError:
+        raise DocxProcessingLimitError('Document exceeds the memory budget for processing')
+    finally:
+        _clear_cpu_budget()
+
+
+def _send_reply(conn, reply: Tuple[str, Any]) -> None:
+    """Send a reply to the pool; exceptions that cannot be pickled are sent as plain ones"""
+    try:
+        conn.send(reply)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        conn.send(('error', Exception(str(reply[1]))))
+
+
+def _worker_main(conn, max_memory_mb: int) -> None:
+    """Entry point of a worker process - runs one message at a time until told to stop"""
+    _worker_init(max_memory_mb)
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+
+        kind, task, file_path, cpu_seconds, chunk_paragraphs = message
+        # Start marker - the pool measures the wall-clock budget from here
+        conn.send(('started', None))
+        try:
+            if kind == 'stream':
+                _run_stream_task(conn, task, file_path, cpu_seconds, chunk_paragraphs)
+                reply = ('done', None)
+            else:
+                reply = ('result', _run_task(task, file_path, cpu_seconds))
+        except Exception as e:
+            reply = ('error', e)
+        _send_reply(conn, reply)
+
+
+class _Worker:
+    """One worker process and the pool's end of its pipe"""
+
+    def __init__(self, context, max_memory_mb: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, max_memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self) -> None:
+        try:
+            if self.process.is_alive():
+                self.process.kill()
+            self.process.join(timeout=1)
+        except Exception as e:
+            logger.warning(f"Failed to kill DOCX worker process: {e}")
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+            self.process.join(timeout=1)
+        except (OSError, ValueError):
+            pass
+        self.kill()
+
+
+class DocxProcessPool:
+    """Worker process pool enforcing per-document CPU, memory and time budgets"""
+
+    def __init__(self, enabled: bool = True, max_workers: int = 1, timeout: int = 60,
+                 max_cpu_seconds: int = 45, max_memory_mb: int = 1024):
+        self.enabled = enabled
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+        self.max_cpu_seconds = max_cpu_seconds
+        self.max_memory_mb = max_memory_mb
+
+        # Workers are started on demand so no processes start before gunicorn forks
+        self._idle: List[_Worker] = []
+        self._workers: List[_Worker] = []
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._lock = threading.Lock()
+
+        # Counters for monitoring
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'limit_exceeded': 0,
+            'timeouts': 0,
+            'worker_crashes': 0,
+            'workers_started': 0,
+            'workers_killed': 0
+        }
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _checkout(self) -> _Worker:
+        """Wait for a free worker (an idle one, or a new one when fewer than max_workers run)"""
+        self._slots.acquire()
+        try:
+            with self._lock:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.is_alive():
+                        return worker
+                    self._workers.remove(worker)
+                # 'spawn' avoids forking a multi-threaded gthread worker
+                worker = _Worker(multiprocessing.get_context('spawn'), self.max_memory_mb)
+                self._workers.append(worker)
+                self._stats['workers_started'] += 1
+            logger.info(f"📄 DOCX worker process started (pid {worker.process.pid}, timeout={self.timeout}s, "
+                        f"cpu={self.max_cpu_seconds}s, memory={self.max_memory_mb}MB)")
+            return worker
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _checkin(self, worker: _Worker, healthy: bool) -> None:
+        """Return a worker after a task; one that did not finish cleanly is killed"""
+        with self._lock:
+            if healthy and worker.is_alive():
+                self._idle.append(worker)
+                worker = None
+            else:
+                if worker in self._workers:
+                    self._workers.remove(worker)
+                self._stats['workers_killed'] += 1
+        if worker is not None:
+            worker.kill()
+        self._slots.release()
+
+    def _receive(self, worker: _Worker, deadline: float) -> Tuple[str, Any]:
+        """Next message from a worker; TimeoutError past the deadline, EOFError if it died"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not worker.conn.poll(remaining):
+            raise TimeoutError()
+        return worker.conn.recv()
+
+    def _start(self, worker: _Worker, message: tuple) -> float:
+        """Hand a task to a worker and return the deadline, counted from when the worker starts it"""
+        self._count('submitted')
+        worker.conn.send(message)
+        # A new worker is still importing; that does not count against the document's budget
+        self._receive(worker, time.monotonic() + self.timeout)
+        return time.monotonic() + self.timeout
+
+    def _drain(self, worker: _Worker, deadline: float) -> bool:
+        """Read a worker's remaining messages until its task ends; False if it did not end in time"""
+        try:
+            while True:
+                kind, _ = self._receive(worker, deadline)
+                if kind in ('done', 'error'):
+                    return True
+        except (TimeoutError, EOFError, OSError):
+            return False
+
+    def run(self, task: str, file_path: str) -> Dict[str, Any]:
+        """
+        Run a DOCX task and wait for its result within the configured budget
+
+        Args:
+            task: 'process_with_formatting' or 'process_text_only'
+            file_path: Path to the DOCX file (must be readable by the worker)
+
+        Returns:
+            Dict with 'validation' and 'result' (result is None for invalid files)
+
+        Raises:
+            DocxProcessingLimitError: the document exceeded its CPU, memory or time budget
+        """
+        if task not in _TASKS:
+            raise ValueError(f"Unknown DOCX task: {task}")
+
+        if not self.enabled:
+            # In-thread fallback (pool disabled by configuration)
+            return _TASKS[task](DocxService(), file_path)
+
+        worker = self._checkout()
+        healthy = False
+        try:
+            deadline = self._start(worker, ('run', task, file_path, self.max_cpu_seconds, None))
+            kind, value = self._receive(worker, deadline)
+            healthy = True
+
+        except TimeoutError:
+            self._count('timeouts')
+            logger.warning(f"⏱️ DOCX processing exceeded {self.timeout}s - killing worker {worker.process.pid}")
+            raise DocxProcessingLimitError(f'Document processing exceeded the {self.timeout}s time budget')
+
+        except (EOFError, OSError) as e:
+            # The worker died (hard memory exhaustion, OOM killer, native crash)
+            self._count('worker_crashes')
+            logger.error(f"❌ DOCX worker process crashed: {e!r}")
+            raise Exception(f"DOCX worker process terminated unexpectedly: {e!r}")
+
+        finally:
+            self._checkin(worker, healthy)
+
+        if kind == 'error':
+            if isinstance(value, DocxProcessingLimitError):
+                self._count('limit_exceeded')
+            raise value
+        self._count('completed')
+        return value
+
+    def stream(self, task: str, file_path: str, chunk_paragraphs: int = 200) -> Iterator[Dict[str, Any]]:
+        """
+        Run a DOCX task and yield its records as the worker produces them
+
+        The first record is always {'type': 'validation', ...}; for valid files it is
+        followed by 'chunk' records and a final 'metadata' record. The whole stream
+        shares the same time budget as run().
+
+        Raises:
+            DocxProcessingLimitError: the document exceeded its CPU, memory or time budget
+        """
+        if not self.enabled:
+            # In-thread fallback (pool disabled by configuration)
+            yield from _iter_stream_records(DocxService(), task, file_path, chunk_paragraphs)
+            return
+
+        worker = self._checkout()
+        healthy = False
+        deadline = None
+        try:
+            try:
+                deadline = self._start(worker, ('stream', task, file_path, self.max_cpu_seconds, chunk_paragraphs))
+                while True:
+                    kind, value = self._receive(worker, deadline)
+                    if kind != 'record':
+                        break
+                    yield value
+                healthy = True
+
+            except GeneratorExit:
+                # The consumer stopped early (e.g. an invalid file); keep the worker if it is
+                # already done, otherwise it is killed rather than left parsing
+                healthy = deadline is not None and self._drain(worker, min(deadline, time.monotonic() + 1))
+                raise
+
+            except TimeoutError:
+                self._count('timeouts')
+                logger.warning(f"⏱️ DOCX streaming exceeded {self.timeout}s - killing worker {worker.process.pid}")
+                raise DocxProcessingLimitError(f'Document processing exceeded the {self.timeout}s time budget')
+
+            except (EOFError, OSError) as e:
+                self._count('worker_crashes')
+                logger.error(f"❌ DOCX worker process crashed: {e!r}")
+                raise Exception(f"DOCX worker process terminated unexpectedly: {e!r}")
+
+        finally:
+            self._checkin(worker, healthy)
+
+        if kind == 'error':
+            if isinstance(value, DocxProcessingLimitError):
+                self._count('limit_exceeded')
+            raise value
+        self._count('completed')
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool statistics for monitoring"""
+        with self._lock:
+            stats = dict(self._stats)
+            workers = len(self._workers)
+            idle = len(self._idle)
+        return {
+            'enabled': self.enabled,
+            'max_workers': self.max_workers,
+            'timeout_seconds': self.timeout,
+            'max_cpu_seconds': self.max_cpu_seconds,
+            'max_memory_mb': self.max_memory_mb,
+            'running': workers > 0,
+            'workers': workers,
+            'busy': workers - idle,
+            **stats
+        }
+
+    def shutdown(self) -> None:
+        """Stop all worker processes"""
+        with self._lock:
+            workers = self._workers
+            self._workers = []
+            self._idle = []
+        for worker in workers:
+            worker.stop()
+
+
+# Global DOCX process pool instance
+_docx_process_pool: Optional[DocxProcessPool] = None
+
+def get_docx_process_pool() -> DocxProcessPool:
+    """Get the global DOCX process pool instance"""
+    global _docx_process_pool
+    if _docx_process_pool is None:
+        from ..config import config
+        app_config = config['default']()
+        _docx_process_pool = DocxProcessPool(
+            enabled=app_config.DOCX_PROCESS_POOL_ENABLED,
+            max_workers=app_config.DOCX_PROCESS_POOL_WORKERS,
+            timeout=app_config.DOCX_PROCESSING_TIMEOUT,
+            max_cpu_seconds=app_config.DOCX_MAX_CPU_SECONDS,
+            max_memory_mb=app_config.DOCX_MAX_MEMORY_MB
+        )
+    return _docx_process_pool
+
+def init_docx_process_pool(enabled: bool = True, max_workers: int = 1, timeout: int = 60,
+                           max_cpu_seconds: int = 45, max_memory_mb: int = 1024) -> DocxProcessPool:
+    """Initialize the global DOCX process pool with custom configuration"""
+    global _docx_process_pool
+    if _docx_process_pool is not None:
+        _docx_process_pool.shutdown()
+    _docx_process_pool = DocxProcessPool(enabled, max_workers, timeout, max_cpu_seconds, max_memory_mb)
+    return _docx_process_pool
+
+@atexit.register
+def _shutdown_docx_process_pool() -> None:
+    if _docx_process_pool is not None:
+        _docx_process_pool.shutdown()
@@ -6,7 +6,31 @@ from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 import tempfile
 import os
 import re
-from typing import Dict, List, Any, Tuple
+import zipfile
+from typing import Dict, List, Any, Tuple, Iterator, BinaryIO, Union
+
+
+class DocxProcessingLimitError(Exception):
+    """Raised when a document exceeds its CPU, memory or wall-clock processing budget"""
+    pass
+
+
+# Main part content type of a WordprocessingML document (macro-enabled variant included)
+WORDPROCESSINGML_CONTENT_TYPES = (
+    b'application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml',
+    b'application/vnd.ms-word.document.macroEnabled.main+xml',
+)
+DOCUMENT_XML_PART = 'word/document.xml'
+CONTENT_TYPES_PART = '[Content_Types].xml'
+MAX_CONTENT_TYPES_BYTES = 64 * 1024
+DOCUMENT_XML_SAMPLE_BYTES = 256 * 1024
+
+# Tag patterns used to estimate document structure from a raw XML sample
+_PARAGRAPH_TAG = re.compile(rb'<w:p[\s>/]')
+_RUN_TAG = re.compile(rb'<w:r[\s>]')
+_TEXT_TAG = re.compile(rb'<w:t(?:\s[^>]*)?>[^<]*[^<\s]')
+_RUN_FORMATTING_TAG = re.compile(rb'<w:(?:b|i|u|sz|color|highlight)[\s/>]')
+_PARAGRAPH_STYLE_TAG = re.compile(rb'<w:pStyle w:val="([^"]{1,100})"')
 
 
 class DocxService:
@@ -33,6 +57,15 @@ class DocxService:
             14: 'section',   # 14pt+ = section
             12: 'subsection' # 12pt+ = subsection
         }
+        
+        # Outline levels for heading types (matches the client TOC hierarchy)
+        self.heading_levels = {
+            'title': 1,
+            'subtitle': 2,
+            'section': 3,
+            'subsection': 4
+        }
+        self.max_outline_title_length = 100
     
     def extract_content_with_formatting(self, file_path: str) -> Dict[str, Any]:
         """
@@ -42,7 +75,7 @@ class DocxService:
             file_path: Path to the DOCX file
             
         Returns:
-            Dict containing text, formatting_ranges, and comments
+            Dict containing text, formatting_ranges, outline and comments
         """
         try:
             doc = Document(file_path)
@@ -50,6 +83,7 @@ class DocxService:
             result = {
                 'text': '',
                 'formatting_ranges': [],
+                'outline': [],
                 'comments': [],
                 'metadata': {
                     'total_paragraphs': len(doc.paragraphs),
@@ -61,49 +95,149 @@ class DocxService:
             extracted_data = self._extract_text_with_structure(doc)
             result['text'] = extracted_data['text']
             result['formatting_ranges'] = extracted_data['formatting_ranges']
+            result['outline'] = extracted_data['outline']
             
             # Add metadata
             result['metadata']['total_formatting_ranges'] = len(result['formatting_ranges'])
+            result['metadata']['total_headings'] = len(result['outline'])
             result['metadata']['final_text_length'] = len(result['text'])
             result['metadata']['processing_notes'] = extracted_data['processing_notes']
             
             return result
             
+        except DocxProcessingLimitError:
+            raise
+        except MemoryError:
+            raise DocxProcessingLimitError('Document exceeds the memory budget for processing')
         except Exception as e:
             raise Exception(f"Failed to process DOCX file: {str(e)}")
     
-    def _extract_text_with_structure(self, doc) -> Dict[str, Any]:
-        """
-        Enhanced text extraction that preserves DOCX structure and whitespace
+    def iter_content_with_formatting(self, file_path: str, chunk_paragraphs: int = 200) -> Iterator[Dict[str, Any]]:
         """
-        text_parts = []
-        formatting_ranges = []
-        processing_notes = []
+        Stream text and formatting from DOCX file in paragraph chunks
         
-        for para_idx, paragraph in enumerate(doc.paragraphs):
-            # Get paragraph start position in final text
-            para_start_pos = len(''.join(text_parts))
+        Args:
+            file_path: Path to the DOCX file
+            chunk_paragraphs: Number of paragraphs per emitted chunk
+            
+        Yields:
+            'chunk' records (index, offset, text, ranges) as paragraphs are processed,
+            followed by a single 'metadata' record carrying the outline. Offsets and
+            ranges are identical to the ones produced by extract_content_with_formatting().
+        """
+        try:
+            doc = Document(file_path)
+            paragraphs = doc.paragraphs
+            processing_notes = []
+            outline = []
+            
+            chunk_index = 0
+            chunk_offset = 0
+            chunk_parts = []
+            chunk_ranges = []
+            position = 0
+            total_ranges = 0
+            
+            for para_text, para_formatting in self._iter_paragraphs_with_formatting(paragraphs, processing_notes, outline):
+                chunk_parts.append(para_text)
+                chunk_ranges.extend(para_formatting)
+                position += len(para_text)
+                
+                if len(chunk_parts) >= chunk_paragraphs:
+                    chunk = self._build_stream_chunk(chunk_index, chunk_offset, chunk_parts, chunk_ranges, processing_notes)
+                    total_ranges += len(chunk['ranges'])
+                    yield chunk
+                    chunk_index += 1
+                    chunk_offset = position
+                    chunk_parts = []
+                    chunk_ranges = []
+            
+            if chunk_parts:
+                chunk = self._build_stream_chunk(chunk_index, chunk_offset, chunk_parts, chunk_ranges, processing_notes)
+                total_ranges += len(chunk['ranges'])
+                yield chunk
+                chunk_index += 1
             
+            yield {
+                'type': 'metadata',
+                'chunks': chunk_index,
+                'comments': [],
+                'outline': outline,
+                'metadata': {
+                    'total_paragraphs': len(paragraphs),
+                    'total_formatting_ranges': total_ranges,
+                    'total_headings': len(outline),
+                    'final_text_length': position,
+                    'processing_notes': processing_notes
+                }
+            }
+            
+        except DocxProcessingLimitError:
+            raise
+        except MemoryError:
+            raise DocxProcessingLimitError('Document exceeds the memory budget for processing')
+        except Exception as e:
+            raise Exception(f"Failed to process DOCX file: {str(e)}")
+    
+    def _build_stream_chunk(self, index: int, offset: int, parts: List[str], ranges: List[Dict],
+                            processing_notes: List[str]) -> Dict[str, Any]:
+        """Build a streamed chunk record with ranges validated against the chunk end"""
+        text = ''.join(parts)
+        return {
+            'type': 'chunk',
+            'index': index,
+            'offset': offset,
+            'text': text,
+            'ranges': self._validate_formatting_ranges(ranges, text, processing_notes, text_length=offset + len(text))
+        }
+    
+    def _iter_paragraphs_with_formatting(self, paragraphs, processing_notes: List[str],
+                                         outline: List[Dict] = None) -> Iterator[Tuple[str, List[Dict]]]:
+        """
+        Yield (text, formatting_ranges) per paragraph with absolute offsets
+        The paragraph separator newline is included in the yielded text.
+        When outline is given, heading paragraphs are appended to it as they are seen.
+        """
+        last_idx = len(paragraphs) - 1
+        position = 0
+        
+        for para_idx, paragraph in enumerate(paragraphs):
             # Handle empty paragraphs - preserve them as line breaks
             if not paragraph.text.strip():
                 # Add single newline for empty paragraph
-                text_parts.append('\n')
+                position += 1
+                yield '\n', []
                 continue
             
             # Extract runs with enhanced formatting detection
             para_text, para_formatting = self._process_paragraph_enhanced(
-                paragraph, para_start_pos, processing_notes
+                paragraph, position, processing_notes
             )
             
-            # Add paragraph text
-            text_parts.append(para_text)
-            
-            # Add paragraph-level formatting
-            formatting_ranges.extend(para_formatting)
+            if outline is not None:
+                outline_entry = self._build_outline_entry(para_text, position, para_formatting)
+                if outline_entry:
+                    outline.append(outline_entry)
             
             # Add newline after paragraph (except for last paragraph)
-            if para_idx < len(doc.paragraphs) - 1:
-                text_parts.append('\n')
+            if para_idx < last_idx:
+                para_text += '\n'
+            
+            position += len(para_text)
+            yield para_text, para_formatting
+    
+    def _extract_text_with_structure(self, doc) -> Dict[str, Any]:
+        """
+        Enhanced text extraction that preserves DOCX structure and whitespace
+        """
+        text_parts = []
+        formatting_ranges = []
+        processing_notes = []
+        outline = []
+        
+        for para_text, para_formatting in self._iter_paragraphs_with_formatting(doc.paragraphs, processing_notes, outline):
+            text_parts.append(para_text)
+            formatting_ranges.extend(para_formatting)
         
         # Join all text parts
         final_text = ''.join(text_parts)
@@ -116,9 +250,36 @@ class DocxService:
         return {
             'text': final_text,
             'formatting_ranges': validated_ranges,
+            'outline': outline,
             'processing_notes': processing_notes
         }
     
+    def _build_outline_entry(self, para_text: str, para_start_pos: int, para_formatting: List[Dict]) -> Dict[str, Any]:
+        """
+        Build a table-of-contents entry for a heading paragraph
+        Uses the highest-level heading range in the paragraph; returns None for body text
+        """
+        heading_ranges = [r for r in para_formatting if r['type'] in self.heading_levels]
+        if not heading_ranges:
+            return None
+        
+        heading = min(heading_ranges, key=lambda r: (self.heading_levels[r['type']], r['start']))
+        para_end = para_start_pos + len(para_text)
+        start = max(heading['start'], para_start_pos)
+        end = min(heading['end'], para_end)
+        
+        title = ' '.join(para_text[start - para_start_pos:end - para_start_pos].split())
+        if not title:
+            return None
+        
+        return {
+            'level': self.heading_levels[heading['type']],
+            'type': heading['type'],
+            'title': title[:self.max_outline_title_length],
+            'start': start,
+            'end': end
+        }
+    
     def _process_paragraph_enhanced(self, paragraph, para_start_pos: int, processing_notes: List[str]) -> Tuple[str, List[Dict]]:
         """
         Enhanced paragraph processing with better run handling
@@ -286,11 +447,14 @@ class DocxService:
                 return heading_type
         return None
     
-    def _validate_formatting_ranges(self, formatting_ranges: List[Dict], text: str, processing_notes: List[str]) -> List[Dict]:
+    def _validate_formatting_ranges(self, formatting_ranges: List[Dict], text: str, processing_notes: List[str],
+                                    text_length: int = None) -> List[Dict]:
         """
         Validate and fix formatting ranges against final text
+        text_length overrides len(text) when validating a streamed chunk with absolute offsets
         """
-        text_length = len(text)
+        if text_length is None:
+            text_length = len(text)
         valid_ranges = []
         
         processing_notes.append(f"Validating {len(formatting_ranges)} ranges against text length {text_length}")
@@ -344,6 +508,10 @@ class DocxService:
                 'estimated_size': 'small' if len(doc.paragraphs) < 100 else 'medium' if len(doc.paragraphs) < 500 else 'large'
             }
             
+        except DocxProcessingLimitError:
+            raise
+        except MemoryError:
+            raise DocxProcessingLimitError('Document exceeds the memory budget for processing')
         except Exception as e:
             return {
                 'valid': False,
@@ -351,6 +519,102 @@ class DocxService:
                 'error_type': type(e).__name__
             }
     
+    def inspect_docx_archive(self, source: Union[str, BinaryIO],
+                             sample_bytes: int = DOCUMENT_XML_SAMPLE_BYTES) -> Dict[str, Any]:
+        """
+        Validate a DOCX file and estimate its size from the zip container alone
+        
+        Only the central directory, [Content_Types].xml and the first
+        sample_bytes of word/document.xml are read, so this never builds the
+        python-docx object model. Paragraph and run counts are extrapolated
+        from the sample when the document part is larger than it.
+        
+        Args:
+            source: Path or seekable binary file object
+            sample_bytes: Maximum decompressed bytes of document.xml to scan
+            
+        Returns:
+            Dict with validation results and estimates
+        """
+        try:
+            with zipfile.ZipFile(source) as archive:
+                try:
+                    content_types_info = archive.getinfo(CONTENT_TYPES_PART)
+                    document_info = archive.getinfo(DOCUMENT_XML_PART)
+                except KeyError:
+                    return {
+                        'valid': False,
+                        'error': 'Not a Word document (missing document part)',
+                        'error_type': 'MissingPart'
+                    }
+                
+                if document_info.flag_bits & 0x1 or content_types_info.flag_bits & 0x1:
+                    return {
+                        'valid': False,
+                        'error': 'Encrypted documents are not supported',
+                        'error_type': 'EncryptedDocument'
+                    }
+                
+                with archive.open(content_types_info) as content_types_file:
+                    content_types = content_types_file.read(MAX_CONTENT_TYPES_BYTES)
+                if not any(content_type in content_types for content_type in WORDPROCESSINGML_CONTENT_TYPES):
+                    return {
+                        'valid': False,
+                        'error': 'Not a Word document (unexpected content type)',
+                        'error_type': 'InvalidContentType'
+                    }
+                
+                with archive.open(document_info) as document_file:
+                    sample = document_file.read(sample_bytes)
+        
+        except zipfile.BadZipFile as e:
+            return {
+                'valid': False,
+                'error': f'File is not a valid DOCX archive: {e}',
+                'error_type': 'BadZipFile'
+            }
+        except Exception as e:
+            return {
+                'valid': False,
+                'error': str(e),
+                'error_type': type(e).__name__
+            }
+        
+        document_size = document_info.file_size
+        truncated = document_size > len(sample)
+        scale = document_size / len(sample) if truncated and sample else 1.0
+        
+        # Runs are split on their opening tag so formatting is counted once per run
+        run_segments = _RUN_TAG.split(sample)[1:]
+        sample_runs = len(run_segments)
+        sample_formatted_runs = sum(
+            1 for segment in run_segments
+            if _RUN_FORMATTING_TAG.search(segment.split(b'</w:r>', 1)[0])
+        )
+        
+        paragraphs = int(len(_PARAGRAPH_TAG.findall(sample)) * scale)
+        total_runs = int(sample_runs * scale)
+        formatted_runs = int(sample_formatted_runs * scale)
+        styles_used = sorted({
+            style.decode('utf-8', errors='replace')
+            for style in _PARAGRAPH_STYLE_TAG.findall(sample)
+        })
+        
+        return {
+            'valid': True,
+            'estimated': truncated,
+            'paragraphs': paragraphs,
+            'total_runs': total_runs,
+            'formatted_runs': formatted_runs,
+            'formatting_density': sample_formatted_runs / max(sample_runs, 1),
+            'has_content': bool(_TEXT_TAG.search(sample)),
+            'styles_used': styles_used,
+            'document_xml_size': document_size,
+            'document_xml_compressed_size': document_info.compress_size,
+            'estimated_processing_time': self._estimate_processing_time(paragraphs, formatted_runs),
+            'estimated_size': 'small' if paragraphs < 100 else 'medium' if paragraphs < 500 else 'large'
+        }
+    
     def get_processing_info(self, file_path: str) -> Dict[str, Any]:
         """Get information about DOCX file for processing estimates"""
         try:
@@ -439,5 +703,9 @@ class DocxService:
                 }
             }
             
+        except DocxProcessingLimitError:
+            raise
+        except MemoryError:
+            raise DocxProcessingLimitError('Document exceeds the memory budget for processing')
         except Exception as e:
             raise Exception(f"Failed to extract text from DOCX file: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,310 @@
+# AudioBook Organizer - Formatting Render Service
+
+"""
+Server-side rendering of book text plus formatting ranges into HTML segments.
+
+Large DOCX imports carry tens of thousands of formatting ranges, and applying
+all of them to the whole book in the browser is slow. This service turns
+text + ranges into pre-rendered, sanitised HTML split into fixed-size
+segments with stable character offsets. Rendered output is cached on disk
+under a content hash so every gunicorn worker can serve any segment, and the
+client fetches segments lazily as they scroll into view.
+
+The text content of every segment's HTML is exactly text[start:end], so DOM
+offset calculations on the client keep working after hydration.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from html import escape
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bump when the generated markup changes so stale cache entries are not reused
+RENDERER_VERSION = 1
+
+# Formatting types rendered as plain styled spans (class fmt-<type>), in class order.
+# Links, images, tables and lists need client-side DOM handling and are not rendered here.
+RENDERABLE_TYPES = (
+    'title', 'subtitle', 'section', 'subsection', 'heading',
+    'quote', 'bold', 'italic', 'underline'
+)
+_TYPE_ORDER = {format_type: order for order, format_type in enumerate(RENDERABLE_TYPES)}
+
+MANIFEST_FILE = 'manifest.json'
+PRUNE_INTERVAL_SECONDS = 3600
+
+
+class FormattingRenderService:
+    """Renders formatted book text into cached, sanitised HTML segments"""
+
+    def __init__(self, cache_folder: str, segment_size: int = 20000, cache_max_age_hours: int = 24):
+        self.cache_folder = cache_folder
+        self.segment_size = max(1000, segment_size)
+        self.cache_max_age = cache_max_age_hours * 3600
+        # Segment ends snap to the next newline within this many characters
+        self.boundary_slack = self.segment_size // 10
+        self._last_prune = 0.0
+        self._prune_lock = threading.Lock()
+
+    def content_hash(self, text: str, ranges: List[Dict]) -> str:
+        """Hash of everything that affects the rendered output"""
+        digest = hashlib.sha256()
+        digest.update(f'v{RENDERER_VERSION}:{self.segment_size}:'.encode('utf-8'))
+        digest.update(text.encode('utf-8', errors='surrogatepass'))
+        digest.update(b'\0')
+        digest.update(json.dumps(ranges, separators=(',', ':')).encode('utf-8'))
+        return digest.hexdigest()
+
+    def render(self, text: str, ranges: List[Dict]) -> Dict[str, Any]:
+        """
+        Render text and formatting ranges into cached HTML segments
+
+        Returns:
+            Manifest dict with content_hash, text_length and segment offsets.
+            Segment HTML is fetched separately via get_segment().
+        """
+        normalized_ranges = self._normalize_ranges(ranges, len(text))
+        content_hash = self.content_hash(text, normalized_ranges)
+
+        manifest = self._read_manifest(content_hash)
+        if manifest is not None:
+            return manifest
+
+        bounds = self._segment_bounds(text)
+        html_segments = self._render_segments(text, normalized_ranges, bounds)
+
+        manifest = {
+            'content_hash': content_hash,
+            'renderer_version': RENDERER_VERSION,
+            'segment_size': self.segment_size,
+            'text_length': len(text),
+            'ranges_rendered': len(normalized_ranges),
+            'segments': [
+                {'index': index, 'start': start, 'end': end}
+                for index, (start, end) in enumerate(bounds)
+            ]
+        }
+        self._write_cache_entry(content_hash, manifest, html_segments)
+        self._maybe_prune_cache()
+
+        logger.info(f"🎨 Rendered {len(bounds)} formatting segments ({len(normalized_ranges)} ranges) for {content_hash[:12]}")
+        return manifest
+
+    def get_segment(self, content_hash: str, index: int) -> Optional[Dict[str, Any]]:
+        """Get one cached segment, or None if it was never rendered or has been pruned"""
+        if not self._is_valid_hash(content_hash) or index < 0:
+            return None
+
+        manifest = self._read_manifest(content_hash)
+        if manifest is None or index >= len(manifest['segments']):
+            return None
+
+        try:
+            with open(os.path.join(self._entry_dir(content_hash), f'{index}.html'), 'r', encoding='utf-8') as f:
+                html = f.read()
+        except OSError:
+            return None
+
+        segment = dict(manifest['segments'][index])
+        segment['html'] = html
+        return segment
+
+    def _normalize_ranges(self, ranges: List[Dict], text_length: int) -> List[Dict]:
+        """Keep renderable ranges with valid bounds, clamped to the text"""
+        normalized = []
+        for range_obj in ranges or []:
+            if not isinstance(range_obj, dict):
+                continue
+            format_type = range_obj.get('type')
+            start = range_obj.get('start')
+            end = range_obj.get('end')
+            if format_type not in _TYPE_ORDER:
+                continue
+            if not isinstance(start, int) or not isinstance(end, int) or isinstance(start, bool):
+                continue
+            start = max(0, start)
+            end = min(text_length, end)
+            if start < end:
+                normalized.append({'start': start, 'end': end, 'type': format_type})
+
+        normalized.sort(key=lambda r: (r['start'], r['end'], _TYPE_ORDER[r['type']]))
+        return normalized
+
+    def _segment_bounds(self, text: str) -> List[Tuple[int, int]]:
+        """Split text into fixed-size segments, ending each at a line break when one is close"""
+        text_length = len(text)
+        if text_length == 0:
+            return [(0, 0)]
+
+        bounds = []
+        start = 0
+        while start < text_length:
+            end = min(start + self.segment_size, text_length)
+            if end < text_length:
+                newline = text.find('\n', end, end + self.boundary_slack)
+                if newline != -1:
+                    end = newline + 1
+            bounds.append((start, end))
+            start = end
+        return bounds
+
+    def _render_segments(self, text: str, ranges: List[Dict], bounds: List[Tuple[int, int]]) -> List[str]:
+        """Single sweep over range boundaries, emitting escaped spans per segment"""
+        # Boundary events: position -> list of (type, +1/-1)
+        events: Dict[int, List[Tuple[str, int]]] = {}
+        for range_obj in ranges:
+            events.setdefault(range_obj['start'], []).append((range_obj['type'], 1))
+            events.setdefault(range_obj['end'], []).append((range_obj['type'], -1))
+
+        points = sorted(set(events) | {start for start, _ in bounds} | {end for _, end in bounds})
+        active = dict.fromkeys(RENDERABLE_TYPES, 0)
+
+        html_segments = []
+        segment_index = 0
+        segment_end = bounds[0][1]
+        parts: List[str] = []
+
+        for point_index, position in enumerate(points):
+            for format_type, delta in events.get(position, ()):
+                active[format_type] += delta
+
+            # Close every segment that ends here (empty segments only for empty text)
+            while segment_index < len(bounds) and position >= segment_end:
+                html_segments.append(''.join(parts))
+                parts = []
+                segment_index += 1
+                if segment_index < len(bounds):
+                    segment_end = bounds[segment_index][1]
+
+            if point_index + 1 >= len(points):
+                break
+
+            piece_end = points[point_index + 1]
+            piece = self._escape_text(text[position:piece_end])
+            if not piece:
+                continue
+
+            types = [format_type for format_type in RENDERABLE_TYPES if active[format_type] > 0]
+            if types:
+                classes = ' '.join(f'fmt-{format_type}' for format_type in types)
+                formatting_id = f'docx-s{segment_index}-{len(parts)}'
+                parts.append(
+                    f'<span class="{classes}" data-formatting-id="{formatting_id}" '
+                    f'data-format-types="{",".join(types)}">{piece}</span>'
+                )
+            else:
+                parts.append(piece)
+
+        while len(html_segments) < len(bounds):
+            html_segments.append(''.join(parts))
+            parts = []
+
+        return html_segments
+
+    def _escape_text(self, text: str) -> str:
+        """Escape text for element content; CR is encoded so HTML parsing keeps it"""
+        return escape(text, quote=False).replace('\r', '&#13;')
+
+    def _is_valid_hash(self, content_hash: str) -> bool:
+        return len(content_hash) == 64 and all(c in '0123456789abcdef' for c in content_hash)
+
+    def _entry_dir(self, content_hash: str) -> str:
+        return os.path.join(self.cache_folder, content_hash[:2], content_hash)
+
+    def _read_manifest(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        manifest_path = os.path.join(self._entry_dir(content_hash), MANIFEST_FILE)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            # Touch the entry so pruning keeps segments that are still being read
+            os.utime(manifest_path)
+            return manifest
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache_entry(self, content_hash: str, manifest: Dict[str, Any], html_segments: List[str]) -> None:
+        """Write segments then the manifest; the manifest marks the entry as complete"""
+        entry_dir = self._entry_dir(content_hash)
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            for index, html in enumerate(html_segments):
+                self._atomic_write(os.path.join(entry_dir, f'{index}.html'), html)
+            self._atomic_write(os.path.join(entry_dir, MANIFEST_FILE), json.dumps(manifest))
+        except OSError as e:
+            logger.error(f"❌ Failed to write render cache entry {content_hash[:12]}: {e}")
+            raise
+
+    def _atomic_write(self, path: str, content: str) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _maybe_prune_cache(self) -> None:
+        """Remove entries not read within cache_max_age (at most once per hour per process)"""
+        now = time.time()
+        if now - self._last_prune < PRUNE_INTERVAL_SECONDS or not self._prune_lock.acquire(blocking=False):
+            return
+
+        try:
+            self._last_prune = now
+            removed = 0
+            for prefix in os.listdir(self.cache_folder):
+                prefix_dir = os.path.join(self.cache_folder, prefix)
+                if not os.path.isdir(prefix_dir):
+                    continue
+                for content_hash in os.listdir(prefix_dir):
+                    entry_dir = os.path.join(prefix_dir, content_hash)
+                    try:
+                        last_used = os.path.getmtime(os.path.join(entry_dir, MANIFEST_FILE))
+                    except OSError:
+                        # Incomplete entry - only remove it once it is clearly abandoned
+                        last_used = os.path.getmtime(entry_dir)
+                    if now - last_used > self.cache_max_age:
+                        shutil.rmtree(entry_dir, ignore_errors=True)
+                        removed += 1
+            if removed:
+                logger.info(f"🧹 Pruned {removed} render cache entries")
+        except OSError as e:
+            logger.warning(f"⚠️ Render cache prune failed: {e}")
+        finally:
+            self._prune_lock.release()
+
+
+# Global instance
+_formatting_render_service = None
+
+def get_formatting_render_service() -> FormattingRenderService:
+    """Get the global formatting render service instance"""
+    global _formatting_render_service
+    if _formatting_render_service is None:
+        from ..config import config
+        app_config = config['default']()
+        _formatting_render_service = FormattingRenderService(
+            cache_folder=app_config.RENDER_CACHE_FOLDER,
+            segment_size=app_config.RENDER_SEGMENT_SIZE,
+            cache_max_age_hours=app_config.RENDER_CACHE_MAX_AGE_HOURS
+        )
+    return _formatting_render_service
+
+def init_formatting_render_service(cache_folder: str, segment_size: int = 20000,
+                                   cache_max_age_hours: int = 24) -> FormattingRenderService:
+    """Initialize the global formatting render service with custom configuration"""
+    global _formatting_render_service
+    _formatting_render_service = FormattingRenderService(cache_folder, segment_size, cache_max_age_hours)
+    return _formatting_render_service
@@ -0,0 +1,163 @@
+# AudioBook Organizer - I/O Executor
+
+"""
+Shared thread pool for fanning out blocking I/O (database and HTTP calls).
+
+Callers that ran a few independent queries in parallel used to create a fresh
+ThreadPoolExecutor per call, starting and joining threads on every request. This
+executor lives as long as the process, with a fixed number of threads started
+lazily (after gunicorn forks).
+
+It is bounded: at most max_pending calls are queued or running. When it is full,
+or when a task running on the executor fans out again, the call runs in the
+calling thread instead of waiting for a free thread, so the executor can neither
+grow without limit nor deadlock on nested calls.
+
+Tasks run in a copy of the caller's context, so a task submitted while handling
+a request still sees its Flask application context (current_app, g).
+"""
+
+import atexit
+import concurrent.futures
+import contextvars
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+THREAD_NAME_PREFIX = 'io-executor'
+
+
+class IOExecutor:
+    """Long-lived, bounded thread pool for blocking I/O fan-out"""
+
+    def __init__(self, max_workers: int = 8, max_pending: int = 64):
+        """
+        Args:
+            max_workers: Threads in the pool
+            max_pending: Calls queued or running at once; beyond this they run inline
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(self.max_workers, max_pending)
+
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._local = threading.local()
+
+        # Counters for monitoring
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'inline': 0
+        }
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """Create the executor lazily so no threads start before gunicorn forks"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=THREAD_NAME_PREFIX
+                )
+                logger.info(f"🧵 I/O executor started ({self.max_workers} thread(s), {self.max_pending} pending max)")
+            return self._executor
+
+    def _run(self, context: contextvars.Context, fn: Callable, args, kwargs) -> Any:
+        self._local.in_executor = True
+        try:
+            result = context.run(fn, *args, **kwargs)
+            self._count('completed')
+            return result
+        except BaseException:
+            self._count('failed')
+            raise
+        finally:
+            self._local.in_executor = False
+            self._slots.release()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> concurrent.futures.Future:
+        """Run fn(*args, **kwargs) on the pool, or inline when the pool is full"""
+        if getattr(self._local, 'in_executor', False) or not self._slots.acquire(blocking=False):
+            self._count('inline')
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+
+        self._count('submitted')
+        try:
+            return self._get_executor().submit(self._run, contextvars.copy_context(), fn, args, kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def gather(self, *calls: Callable[[], Any]) -> List[Any]:
+        """
+        Run independent calls in parallel and return their results in order
+
+        The last call runs in the calling thread while the others are on the
+        pool. The first exception raised by a call is re-raised.
+        """
+        if not calls:
+            return []
+        futures = [self.submit(call) for call in calls[:-1]]
+        last = calls[-1]()
+        return [future.result() for future in futures] + [last]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get executor statistics for monitoring"""
+        with self._lock:
+            stats = dict(self._stats)
+            started = self._executor is not None
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'started': started,
+            'pending': stats['submitted'] - stats['completed'] - stats['failed'],
+            **stats
+        }
+
+    def shutdown(self) -> None:
+        """Wait for running calls and stop the threads"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# Global I/O executor instance
+_io_executor: Optional[IOExecutor] = None
+
+def get_io_executor() -> IOExecutor:
+    """Get the global I/O executor instance"""
+    global _io_executor
+    if _io_executor is None:
+        from ..config import config
+        app_config = config['default']()
+        _io_executor = IOExecutor(
+            max_workers=app_config.IO_EXECUTOR_WORKERS,
+            max_pending=app_config.IO_EXECUTOR_MAX_PENDING
+        )
+    return _io_executor
+
+def init_io_executor(max_workers: int = 8, max_pending: int = 64) -> IOExecutor:
+    """Initialize the global I/O executor with custom configuration"""
+    global _io_executor
+    if _io_executor is not None:
+        _io_executor.shutdown()
+    _io_executor = IOExecutor(max_workers, max_pending)
+    return _io_executor
+
+@atexit.register
+def _shutdown_io_executor() -> None:
+    if _io_executor is not None:
+        _io_executor.shutdown()
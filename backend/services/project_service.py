@@ -0,0 +1,728 @@
+"""
+Project Service - persistence of user projects in audiobook_projects
+Handles full saves, versioned delta saves and loading of the latest project
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from postgrest.exceptions import APIError
+
+from ..utils.json_patch import apply_patch
+from ..utils.project_blob import (
+    build_project_summary, decode_project_blob, encode_project_blob, resolve_codec, serialize_project
+)
+from ..utils.project_parts import PROJECT_PARTS, merge_project_parts, split_project_parts
+
+logger = logging.getLogger(__name__)
+
+PROJECTS_TABLE = 'audiobook_projects'
+PROJECT_PARTS_TABLE = 'audiobook_project_parts'
+DEFAULT_PROJECT_TITLE = 'Auto-saved Project'
+SAVE_PROJECT_RPC = 'save_audiobook_project'
+SAVE_PROJECT_PARTS_RPC = 'save_audiobook_project_parts'
+
+# PostgREST / Postgres codes for "function does not exist" and "column does not exist"
+MISSING_FUNCTION_ERROR_CODES = ('PGRST202', '42883')
+MISSING_COLUMN_ERROR_CODES = ('42703', 'PGRST204')
+MISSING_RELATION_ERROR_CODES = ('PGRST200', 'PGRST205', '42P01')
+
+# Compressed-storage columns added by migration 19
+BLOB_COLUMNS = ('settings_blob', 'settings_encoding')
+# Columns of the embedded part rows added by migration 20
+PART_COLUMNS = 'part, content, content_blob, content_encoding, content_hash, version'
+
+# Fields the client refreshes on every save; they do not count as a content change
+VOLATILE_PROJECT_FIELDS = ('timestamp',)
+VOLATILE_METADATA_FIELDS = ('lastModified',)
+
+class ProjectNotFoundError(Exception):
+    """Raised when the user has no stored project to patch"""
+    pass
+
+class ProjectVersionConflict(Exception):
+    """Raised when a delta save was computed against an outdated version"""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Project is at version {current_version}")
+        self.current_version = current_version
+
+class ProjectPreconditionFailed(Exception):
+    """Raised when a save's If-Match hash does not match the stored project"""
+
+    def __init__(self, current_version: Optional[int], content_hash: Optional[str]):
+        super().__init__(f"Stored project hash is {content_hash}")
+        self.current_version = current_version
+        self.content_hash = content_hash
+
+class StaleProjectWrite(Exception):
+    """Raised when a save is older than the project state already accepted for the user"""
+
+    def __init__(self, current_version: Optional[int], content_hash: Optional[str]):
+        super().__init__(f"A newer save (version {current_version}) is already pending")
+        self.current_version = current_version
+        self.content_hash = content_hash
+
+class ProjectService:
+    """Reads and writes the per-user auto-saved project"""
+
+    def __init__(self, compression: str = 'none', compression_min_bytes: int = 16384,
+                 part_hash_cache_size: int = 1000):
+        """
+        Args:
+            compression: 'none', 'gzip' or 'zstd' (zstd falls back to gzip when
+                         zstandard is not installed); requires migration 19
+            compression_min_bytes: Projects (or project parts) smaller than this stay plain JSONB
+            part_hash_cache_size: Users whose stored part hashes are remembered, so
+                                  unchanged parts are not even sent to the database
+        """
+        self.compression = resolve_codec(compression)
+        self.compression_min_bytes = compression_min_bytes
+
+        # Cleared the first time the save RPCs / blob columns / parts table turn out to be missing
+        self._parts_rpc_available = True
+        self._parts_version_available = True
+        self._save_rpc_available = True
+        self._blob_columns_available = True
+        self._parts_table_available = True
+
+        # user_id -> {part: content_hash} as last written or read by this worker
+        self._part_hashes: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._part_hashes_lock = threading.Lock()
+        self.part_hash_cache_size = part_hash_cache_size
+
+        # Optional ProjectWriteBuffer; when set, saves are acknowledged from its spool
+        # and written to the database by its flusher
+        self.write_buffer = None
+
+        # Size and latency counters for monitoring
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'blobs_encoded': 0,
+            'raw_bytes': 0,
+            'stored_bytes': 0,
+            'encode_ms': 0.0,
+            'blobs_decoded': 0,
+            'decode_ms': 0.0,
+            'parts_written': 0,
+            'parts_skipped': 0
+        }
+
+    def _record_stats(self, **increments) -> None:
+        with self._stats_lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get compression statistics for monitoring"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        encoded = stats['blobs_encoded']
+        decoded = stats['blobs_decoded']
+        return {
+            'compression': self.compression,
+            'compression_min_bytes': self.compression_min_bytes,
+            **stats,
+            'encode_ms': round(stats['encode_ms'], 1),
+            'decode_ms': round(stats['decode_ms'], 1),
+            'compression_ratio': round(stats['stored_bytes'] / stats['raw_bytes'], 3) if stats['raw_bytes'] else None,
+            'avg_encode_ms': round(stats['encode_ms'] / encoded, 2) if encoded else None,
+            'avg_decode_ms': round(stats['decode_ms'] / decoded, 2) if decoded else None
+        }
+
+    def compute_content_hash(self, project_data: Dict[str, Any]) -> str:
+        """sha256 of the canonical project JSON, ignoring per-save timestamps"""
+        canonical = {k: v for k, v in project_data.items() if k not in VOLATILE_PROJECT_FIELDS}
+        project_metadata = canonical.get('projectMetadata')
+        if isinstance(project_metadata, dict):
+            canonical['projectMetadata'] = {
+                k: v for k, v in project_metadata.items() if k not in VOLATILE_METADATA_FIELDS
+            }
+        return self._hash_json(canonical)
+
+    def _hash_json(self, data: Any) -> str:
+        encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8', errors='surrogatepass')).hexdigest()
+
+    def _project_title(self, project_data: Dict[str, Any]) -> str:
+        """Generate project title from bookText (first line, max 50 characters)"""
+        book_text = project_data.get('bookText', '')
+        text_ref = project_data.get('bookTextRef')
+        if not book_text and isinstance(text_ref, dict) and text_ref.get('title'):
+            # Texts in the book text store carry the same title, computed when stored
+            return text_ref['title']
+        project_title = DEFAULT_PROJECT_TITLE
+        if book_text and len(book_text.strip()) > 0:
+            first_line = book_text.split('\n')[0].strip()
+            if first_line:
+                project_title = first_line[:50] + ('...' if len(first_line) > 50 else '')
+        return project_title
+
+    def _project_description(self, project_data: Dict[str, Any]) -> str:
+        return f'Auto-saved project ({len(project_data.get("chapters", []))} chapters)'
+
+    def build_project_record(self, user_id: str, project_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the audiobook_projects row for a complete project payload"""
+        record = {
+            'user_id': user_id,
+            'title': self._project_title(project_data),
+            'description': self._project_description(project_data),
+            'status': 'draft',
+            'settings': project_data,  # Store complete project data in settings field
+            'chapters': project_data.get('chapters', []),  # Also store in dedicated field for queries
+            'content_hash': self.compute_content_hash(project_data)
+        }
+
+        if self.compression != 'none':
+            record.update(self._build_blob_fields(project_data))
+            if record['settings_blob'] is not None:
+                # The blob replaces both JSONB copies; the summary keeps the row queryable
+                record['settings'] = {}
+                record['chapters'] = []
+
+        return record
+
+    def _build_blob_fields(self, project_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Compressed-storage columns; blob fields are None for projects below the size threshold"""
+        raw = serialize_project(project_data)
+        fields = {
+            'settings_blob': None,
+            'settings_encoding': None,
+            'settings_size': len(raw),
+            'summary': build_project_summary(project_data)
+        }
+        encoded = self._compress(raw, 'Project')
+        if encoded:
+            fields['settings_blob'], fields['settings_encoding'] = encoded
+        return fields
+
+    def _compress(self, raw: bytes, label: str) -> Optional[tuple]:
+        """(blob, encoding) for serialized JSON at or above the size threshold, else None"""
+        if self.compression == 'none' or len(raw) < self.compression_min_bytes:
+            return None
+
+        started = time.perf_counter()
+        blob, encoding = encode_project_blob(raw, self.compression)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._record_stats(blobs_encoded=1, raw_bytes=len(raw), stored_bytes=len(blob), encode_ms=elapsed_ms)
+        logger.info(f"🗜️ {label} compressed {len(raw) // 1024}KB -> {len(blob) // 1024}KB "
+                    f"({encoding}, {elapsed_ms:.1f}ms)")
+        return blob, encoding
+
+    def _decompress(self, blob: str, encoding: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        data = decode_project_blob(blob, encoding)
+        self._record_stats(blobs_decoded=1, decode_ms=(time.perf_counter() - started) * 1000)
+        return data
+
+    def decode_project_row(self, row: Dict[str, Any], parts: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Turn a selected project row into {..., 'settings': project data, 'parts': part info}
+
+        Projects stored in parts are assembled from their part rows; older projects
+        come from settings (or its compressed blob) and are split on the fly when only
+        some parts were requested. 'parts' maps each returned part to its version and
+        hash, and is None for projects not yet stored in parts.
+        """
+        part_rows = row.pop(PROJECT_PARTS_TABLE, None) or []
+        blob = row.pop('settings_blob', None)
+        encoding = row.pop('settings_encoding', None)
+
+        if part_rows:
+            contents = []
+            row['parts'] = {}
+            for part_row in sorted(part_rows, key=lambda r: PROJECT_PARTS.index(r['part'])):
+                if part_row.get('content_encoding') and part_row.get('content_blob'):
+                    contents.append(self._decompress(part_row['content_blob'], part_row['content_encoding']))
+                else:
+                    contents.append(part_row.get('content') or {})
+                row['parts'][part_row['part']] = {
+                    'version': part_row.get('version'),
+                    'content_hash': part_row.get('content_hash')
+                }
+            row['settings'] = merge_project_parts(contents)
+            if len(row['parts']) == len(PROJECT_PARTS):
+                self._remember_part_hashes(row.get('user_id'), {
+                    name: info['content_hash'] for name, info in row['parts'].items()
+                })
+            return row
+
+        if encoding and blob:
+            row['settings'] = self._decompress(blob, encoding)
+        if parts:
+            split = split_project_parts(row.get('settings') or {})
+            row['settings'] = merge_project_parts(split[name] for name in parts)
+        row['parts'] = None
+        return row
+
+    def _select_project(self, client, user_id: str, columns: str, latest: bool = False,
+                        parts: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Select the user's project row with its part rows and compressed settings, decoded
+
+        Part rows and blob columns are only requested while the database has them; a
+        database without migration 19 or 20 is detected once and then queried without them.
+        """
+        while True:
+            select_columns = f"user_id, {columns}"
+            if self._blob_columns_available:
+                select_columns += f", {', '.join(BLOB_COLUMNS)}"
+            if self._parts_table_available:
+                select_columns += f", {PROJECT_PARTS_TABLE}({PART_COLUMNS})"
+
+            try:
+                row = self._select_project_row(client, user_id, select_columns, latest, parts)
+                return self.decode_project_row(row, parts) if row else None
+            except APIError as e:
+                if e.code in MISSING_RELATION_ERROR_CODES and self._parts_table_available:
+                    self._parts_table_available = False
+                    logger.warning("⚠️ Project parts table not found, reading whole projects only")
+                elif e.code in MISSING_COLUMN_ERROR_CODES and self._blob_columns_available:
+                    self._blob_columns_available = False
+                    logger.warning("⚠️ Compressed project columns not found, reading settings only")
+                else:
+                    raise
+
+    def _select_project_row(self, client, user_id: str, columns: str, latest: bool,
+                            parts: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        query = client.table(PROJECTS_TABLE)\
+            .select(columns)\
+            .eq('user_id', user_id)
+        if parts and self._parts_table_available:
+            # Filters the embedded part rows only, not the project row
+            query = query.in_(f'{PROJECT_PARTS_TABLE}.part', parts)
+        if latest:
+            query = query.order('updated_at', desc=True).limit(1)
+        result = query.execute()
+        return result.data[0] if result.data else None
+
+    def _get_known_part_hashes(self, user_id: str) -> Dict[str, str]:
+        with self._part_hashes_lock:
+            known = self._part_hashes.get(user_id)
+            if known is None:
+                return {}
+            self._part_hashes.move_to_end(user_id)
+            return dict(known)
+
+    def _remember_part_hashes(self, user_id: Optional[str], part_hashes: Optional[Dict[str, str]]) -> None:
+        """Record (or with None, forget) the part hashes stored for a user"""
+        if not user_id:
+            return
+        with self._part_hashes_lock:
+            if part_hashes is None:
+                self._part_hashes.pop(user_id, None)
+                return
+            self._part_hashes[user_id] = dict(part_hashes)
+            self._part_hashes.move_to_end(user_id)
+            while len(self._part_hashes) > self.part_hash_cache_size:
+                self._part_hashes.popitem(last=False)
+
+    def save_project(self, client, user_id: str, project_data: Dict[str, Any],
+                     if_match: Optional[Any] = None) -> Dict[str, Any]:
+        """
+        Save a complete project, replacing whatever is stored
+
+        The save is a single RPC call: the If-Match check, unchanged-content skip and
+        insert-or-update all happen in one statement keyed on the unique user_id, so
+        concurrent saves cannot create duplicate rows. Projects are stored as separate
+        parts (text, structure, annotations) and only parts whose content changed
+        are written.
+
+        Args:
+            if_match: Optional werkzeug ETags from the If-Match header; the save only
+                      proceeds if the stored project's hash is one of them
+
+        Returns:
+            Dict with the project id, version and content_hash; 'unchanged' is True
+            when the stored project already had this content and nothing was written
+
+        Raises:
+            ProjectPreconditionFailed: If-Match did not match the stored project
+        """
+        if_match_hashes = None
+        if if_match:
+            if_match_hashes = ['*'] if if_match.star_tag else list(if_match)
+        if self.write_buffer is not None:
+            return self.write_buffer.save(client, user_id, project_data, if_match_hashes)
+        return self._write_project(client, user_id, project_data, if_match_hashes)
+
+    def _write_project(self, client, user_id: str, project_data: Dict[str, Any],
+                       if_match_hashes: Optional[List[str]], version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Write through the newest save path the database supports
+
+        Args:
+            version: Version to store instead of the next one (write-behind flushes);
+                     only honoured by the parts RPC from migration 21, and dropped
+                     while that migration is not applied
+        """
+        if self._parts_rpc_available:
+            try:
+                return self._save_project_parts(client, user_id, project_data, if_match_hashes, version)
+            except APIError as e:
+                if e.code not in MISSING_FUNCTION_ERROR_CODES or not self._parts_table_missing(client):
+                    # With the parts table in place, whole-project saves would leave stale
+                    # part rows that reads still prefer, so never fall back past it
+                    raise
+                # Migration 20 not applied yet - store the project as one document
+                self._parts_rpc_available = False
+                self._parts_table_available = False
+                logger.warning("⚠️ save_audiobook_project_parts RPC not found, saving whole projects")
+
+        project_record = self.build_project_record(user_id, project_data)
+
+        if self._save_rpc_available:
+            try:
+                return self._save_project_rpc(client, project_record, if_match_hashes)
+            except APIError as e:
+                if e.code not in MISSING_FUNCTION_ERROR_CODES:
+                    raise
+                # Migration 18 not applied yet - fall back to the select-then-write save
+                self._save_rpc_available = False
+                logger.warning("⚠️ save_audiobook_project RPC not found, using two-step project saves")
+
+        return self._save_project_two_step(client, project_record, if_match_hashes)
+
+    def _parts_table_missing(self, client) -> bool:
+        """Whether the project parts table from migration 20 is missing"""
+        try:
+            client.table(PROJECT_PARTS_TABLE).select('part').limit(1).execute()
+            return False
+        except APIError as e:
+            if e.code in MISSING_RELATION_ERROR_CODES:
+                return True
+            raise
+
+    def _build_part_payload(self, name: str, content: Dict[str, Any], content_hash: str) -> Dict[str, Any]:
+        raw = serialize_project(content)
+        payload = {'part': name, 'content_hash': content_hash, 'content_size': len(raw)}
+        encoded = self._compress(raw, f"Project {name}")
+        if encoded:
+            payload['content_blob'], payload['content_encoding'] = encoded
+        else:
+            payload['content'] = content
+        return payload
+
+    def _save_project_parts(self, client, user_id: str, project_data: Dict[str, Any],
+                            if_match_hashes: Optional[List[str]], version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Save through save_audiobook_project_parts
+
+        Parts this worker knows to be stored unchanged are sent by hash only. If the
+        database holds something else for them (another worker saved in between) the
+        RPC writes nothing and names them, and they are resent with content.
+        """
+        content_hash = self.compute_content_hash(project_data)
+        parts = split_project_parts(project_data)
+        # Part hashes cover every field, so a written structure part carries the latest timestamp
+        part_hashes = {name: self._hash_json(content) for name, content in parts.items()}
+        known_hashes = self._get_known_part_hashes(user_id)
+
+        payloads = {}
+        for name, content in parts.items():
+            if known_hashes.get(name) == part_hashes[name]:
+                payloads[name] = {'part': name, 'content_hash': part_hashes[name]}
+            else:
+                payloads[name] = self._build_part_payload(name, content, part_hashes[name])
+
+        params = {
+            'p_user_id': user_id,
+            'p_title': self._project_title(project_data),
+            'p_description': self._project_description(project_data),
+            'p_content_hash': content_hash,
+            'p_parts': list(payloads.values()),
+            'p_settings_size': sum(payload.get('content_size', 0) for payload in payloads.values()),
+            'p_summary': build_project_summary(project_data),
+            'p_if_match': if_match_hashes
+        }
+        if version is not None:
+            params['p_version'] = version
+        row = self._call_parts_rpc(client, params)
+
+        if row.get('missing_parts'):
+            for name in row['missing_parts']:
+                payloads[name] = self._build_part_payload(name, parts[name], part_hashes[name])
+            params['p_parts'] = list(payloads.values())
+            row = self._call_parts_rpc(client, params)
+            if row.get('missing_parts'):
+                raise RuntimeError(f"Project parts still missing after resend: {row['missing_parts']}")
+
+        if row.get('precondition_failed'):
+            raise ProjectPreconditionFailed(row.get('project_version'), row.get('project_hash'))
+
+        unchanged = bool(row.get('unchanged'))
+        if not unchanged:
+            written = row.get('written_parts') or []
+            self._record_stats(parts_written=len(written), parts_skipped=len(parts) - len(written))
+            self._remember_part_hashes(user_id, part_hashes)
+
+        return {
+            'id': row['project_id'],
+            'version': row.get('project_version') or 0,
+            'content_hash': content_hash,
+            'unchanged': unchanged,
+            'written_parts': [] if unchanged else (row.get('written_parts') or [])
+        }
+
+    def _call_parts_rpc(self, client, params: Dict[str, Any]) -> Dict[str, Any]:
+        if 'p_version' in params and not self._parts_version_available:
+            params.pop('p_version')
+        try:
+            result = client.rpc(SAVE_PROJECT_PARTS_RPC, params).execute()
+        except APIError as e:
+            if e.code not in MISSING_FUNCTION_ERROR_CODES or 'p_version' not in params:
+                raise
+            # Migration 20 without 21 - no p_version argument, the database picks the next version
+            self._parts_version_available = False
+            logger.warning("⚠️ save_audiobook_project_parts has no p_version (migration 21 not applied), "
+                           "flushed projects get the next version instead")
+            params.pop('p_version')
+            result = client.rpc(SAVE_PROJECT_PARTS_RPC, params).execute()
+        if not result.data:
+            raise RuntimeError('No data returned from project save')
+        return result.data[0]
+
+    def _save_project_rpc(self, client, project_record: Dict[str, Any],
+                          if_match_hashes: Optional[List[str]]) -> Dict[str, Any]:
+        """Save through the atomic save_audiobook_project function (one round trip)"""
+        params = {
+            'p_user_id': project_record['user_id'],
+            'p_title': project_record['title'],
+            'p_description': project_record['description'],
+            'p_settings': project_record['settings'],
+            'p_chapters': project_record['chapters'],
+            'p_content_hash': project_record['content_hash'],
+            'p_if_match': if_match_hashes
+        }
+        if 'settings_blob' in project_record:
+            params.update({
+                'p_settings_blob': project_record['settings_blob'],
+                'p_settings_encoding': project_record['settings_encoding'],
+                'p_settings_size': project_record['settings_size'],
+                'p_summary': project_record['summary']
+            })
+
+        result = client.rpc(SAVE_PROJECT_RPC, params).execute()
+
+        if not result.data:
+            raise RuntimeError('No data returned from project save')
+
+        row = result.data[0]
+        if row.get('precondition_failed'):
+            raise ProjectPreconditionFailed(row.get('project_version'), row.get('project_hash'))
+
+        return {
+            'id': row['project_id'],
+            'version': row.get('project_version') or 0,
+            'content_hash': project_record['content_hash'],
+            'unchanged': bool(row.get('unchanged'))
+        }
+
+    def _save_project_two_step(self, client, project_record: Dict[str, Any],
+                               if_match_hashes: Optional[List[str]]) -> Dict[str, Any]:
+        """Select the stored project, then update or insert it (pre-migration fallback)"""
+        user_id = project_record['user_id']
+
+        # Check if user already has a project
+        existing_result = client.table(PROJECTS_TABLE)\
+            .select('id, version, content_hash')\
+            .eq('user_id', user_id)\
+            .execute()
+        existing = existing_result.data[0] if existing_result.data else None
+
+        if if_match_hashes:
+            stored_hash = existing.get('content_hash') if existing else None
+            if not existing or not ('*' in if_match_hashes or (stored_hash and stored_hash in if_match_hashes)):
+                raise ProjectPreconditionFailed(existing.get('version') if existing else None, stored_hash)
+
+        if existing and existing.get('content_hash') == project_record['content_hash']:
+            # Periodic autosave of an unchanged project - nothing to write
+            return {
+                'id': existing['id'],
+                'version': existing.get('version') or 0,
+                'content_hash': project_record['content_hash'],
+                'unchanged': True
+            }
+
+        if existing:
+            # Update existing project
+            project_record['id'] = existing['id']
+            project_record['version'] = (existing.get('version') or 0) + 1
+            result = client.table(PROJECTS_TABLE)\
+                .update(project_record)\
+                .eq('id', existing['id'])\
+                .execute()
+        else:
+            # Insert new project
+            project_record['version'] = 1
+            result = client.table(PROJECTS_TABLE)\
+                .insert(project_record)\
+                .execute()
+
+        if not result.data:
+            raise RuntimeError('No data returned from project save')
+
+        return {
+            'id': result.data[0]['id'],
+            'version': result.data[0].get('version', project_record['version']),
+            'content_hash': project_record['content_hash'],
+            'unchanged': False
+        }
+
+    def apply_project_delta(self, client, user_id: str, base_version: int,
+                            operations: List[Dict[str, Any]],
+                            validate: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Apply JSON-patch operations to the stored project
+
+        The patch is applied against the stored project only if it is still at
+        base_version; the write itself is conditional on the version (or, for projects
+        stored in parts, on the stored content hash) as well, so two concurrent deltas
+        against the same base cannot both succeed.
+
+        Args:
+            validate: Called with the patched project before it is written; raises
+                      to reject it
+
+        Raises:
+            ProjectNotFoundError: No stored project to patch
+            ProjectVersionConflict: Stored project moved past base_version
+            JsonPatchError: Operations do not apply to the stored project
+        """
+        if self.write_buffer is not None:
+            return self.write_buffer.apply_delta(client, user_id, base_version, operations, validate)
+
+        existing = self._select_project(client, user_id, 'id, version, content_hash, settings')
+
+        if not existing:
+            raise ProjectNotFoundError(f"No project stored for user {user_id}")
+
+        current_version = existing.get('version') or 0
+        if current_version != base_version:
+            raise ProjectVersionConflict(current_version)
+
+        project_data = apply_patch(existing.get('settings') or {}, operations)
+        if validate is not None:
+            validate(project_data)
+
+        if self._parts_rpc_available:
+            stored_hash = existing.get('content_hash')
+            try:
+                # Rows saved before content hashes existed cannot be guarded by hash
+                return self._write_project(client, user_id, project_data, [stored_hash] if stored_hash else None)
+            except ProjectPreconditionFailed as failed:
+                # Another save landed between our read and our write
+                raise ProjectVersionConflict(
+                    failed.current_version if failed.current_version is not None else current_version
+                )
+
+        project_record = self.build_project_record(user_id, project_data)
+        if existing.get('content_hash') == project_record['content_hash']:
+            return {
+                'id': existing['id'],
+                'version': current_version,
+                'content_hash': project_record['content_hash'],
+                'unchanged': True
+            }
+
+        project_record['version'] = current_version + 1
+        result = client.table(PROJECTS_TABLE)\
+            .update(project_record)\
+            .eq('id', existing['id'])\
+            .eq('version', current_version)\
+            .execute()
+
+        if not result.data:
+            # Another save landed between our read and our write
+            latest = self.get_project_version(client, user_id)
+            raise ProjectVersionConflict(latest if latest is not None else current_version)
+
+        return {
+            'id': existing['id'],
+            'version': project_record['version'],
+            'content_hash': project_record['content_hash'],
+            'unchanged': False
+        }
+
+    def get_project_head(self, client, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get the stored project's id, version and content_hash, or None if the user has no project"""
+        result = client.table(PROJECTS_TABLE)\
+            .select('id, version, content_hash')\
+            .eq('user_id', user_id)\
+            .execute()
+        return result.data[0] if result.data else None
+
+    def get_project_version(self, client, user_id: str) -> Optional[int]:
+        """Get the stored project version, or None if the user has no project"""
+        if self.write_buffer is not None:
+            pending = self.write_buffer.get_pending(user_id)
+            if pending:
+                return pending['version']
+        result = client.table(PROJECTS_TABLE)\
+            .select('version')\
+            .eq('user_id', user_id)\
+            .execute()
+        if not result.data:
+            return None
+        return result.data[0].get('version') or 0
+
+    def get_latest_project_hash(self, client, user_id: str) -> Optional[str]:
+        """Get just the stored content hash of the latest project (cheap conditional-GET check)"""
+        if self.write_buffer is not None:
+            pending = self.write_buffer.get_pending(user_id)
+            if pending:
+                return pending['content_hash']
+        result = client.table(PROJECTS_TABLE)\
+            .select('content_hash')\
+            .eq('user_id', user_id)\
+            .order('updated_at', desc=True)\
+            .limit(1)\
+            .execute()
+        if not result.data:
+            return None
+        return result.data[0].get('content_hash')
+
+    def get_latest_project(self, client, user_id: str,
+                           parts: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get the user's most recently updated project row
+
+        'settings' holds the decoded project, limited to the fields of the requested
+        parts when parts is given (see utils.project_parts); 'parts' maps the stored
+        parts to their version and content_hash. A save still waiting in the write
+        buffer is returned in place of the stored project.
+        """
+        if self.write_buffer is not None:
+            pending = self.write_buffer.get_pending(user_id)
+            if pending:
+                return self.write_buffer.pending_as_row(pending, parts)
+        return self._select_project(
+            client, user_id, 'id, title, settings, version, content_hash, updated_at', latest=True, parts=parts
+        )
+
+
+# Global instance
+_project_service = None
+
+def get_project_service() -> ProjectService:
+    """Get the global project service instance"""
+    global _project_service
+    if _project_service is None:
+        from ..config import config
+        app_config = config['default']()
+        _project_service = ProjectService(
+            compression=app_config.PROJECT_BLOB_COMPRESSION,
+            compression_min_bytes=app_config.PROJECT_BLOB_MIN_BYTES
+        )
+    return _project_service
+
+def init_project_service(compression: str = 'none', compression_min_bytes: int = 16384) -> ProjectService:
+    """Initialize the global project service with custom configuration"""
+    global _project_service
+    _project_service = ProjectService(compression, compression_min_bytes)
+    return _project_service
@@ -0,0 +1,479 @@
+# AudioBook Organizer - Project Write Buffer
+
+"""
+Write-behind coalescing of project autosaves.
+
+While a user edits, the client sends a save every few seconds (debounced
+changes plus the periodic autosave). With the buffer enabled those saves are
+acknowledged from a local spool and only the latest state per user is written
+to the database once no newer save has arrived within the coalescing window
+(or after at most max_delay seconds of continuous editing).
+
+The spool is a directory of one JSON file per user with a pending save, shared
+by every gunicorn worker on the host:
+
+    <key>.json      latest accepted, not yet written state
+    <key>.flushing  state currently being written by some worker
+    <key>.lock      flock() target serialising accepts and claims per user
+    <key>.failed    state the database kept rejecting, set aside for recovery
+
+A file's mtime is its flush due time, so the flusher only stat()s files to find
+due work. Loads read the pending state first, so a user always sees their last
+acknowledged save whichever worker serves the request. Pending saves survive a
+worker crash and are flushed by the next flusher pass; a worker flushes
+everything it can on clean shutdown. Failed flushes are retried; one the
+database rejects for good (permissions, invalid data, missing schema) is given
+up after MAX_REJECTED_FLUSH_ATTEMPTS tries and moved to <key>.failed, so loads
+stop serving a state that will never be stored.
+
+Versions keep counting per accepted save; the flush stores the last version the
+client was given (migration 21), so delta saves computed against it stay valid.
+"""
+
+import atexit
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from postgrest.exceptions import APIError
+
+from .project_service import (
+    ProjectNotFoundError, ProjectPreconditionFailed, ProjectService, ProjectVersionConflict, StaleProjectWrite
+)
+from ..utils.json_patch import apply_patch
+from ..utils.project_parts import merge_project_parts, split_project_parts
+
+logger = logging.getLogger(__name__)
+
+PENDING_SUFFIX = '.json'
+CLAIM_SUFFIX = '.flushing'
+LOCK_SUFFIX = '.lock'
+FAILED_SUFFIX = '.failed'
+
+# A claim older than this is treated as abandoned by a dead worker
+CLAIM_TIMEOUT_SECONDS = 120
+# Delay before retrying a failed flush
+FLUSH_RETRY_SECONDS = 15
+# Tries before a flush the database rejects for good is set aside
+MAX_REJECTED_FLUSH_ATTEMPTS = 3
+# Postgres classes (data, integrity, permission / undefined object) and PostgREST
+# groups (request, schema, JWT) that a retry will not fix
+REJECTED_FLUSH_ERROR_PREFIXES = ('22', '23', '42', 'PGRST1', 'PGRST2', 'PGRST3')
+POLL_INTERVAL_SECONDS = 1.0
+
+
+class ProjectWriteBuffer:
+    """Per-user write-behind buffer for project saves, backed by a shared disk spool"""
+
+    def __init__(self, project_service: ProjectService, spool_folder: str, window_seconds: float = 5.0,
+                 max_delay_seconds: float = 30.0, client_provider: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            project_service: Service used to read heads and write flushed projects
+            spool_folder: Directory shared by all workers on the host
+            window_seconds: A pending save is written once no newer save arrived for this long
+            max_delay_seconds: Upper bound on how long a save stays pending under continuous edits
+            client_provider: Returns the database client used for flushes (service role,
+                             since flushes run outside any request)
+        """
+        self.project_service = project_service
+        self.spool_folder = spool_folder
+        self.window_seconds = window_seconds
+        self.max_delay_seconds = max(window_seconds, max_delay_seconds)
+        self.client_provider = client_provider
+
+        os.makedirs(self.spool_folder, exist_ok=True)
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+        # Counters for monitoring
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'accepted': 0,
+            'coalesced': 0,
+            'unchanged': 0,
+            'stale_rejected': 0,
+            'flushed': 0,
+            'flush_failures': 0,
+            'flush_rejections': 0,
+            'flush_abandoned': 0
+        }
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get buffer statistics for monitoring"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        try:
+            names = os.listdir(self.spool_folder)
+            pending = sum(1 for name in names if name.endswith(PENDING_SUFFIX))
+            failed = sum(1 for name in names if name.endswith(FAILED_SUFFIX))
+        except OSError:
+            pending = failed = None
+        return {
+            'window_seconds': self.window_seconds,
+            'max_delay_seconds': self.max_delay_seconds,
+            'pending': pending,
+            'failed': failed,
+            **stats
+        }
+
+    # Spool files
+
+    def _key(self, user_id: str) -> str:
+        return hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:32]
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.spool_folder, key + suffix)
+
+    @contextmanager
+    def _locked(self, key: str):
+        """Exclusive per-user lock across threads and worker processes"""
+        with open(self._path(key, LOCK_SUFFIX), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_entry(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Unreadable project spool entry {os.path.basename(path)}: {e}")
+            return None
+
+    def _write_entry(self, key: str, entry: Dict[str, Any]) -> None:
+        """Atomically replace the user's pending entry; its mtime is set to the due time"""
+        fd, temp_path = tempfile.mkstemp(dir=self.spool_folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, separators=(',', ':'))
+            os.utime(temp_path, (entry['due_at'], entry['due_at']))
+            os.replace(temp_path, self._path(key, PENDING_SUFFIX))
+        except Exception:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _current_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        """Latest accepted state: the pending entry, else the one being flushed"""
+        entry = self._read_entry(self._path(key, PENDING_SUFFIX))
+        if entry is None:
+            entry = self._read_entry(self._path(key, CLAIM_SUFFIX))
+        return entry
+
+    def get_pending(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """The user's acknowledged but not yet stored save, if any"""
+        return self._current_entry(self._key(user_id))
+
+    def pending_as_row(self, entry: Dict[str, Any], parts: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Shape a pending entry like ProjectService.get_latest_project's row"""
+        project_data = entry['project']
+        if parts:
+            split = split_project_parts(project_data)
+            project_data = merge_project_parts(split[name] for name in parts)
+        return {
+            'id': entry.get('project_id'),
+            'user_id': entry['user_id'],
+            'title': self.project_service._project_title(entry['project']),
+            'settings': project_data,
+            'version': entry['version'],
+            'content_hash': entry['content_hash'],
+            'updated_at': datetime.fromtimestamp(entry['accepted_at'], timezone.utc).isoformat(),
+            'parts': None
+        }
+
+    # Accepting saves
+
+    def save(self, client, user_id: str, project_data: Dict[str, Any],
+             if_match_hashes: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Accept a full project save into the spool
+
+        Raises:
+            ProjectPreconditionFailed: If-Match does not match the latest accepted state
+            StaleProjectWrite: The save is older than the state already pending
+        """
+        key = self._key(user_id)
+        with self._locked(key):
+            pending = self._current_entry(key)
+            head = self._head(client, user_id, pending)
+
+            if if_match_hashes:
+                stored_hash = head['content_hash'] if head['exists'] else None
+                if not head['exists'] or not ('*' in if_match_hashes or (stored_hash and stored_hash in if_match_hashes)):
+                    raise ProjectPreconditionFailed(head['version'] if head['exists'] else None, stored_hash)
+
+            # Saves carry the client's ISO timestamp; one older than the pending state arrived out of order
+            pending_timestamp = (pending or {}).get('project', {}).get('timestamp')
+            incoming_timestamp = project_data.get('timestamp')
+            if (isinstance(pending_timestamp, str) and isinstance(incoming_timestamp, str)
+                    and incoming_timestamp < pending_timestamp):
+                self._count('stale_rejected')
+                raise StaleProjectWrite(head['version'], head['content_hash'])
+
+            return self._accept(key, user_id, project_data, head, pending)
+
+    def apply_delta(self, client, user_id: str, base_version: int, operations: List[Dict[str, Any]],
+                    validate: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Apply JSON-patch operations to the latest accepted state and accept the result"""
+        key = self._key(user_id)
+        with self._locked(key):
+            pending = self._current_entry(key)
+            if pending:
+                head = self._head(client, user_id, pending)
+                document = pending['project']
+            else:
+                existing = self.project_service._select_project(client, user_id, 'id, version, content_hash, settings')
+                if not existing:
+                    raise ProjectNotFoundError(f"No project stored for user {user_id}")
+                head = {
+                    'exists': True,
+                    'id': existing['id'],
+                    'version': existing.get('version') or 0,
+                    'content_hash': existing.get('content_hash')
+                }
+                document = existing.get('settings') or {}
+
+            if head['version'] != base_version:
+                raise ProjectVersionConflict(head['version'])
+
+            project_data = apply_patch(document, operations)
+            if validate is not None:
+                validate(project_data)
+            return self._accept(key, user_id, project_data, head, pending)
+
+    def _head(self, client, user_id: str, pending: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """id, version and hash of the latest accepted state (pending, else stored)"""
+        if pending:
+            return {
+                'exists': True,
+                'id': pending.get('project_id'),
+                'version': pending['version'],
+                'content_hash': pending['content_hash']
+            }
+        stored = self.project_service.get_project_head(client, user_id)
+        if not stored:
+            return {'exists': False, 'id': None, 'version': 0, 'content_hash': None}
+        return {
+            'exists': True,
+            'id': stored['id'],
+            'version': stored.get('version') or 0,
+            'content_hash': stored.get('content_hash')
+        }
+
+    def _accept(self, key: str, user_id: str, project_data: Dict[str, Any],
+                head: Dict[str, Any], pending: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Write the new pending entry (caller holds the user lock)"""
+        content_hash = self.project_service.compute_content_hash(project_data)
+        if head['exists'] and content_hash == head['content_hash']:
+            self._count('unchanged')
+            return {'id': head['id'], 'version': head['version'], 'content_hash': content_hash, 'unchanged': True}
+
+        now = time.time()
+        # Keep coalescing into the current cycle unless that entry is already being flushed
+        still_pending = pending is not None and os.path.exists(self._path(key, PENDING_SUFFIX))
+        first_pending_at = pending['first_pending_at'] if still_pending else now
+
+        entry = {
+            'user_id': user_id,
+            'project_id': head['id'],
+            'project': project_data,
+            'version': head['version'] + 1,
+            'content_hash': content_hash,
+            'accepted_at': now,
+            'first_pending_at': first_pending_at,
+            'due_at': min(now + self.window_seconds, first_pending_at + self.max_delay_seconds)
+        }
+        self._write_entry(key, entry)
+        self._count('coalesced' if still_pending else 'accepted')
+        self._ensure_flusher()
+
+        return {
+            'id': head['id'],
+            'version': entry['version'],
+            'content_hash': content_hash,
+            'unchanged': False,
+            'buffered': True
+        }
+
+    # Flushing
+
+    def _ensure_flusher(self) -> None:
+        """Start the flusher thread in this process (after gunicorn has forked)"""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='project-write-buffer', daemon=True)
+                self._thread.start()
+
+    def start(self) -> None:
+        """Start flushing, including entries left in the spool by a previous process"""
+        self._ensure_flusher()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.flush_due()
+            except Exception as e:
+                logger.error(f"❌ Project write buffer flush pass failed: {e}")
+            self._wake.wait(POLL_INTERVAL_SECONDS)
+            self._wake.clear()
+
+    def flush_due(self, force: bool = False) -> int:
+        """Flush every entry whose due time has passed (all entries when force); returns flushes"""
+        now = time.time()
+        flushed = 0
+        try:
+            names = os.listdir(self.spool_folder)
+        except OSError as e:
+            logger.error(f"❌ Cannot list project spool {self.spool_folder}: {e}")
+            return 0
+
+        for name in names:
+            if name.endswith(PENDING_SUFFIX):
+                key = name[:-len(PENDING_SUFFIX)]
+            elif name.endswith(CLAIM_SUFFIX):
+                key = name[:-len(CLAIM_SUFFIX)]
+            else:
+                continue
+            try:
+                due_at = os.path.getmtime(os.path.join(self.spool_folder, name))
+            except OSError:
+                continue
+            if name.endswith(CLAIM_SUFFIX):
+                due_at += CLAIM_TIMEOUT_SECONDS
+            if force or due_at <= now:
+                if self._flush_key(key):
+                    flushed += 1
+        return flushed
+
+    def _flush_key(self, key: str) -> bool:
+        pending_path = self._path(key, PENDING_SUFFIX)
+        claim_path = self._path(key, CLAIM_SUFFIX)
+
+        with self._locked(key):
+            if os.path.exists(claim_path):
+                if time.time() - os.path.getmtime(claim_path) < CLAIM_TIMEOUT_SECONDS:
+                    return False  # Another worker is writing this user's previous state
+                logger.warning(f"⚠️ Re-flushing abandoned project spool claim {key[:8]}")
+                os.utime(claim_path)
+            elif os.path.exists(pending_path):
+                os.replace(pending_path, claim_path)
+                os.utime(claim_path)
+            else:
+                return False
+
+        entry = self._read_entry(claim_path)
+        if entry is None:
+            self._remove(claim_path)
+            return False
+
+        try:
+            client = self.client_provider() if self.client_provider else None
+            if client is None:
+                raise RuntimeError('Database client not available')
+            started = time.perf_counter()
+            self.project_service._write_project(
+                client, entry['user_id'], entry['project'], None, version=entry['version']
+            )
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            rejected = self._is_rejected(e)
+            self._count('flush_rejections' if rejected else 'flush_failures')
+            logger.error(f"❌ Failed to flush buffered project (version {entry.get('version')}): {e}")
+            with self._locked(key):
+                if os.path.exists(pending_path):
+                    # A newer save supersedes the one that failed
+                    self._remove(claim_path)
+                    return False
+                if rejected:
+                    entry['rejected_attempts'] = entry.get('rejected_attempts', 0) + 1
+                if entry.get('rejected_attempts', 0) >= MAX_REJECTED_FLUSH_ATTEMPTS:
+                    os.replace(claim_path, self._path(key, FAILED_SUFFIX))
+                    self._count('flush_abandoned')
+                    logger.error(f"❌ Gave up flushing buffered project (version {entry.get('version')}) after "
+                                 f"{MAX_REJECTED_FLUSH_ATTEMPTS} rejections; kept as {key[:8]}{FAILED_SUFFIX}")
+                else:
+                    entry['due_at'] = time.time() + FLUSH_RETRY_SECONDS
+                    self._write_entry(key, entry)
+                    self._remove(claim_path)
+            return False
+
+        with self._locked(key):
+            self._remove(claim_path)
+        self._count('flushed')
+        logger.info(f"💾 Flushed buffered project version {entry['version']} ({elapsed_ms:.0f}ms)")
+        return True
+
+    def _is_rejected(self, error: Exception) -> bool:
+        """Whether the database rejected a flush in a way retrying will not fix"""
+        return isinstance(error, APIError) and str(error.code or '').startswith(REJECTED_FLUSH_ERROR_PREFIXES)
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def shutdown(self) -> None:
+        """Stop the flusher and write out every pending save"""
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=5)
+        flushed = self.flush_due(force=True)
+        if flushed:
+            logger.info(f"💾 Flushed {flushed} buffered project(s) at shutdown")
+
+
+# Global instance
+_project_write_buffer: Optional[ProjectWriteBuffer] = None
+
+def get_project_write_buffer() -> Optional[ProjectWriteBuffer]:
+    """Get the global project write buffer, or None when write-behind is disabled"""
+    return _project_write_buffer
+
+def init_project_write_buffer(project_service: ProjectService, spool_folder: str, window_seconds: float,
+                              max_delay_seconds: float = 30.0,
+                              client_provider: Optional[Callable[[], Any]] = None) -> Optional[ProjectWriteBuffer]:
+    """Initialize write-behind for the project service; a window of 0 disables it"""
+    global _project_write_buffer
+    if _project_write_buffer is not None:
+        _project_write_buffer.shutdown()
+        _project_write_buffer = None
+    project_service.write_buffer = None
+
+    if window_seconds > 0:
+        _project_write_buffer = ProjectWriteBuffer(
+            project_service, spool_folder, window_seconds, max_delay_seconds, client_provider
+        )
+        project_service.write_buffer = _project_write_buffer
+        _project_write_buffer.start()
+    return _project_write_buffer
+
+@atexit.register
+def _shutdown_project_write_buffer() -> None:
+    if _project_write_buffer is not None:
+        _project_write_buffer.shutdown()
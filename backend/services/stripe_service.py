@@ -384,6 +384,7 @@ class StripeService:
                 }).eq('user_id', user_id).execute()
                 
                 if update_result.data:
+                    supabase_service.invalidate_user_cache(user_id)
                     logger.info(f"Credits updated for user {user_id}: {current_credits} -> {new_credits}")
                     return True, None
                 else:
@@ -396,6 +397,7 @@ class StripeService:
                 }).execute()
                 
                 if insert_result.data:
+                    supabase_service.invalidate_user_cache(user_id)
                     logger.info(f"Credits created for user {user_id}: {credits}")
                     return True, None
                 else:
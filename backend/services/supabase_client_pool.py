@@ -0,0 +1,294 @@
+# AudioBook Organizer - Supabase Client Pool
+
+"""
+Request-scoped database clients for row level security.
+
+RLS needs every query to carry the user's token. The routes used to set it with
+client.postgrest.auth(token) on the one shared client, so with several threads
+per worker a request could run its queries with another user's token.
+
+The pool hands out PostgREST clients that are authenticated for one request
+only. All of them send their requests through one shared httpx transport, so a
+worker keeps a single keep-alive connection pool to Supabase (HTTP/2 when the
+h2 package is installed) instead of one per client:
+
+    size               clients handed out at once; a request that finds none
+                       free waits up to acquire_timeout, then gets an unpooled
+                       client (connections stay bounded by the transport)
+    max_connections    open connections to Supabase per worker
+    keepalive_seconds  how long an idle connection is kept for reuse
+
+Inside a Flask request a client is shared by every query of that request for
+the same token and returned to the pool when the request is torn down.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict
+
+import httpx
+from flask import g, has_request_context
+from postgrest import SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_TIMEOUT
+from postgrest.utils import SyncClient
+
+try:
+    import h2
+except ImportError:  # Optional dependency - HTTP/1.1 keep-alive without it
+    h2 = None
+
+logger = logging.getLogger(__name__)
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    """Shared transport that counts requests and newly opened connections"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+        create_connection = self._pool.create_connection
+
+        def counting_create_connection(origin):
+            with self._stats_lock:
+                self.connections_opened += 1
+            return create_connection(origin)
+
+        self._pool.create_connection = counting_create_connection
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with self._stats_lock:
+            self.requests += 1
+        return super().handle_request(request)
+
+    def open_connections(self) -> int:
+        return len(self._pool.connections)
+
+
+class _SharedTransportPostgrestClient(SyncPostgrestClient):
+    """PostgREST client whose session sends through a shared transport"""
+
+    def __init__(self, base_url: str, headers: Dict[str, str], timeout: float,
+                 transport: httpx.BaseTransport):
+        self._transport = transport
+        super().__init__(base_url, headers=headers, timeout=timeout)
+
+    def create_session(self, base_url, headers, timeout) -> SyncClient:
+        return SyncClient(base_url=base_url, headers=headers, timeout=timeout, transport=self._transport)
+
+
+class RequestClient:
+    """
+    PostgREST client authenticated with one user's token
+
+    Offers the table()/from_()/rpc() part of the supabase Client used for
+    queries, so it can be passed wherever the shared client was.
+    """
+
+    def __init__(self, postgrest: SyncPostgrestClient, pooled: bool = True):
+        self.postgrest = postgrest
+        self.pooled = pooled
+        self.released = False
+
+    def table(self, table_name: str):
+        return self.postgrest.from_(table_name)
+
+    def from_(self, table_name: str):
+        return self.postgrest.from_(table_name)
+
+    def rpc(self, fn: str, params: Dict[Any, Any]):
+        return self.postgrest.rpc(fn, params)
+
+
+class SupabaseClientPool:
+    """Bounded pool of request-scoped clients over one keep-alive connection pool"""
+
+    def __init__(self, supabase_url: str, supabase_key: str, size: int = 16, max_connections: int = 20,
+                 keepalive_seconds: float = 30.0, acquire_timeout: float = 2.0, http2: bool = True,
+                 timeout: float = DEFAULT_POSTGREST_CLIENT_TIMEOUT):
+        """
+        Args:
+            supabase_url: Project URL
+            supabase_key: Anon key; sent as apiKey, and as the token of idle clients
+            size: Clients handed out at once
+            max_connections: Open connections to Supabase (keep-alive included)
+            keepalive_seconds: Idle time after which a connection is closed
+            acquire_timeout: Longest wait for a free client before handing out an unpooled one
+            http2: Use HTTP/2 when the h2 package is installed
+            timeout: Timeout of each database request in seconds
+        """
+        self.rest_url = f"{supabase_url}/rest/v1"
+        self.key = supabase_key
+        self.size = max(1, size)
+        self.acquire_timeout = acquire_timeout
+        self.timeout = timeout
+        self.http2 = bool(http2 and h2 is not None)
+
+        self._transport = _CountingTransport(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_seconds
+            )
+        )
+        self._headers = {
+            'apiKey': supabase_key,
+            'Authorization': f'Bearer {supabase_key}'
+        }
+        # Most recently returned first, so few clients stay warm under light load
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+        self._scope_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._in_use = 0
+        self._stats = {
+            'acquires': 0,
+            'waits': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'timeouts': 0,
+            'unscoped': 0,
+            'clients_created': 0,
+            'peak_in_use': 0
+        }
+
+    def _new_postgrest(self) -> SyncPostgrestClient:
+        with self._stats_lock:
+            self._stats['clients_created'] += 1
+        return _SharedTransportPostgrestClient(self.rest_url, self._headers, self.timeout, self._transport)
+
+    def acquire(self, token: str) -> RequestClient:
+        """Check out a client authenticated with token; give it back with release()"""
+        start = time.perf_counter()
+        pooled = self._slots.acquire(blocking=False)
+        waited = 0.0
+        if not pooled:
+            pooled = self._slots.acquire(timeout=self.acquire_timeout)
+            waited = time.perf_counter() - start
+
+        with self._stats_lock:
+            self._stats['acquires'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_seconds_total'] += waited
+                self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+            if pooled:
+                self._in_use += 1
+                self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+            else:
+                self._stats['timeouts'] += 1
+
+        if not pooled:
+            logger.warning(f"⚠️ Supabase client pool exhausted after {waited:.2f}s, using an unpooled client")
+            return RequestClient(self._new_postgrest().auth(token), pooled=False)
+
+        try:
+            client = self._idle.get_nowait()
+            client.released = False
+        except queue.Empty:
+            client = RequestClient(self._new_postgrest())
+        client.postgrest.auth(token)
+        return client
+
+    def release(self, client: RequestClient) -> None:
+        """Return a client to the pool (unpooled clients are just dropped)"""
+        if not client.pooled or client.released:
+            return
+        client.released = True
+        # Idle clients carry no user's token
+        client.postgrest.auth(self.key)
+        self._idle.put(client)
+        with self._stats_lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def detached(self, token: str) -> RequestClient:
+        """Unpooled client for token, for work that may outlive the request (shares the connections)"""
+        with self._stats_lock:
+            self._stats['unscoped'] += 1
+        return RequestClient(self._new_postgrest().auth(token), pooled=False)
+
+    def for_request(self, token: str) -> RequestClient:
+        """
+        Client for token shared by the rest of the current request
+
+        It is returned to the pool by release_request_clients() when the request
+        ends. Outside a request, or once its clients were returned, an unpooled
+        client is returned.
+        """
+        if not has_request_context() or g.get('supabase_clients_released'):
+            return self.detached(token)
+
+        clients = g.setdefault('supabase_clients', {})
+        client = clients.get(token)
+        if client is None or client.released:
+            # Threads fanning out for the request share its context; keep the first client
+            acquired = self.acquire(token)
+            with self._scope_lock:
+                client = clients.get(token)
+                if client is None or client.released:
+                    client = clients[token] = acquired
+                    g.supabase_client_pool = self
+                    acquired = None
+            if acquired is not None:
+                self.release(acquired)
+        return client
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool occupancy, wait times and connection reuse for monitoring"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            in_use = self._in_use
+        with self._transport._stats_lock:
+            requests = self._transport.requests
+            opened = self._transport.connections_opened
+        acquires = stats['acquires']
+        return {
+            'size': self.size,
+            'in_use': in_use,
+            'idle': self._idle.qsize(),
+            'http2': self.http2,
+            **stats,
+            'wait_seconds_avg': stats['wait_seconds_total'] / stats['waits'] if stats['waits'] else 0.0,
+            'wait_rate': round(stats['waits'] / acquires, 4) if acquires else 0.0,
+            'connections': {
+                'open': self._transport.open_connections(),
+                'opened': opened,
+                'requests': requests,
+                'reused': max(0, requests - opened),
+                'reuse_rate': round(1 - opened / requests, 4) if requests else 0.0
+            }
+        }
+
+    def close(self) -> None:
+        """Close every pooled connection"""
+        self._transport.close()
+
+
+def release_request_clients() -> None:
+    """Return the clients checked out by the current request to their pool"""
+    clients = g.pop('supabase_clients', None)
+    pool = g.pop('supabase_client_pool', None)
+    # Later queries of this request (other teardown handlers) must not check out again
+    g.supabase_clients_released = True
+    if not clients or pool is None:
+        return
+    for client in clients.values():
+        pool.release(client)
+
+
+def init_supabase_client_pool(app):
+    """Return request-scoped Supabase clients when each request ends"""
+
+    @app.teardown_request
+    def release_supabase_clients(exc):
+        release_request_clients()
+
+    app.logger.info("✅ Supabase client pool middleware initialized")
+    return app
@@ -5,19 +5,33 @@ Handles all Supabase interactions for the AudioBook Organizer
 
 import os
 import logging
+import hashlib
+import threading
 from typing import Dict, Optional, Any, List
 from supabase import create_client, Client
+from postgrest.exceptions import APIError
+from .usage_log_writer import get_usage_log_writer
+from .user_cache import UserCacheBase, LocalUserCache, create_user_cache
+from .supabase_client_pool import SupabaseClientPool
+from .io_executor import get_io_executor
+from ..utils.ttl_cache import TTLCache
+from ..utils.single_flight import SingleFlight
 from jose import jwt, JWTError
 import datetime
-import concurrent.futures
 import time
 
 logger = logging.getLogger(__name__)
 
+# PostgREST / Postgres codes for "function does not exist"
+MISSING_FUNCTION_ERROR_CODES = ('PGRST202', '42883')
+
 class SupabaseService:
     """Service for Supabase authentication and database operations"""
     
-    def __init__(self, supabase_url: str, supabase_key: str, jwt_secret: str, service_key: str = None):
+    def __init__(self, supabase_url: str, supabase_key: str, jwt_secret: str, service_key: str = None,
+                 token_cache_size: int = 1024, credit_hold_ttl: int = 900,
+                 user_cache: Optional[UserCacheBase] = None,
+                 client_pool: Optional[SupabaseClientPool] = None):
         """Initialize Supabase client"""
         self.url = supabase_url
         self.key = supabase_key
@@ -25,15 +39,41 @@ class SupabaseService:
         self.jwt_secret = jwt_secret
         self.client: Client = None
         self._service_client: Client = None
+        # Request-scoped clients carrying a user's token (see client_for)
+        self.client_pool: Optional[SupabaseClientPool] = None
+        
+        # Profile and credits per user, shared by all workers unless a local cache is configured
+        self.user_cache = user_cache or LocalUserCache(ttl=300)
+        
+        # Concurrent identical user reads (page-load bursts) share one database call.
+        # Reads are keyed by the user's cache generation, which every invalidation (in
+        # any worker) moves on, so a read started after a write never joins one that
+        # started before it.
+        self._read_flights = SingleFlight()
         
-        # Simple cache for user initialization (session-based)
-        self._user_init_cache = {}
-        self._cache_ttl = 300  # 5 minutes cache
+        # Set to False once the debit_user_credits RPC (sql/24) turns out to be missing
+        self._debit_rpc_available = True
+        # Credit holds (sql/25): lifetime of a reservation, False once the RPCs turn out to be missing
+        self._credit_hold_ttl = credit_hold_ttl
+        self._hold_rpc_available = True
+        # Set to False once the init_user RPC (sql/26) turns out to be missing
+        self._init_rpc_available = True
+        
+        # Verified JWT claims by token digest, each valid until the token's exp
+        self._token_cache = TTLCache(token_cache_size)
+        self._token_cache_lock = threading.Lock()  # Guards the verification counters
+        self._token_stats = {
+            'verifications': 0,
+            'verification_failures': 0,
+            'verification_seconds_total': 0.0,
+            'verification_seconds_max': 0.0
+        }
         
         if supabase_url and supabase_key:
             try:
                 # Try simple initialization first (most compatible)
                 self.client = create_client(supabase_url, supabase_key)
+                self.client_pool = client_pool or SupabaseClientPool(supabase_url, supabase_key)
                 logger.info("✅ Supabase client initialized successfully")
             except Exception as e:
                 error_msg = str(e)
@@ -51,6 +91,26 @@ class SupabaseService:
         """Check if Supabase is properly configured"""
         return self.client is not None
     
+    def client_for(self, auth_token: str = None, detached: bool = False):
+        """
+        Client for queries under the user's RLS policies
+        
+        With a token this is a client authenticated for the current request only
+        (the shared client is never re-authenticated, since other threads use it),
+        or with detached=True one that is not tied to the request, for background
+        work that may outlive it. Without a token it is the shared client with the
+        anon key.
+        """
+        if not auth_token or self.client_pool is None:
+            return self.client
+        if detached:
+            return self.client_pool.detached(auth_token)
+        return self.client_pool.for_request(auth_token)
+    
+    def get_client_pool_stats(self) -> Optional[Dict[str, Any]]:
+        """Get client pool and connection reuse statistics for monitoring"""
+        return self.client_pool.stats() if self.client_pool else None
+    
     def get_service_client(self) -> Client:
         """Get service role client that bypasses RLS for webhooks"""
         if not self._service_client and self.service_key:
@@ -154,7 +214,43 @@ class SupabaseService:
             }
     
     def verify_jwt_token(self, token: str) -> Optional[Dict[str, Any]]:
-        """Verify JWT token and return payload if valid"""
+        """
+        Verify JWT token and return payload if valid
+        
+        Verified claims are cached (LRU, keyed by a SHA-256 digest of the token) until
+        the token's exp, so the same token is decoded and checked only once.
+        """
+        if isinstance(token, str) and token:
+            cache_key = hashlib.sha256(token.encode('utf-8')).digest()
+            payload = self._get_cached_token_claims(cache_key)
+            if payload is not None:
+                return dict(payload)
+        else:
+            cache_key = None
+        
+        started = time.perf_counter()
+        payload = self._decode_jwt_token(token)
+        elapsed = time.perf_counter() - started
+        
+        with self._token_cache_lock:
+            stats = self._token_stats
+            stats['verifications'] += 1
+            stats['verification_seconds_total'] += elapsed
+            stats['verification_seconds_max'] = max(stats['verification_seconds_max'], elapsed)
+            if payload is None:
+                stats['verification_failures'] += 1
+        if payload is not None and cache_key is not None and isinstance(payload.get('exp'), (int, float)):
+            lifetime = payload['exp'] - time.time()
+            if lifetime > 0:
+                self._token_cache.set(cache_key, dict(payload), ttl=lifetime)
+        return payload
+    
+    def _get_cached_token_claims(self, cache_key: bytes) -> Optional[Dict[str, Any]]:
+        """Claims of an already verified, unexpired token, or None"""
+        return self._token_cache.get(cache_key)
+    
+    def _decode_jwt_token(self, token: str) -> Optional[Dict[str, Any]]:
+        """Decode and check a JWT token (signature, audience, expiry)"""
         if not token:
             logger.warning("Token is empty or None")
             return None
@@ -172,7 +268,7 @@ class SupabaseService:
             
         try:
             # DEBUG: Log token verification attempt
-            logger.info(f"🔍 DEBUG: Attempting JWT decode with secret length: {len(self.jwt_secret) if self.jwt_secret else 0}")
+            logger.debug(f"🔍 DEBUG: Attempting JWT decode with secret length: {len(self.jwt_secret) if self.jwt_secret else 0}")
             
             # Decode the token using Supabase JWT secret
             payload = jwt.decode(
@@ -187,7 +283,7 @@ class SupabaseService:
             current_time = datetime.datetime.utcnow().timestamp()
             
             # DEBUG: Log time comparison
-            logger.info(f"🔍 DEBUG: Token exp: {exp}, Current time: {current_time}, Diff: {(exp - current_time) if exp else 'no-exp'}")
+            logger.debug(f"🔍 DEBUG: Token exp: {exp}, Current time: {current_time}, Diff: {(exp - current_time) if exp else 'no-exp'}")
             
             if exp and current_time > exp:
                 logger.warning(f"🔍 DEBUG: Token has expired - exp: {exp}, current: {current_time}")
@@ -236,15 +332,17 @@ class SupabaseService:
             return None
             
         try:
-            # FIX: Authenticate the postgrest client with user's token for RLS
-            if auth_token and hasattr(self.client, 'postgrest'):
-                self.client.postgrest.auth(auth_token)
-                logger.debug("✅ Authenticated Supabase client for profile fetch RLS operations")
+            # Queries run with the user's token for RLS
+            client = self.client_for(auth_token)
+            generation = self.user_cache.generation(user_id)
             
-            result = self.client.table('profiles').select('*').eq('id', user_id).execute()
+            result = self._coalesced_read('profile', user_id, auth_token, generation, lambda: (
+                client.table('profiles').select('*').eq('id', user_id).execute()
+            ))
             
             if result.data and len(result.data) > 0:
-                return result.data[0]
+                # Copy: concurrent callers may share the same result
+                return dict(result.data[0])
             return None
             
         except Exception as e:
@@ -257,9 +355,8 @@ class SupabaseService:
             return False
             
         try:
-            # FIX: Authenticate the postgrest client with user's token for RLS
-            if auth_token and hasattr(self.client, 'postgrest'):
-                self.client.postgrest.auth(auth_token)
+            # Queries run with the user's token for RLS
+            client = self.client_for(auth_token)
             
             profile_data = {
                 'id': user_id,
@@ -275,9 +372,10 @@ class SupabaseService:
                     'avatar_url': user_data.get('avatar_url')
                 })
             
-            result = self.client.table('profiles').insert(profile_data).execute()
+            result = client.table('profiles').insert(profile_data).execute()
             
             if result.data:
+                self.invalidate_user_cache(user_id)
                 # **SECURITY FIX: Removed email logging to prevent user data exposure**
                 logger.info("✅ User profile created")
                 return True
@@ -293,16 +391,15 @@ class SupabaseService:
             return False
             
         try:
-            # FIX: Authenticate the postgrest client with user's token for RLS
-            if auth_token and hasattr(self.client, 'postgrest'):
-                self.client.postgrest.auth(auth_token)
-                logger.debug("✅ Authenticated Supabase client for profile update RLS operations")
+            # Queries run with the user's token for RLS
+            client = self.client_for(auth_token)
             
             updates['updated_at'] = datetime.datetime.utcnow().isoformat()
             
-            result = self.client.table('profiles').update(updates).eq('id', user_id).execute()
+            result = client.table('profiles').update(updates).eq('id', user_id).execute()
             
             if result.data:
+                self.invalidate_user_cache(user_id)
                 logger.info(f"✅ User profile updated for {user_id}")
                 return True
             return False
@@ -336,40 +433,49 @@ class SupabaseService:
     def initialize_user(self, user_id: str, email: str, user_data: Dict[str, Any] = None, auth_token: str = None) -> Dict[str, Any]:
         """Initialize user profile and credits for new or existing users - OPTIMIZED"""
         try:
-            # FIX: Authenticate the postgrest client with user's token for RLS
-            if auth_token and hasattr(self.client, 'postgrest'):
-                self.client.postgrest.auth(auth_token)
-                logger.debug("✅ Authenticated Supabase client for RLS operations")
-            
             # Check cache first
             cached_data = self._get_cached_user_data(user_id)
             if cached_data:
                 logger.info(f"🚀 Using cached user data for {user_id}")
                 return cached_data
-            # Single query to get both profile and credits in parallel
-            profile_future = None
-            credits_future = None
-            
-            # Use concurrent queries to reduce latency
-            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                profile_future = executor.submit(self.get_user_profile, user_id, auth_token)
-                credits_future = executor.submit(self.get_user_credits, user_id)
-                
-                # Get results
-                existing_profile = profile_future.result()
-                existing_credits = credits_future.result()
+            # Read before the database, so a change made meanwhile is not overwritten in the cache
+            generation = self.user_cache.generation(user_id)
+            if self._init_rpc_available:
+                try:
+                    profile, credits, is_new_user = self._call_init_user_rpc(user_id, email, user_data or {}, auth_token)
+                    if profile is None:
+                        return {
+                            'success': False,
+                            'error': 'Profile creation failed',
+                            'message': 'Failed to create user profile'
+                        }
+                    if is_new_user:
+                        self.invalidate_user_cache(user_id)
+                    return self._finish_initialize_user(user_id, profile, credits or 0, is_new_user, generation)
+                except APIError as e:
+                    if e.code not in MISSING_FUNCTION_ERROR_CODES:
+                        raise
+                    # Migration 26 not applied yet - read and create in separate queries
+                    self._init_rpc_available = False
+                    logger.warning("⚠️ init_user RPC not found, initializing users in separate queries")
+            
+            # Check out the request's client before fanning out, so the queries share it
+            self.client_for(auth_token)
+            io_executor = get_io_executor()
+            
+            existing_profile, existing_credits = io_executor.gather(
+                lambda: self.get_user_profile(user_id, auth_token),
+                lambda: self.get_user_credits(user_id, True, auth_token)
+            )
             
             is_new_user = existing_profile is None
             
             if is_new_user:
                 # For new users, create profile and credits in parallel
-                with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                    profile_task = executor.submit(self.create_user_profile, user_id, email, user_data or {}, auth_token)
-                    credits_task = executor.submit(self.initialize_user_credits, user_id, 100, auth_token)
-                    
-                    # Wait for both to complete
-                    profile_success = profile_task.result()
-                    credits_success = credits_task.result()
+                profile_success, credits_success = io_executor.gather(
+                    lambda: self.create_user_profile(user_id, email, user_data or {}, auth_token),
+                    lambda: self.initialize_user_credits(user_id, 100, auth_token)
+                )
                 
                 if not profile_success:
                     return {
@@ -383,29 +489,16 @@ class SupabaseService:
                     # Don't fail the whole process if credits fail
                 
                 # Get the newly created data
-                with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                    profile_future = executor.submit(self.get_user_profile, user_id, auth_token)
-                    credits_future = executor.submit(self.get_user_credits, user_id)
-                    
-                    profile = profile_future.result()
-                    credits = credits_future.result()
+                profile, credits = io_executor.gather(
+                    lambda: self.get_user_profile(user_id, auth_token),
+                    lambda: self.get_user_credits(user_id, True, auth_token)
+                )
             else:
                 # For existing users, we already have the data
                 profile = existing_profile
                 credits = existing_credits
             
-            result = {
-                'success': True,
-                'message': 'User data retrieved successfully',
-                'profile': profile,
-                'credits': credits,
-                'is_new_user': is_new_user
-            }
-            
-            # Cache the result for future requests
-            self._cache_user_data(user_id, result)
-            
-            return result
+            return self._finish_initialize_user(user_id, profile, credits, is_new_user, generation)
             
         except Exception as e:
             logger.error(f"Error initializing user {user_id}: {e}")
@@ -415,6 +508,37 @@ class SupabaseService:
                 'message': 'An error occurred during user initialization'
             }
     
+    def _call_init_user_rpc(self, user_id: str, email: str, user_data: Dict[str, Any],
+                            auth_token: str = None) -> tuple:
+        """Profile, credits and whether the profile was created, in one call (sql/26)"""
+        result = self.client_for(auth_token).rpc('init_user', {
+            'p_user_id': user_id,
+            'p_email': email,
+            'p_full_name': user_data.get('full_name'),
+            'p_username': user_data.get('username'),
+            'p_avatar_url': user_data.get('avatar_url'),
+            'p_initial_credits': 100
+        }).execute()
+        rows = result.data or []
+        row = rows[0] if rows else {}
+        return row.get('profile'), row.get('credits'), bool(row.get('is_new_user'))
+    
+    def _finish_initialize_user(self, user_id: str, profile: Optional[Dict[str, Any]], credits: int,
+                                is_new_user: bool, generation: Optional[int] = None) -> Dict[str, Any]:
+        """Build and cache the initialize_user result"""
+        result = {
+            'success': True,
+            'message': 'User data retrieved successfully',
+            'profile': profile,
+            'credits': credits,
+            'is_new_user': is_new_user
+        }
+        
+        # Cache the result for future requests (unless the user changed since it was read)
+        self._cache_user_data(user_id, result, generation)
+        
+        return result
+    
     def reset_password_for_email(self, email: str) -> Dict[str, Any]:
         """Send password reset email to user"""
         if not self.client:
@@ -463,17 +587,16 @@ class SupabaseService:
                 return cached_data['credits']
             
         try:
-            # Set up authentication for RLS compliance if token provided
-            if auth_token and hasattr(self.client, 'postgrest'):
-                try:
-                    self.client.postgrest.auth(auth_token)
-                    logger.debug(f"💎 Authenticated Supabase client for credits fetch: {user_id}")
-                except Exception as auth_error:
-                    logger.warning(f"💎 Auth setup failed for credits fetch: {auth_error}")
+            # Queries run with the user's token for RLS
+            client = self.client_for(auth_token)
+            # Read before the query: a debit landing after it must not be overwritten in the cache
+            generation = self.user_cache.generation(user_id) if use_cache else None
             
-            # Always fetch from database when cache is disabled or cache miss
+            # Always fetch from database when cache is disabled or cache miss; cached reads
+            # tolerate sharing a concurrent identical query, fresh reads run their own
             logger.debug(f"💎 Querying database for credits: {user_id}")
-            result = self.client.table('user_credits').select('credits').eq('user_id', user_id).execute()
+            query = lambda: client.table('user_credits').select('credits').eq('user_id', user_id).execute()
+            result = self._coalesced_read('credits', user_id, auth_token, generation, query) if use_cache else query()
             
             if result.data and len(result.data) > 0:
                 credits = result.data[0]['credits']
@@ -483,8 +606,8 @@ class SupabaseService:
                 if use_cache:
                     cached_data = self._get_cached_user_data(user_id) or {}
                     cached_data['credits'] = credits
-                    self._cache_user_data(user_id, cached_data)
-                    logger.debug(f"💎 Credits cached for {user_id}: {credits}")
+                    if self._cache_user_data(user_id, cached_data, generation):
+                        logger.debug(f"💎 Credits cached for {user_id}: {credits}")
                 
                 return credits
             else:
@@ -518,9 +641,8 @@ class SupabaseService:
             return False
             
         try:
-            # FIX: Authenticate the postgrest client with user's token for RLS
-            if auth_token and hasattr(self.client, 'postgrest'):
-                self.client.postgrest.auth(auth_token)
+            # Queries run with the user's token for RLS
+            client = self.client_for(auth_token)
             
             credits_data = {
                 'user_id': user_id,
@@ -528,9 +650,10 @@ class SupabaseService:
                 'last_updated': datetime.datetime.utcnow().isoformat()
             }
             
-            result = self.client.table('user_credits').insert(credits_data).execute()
+            result = client.table('user_credits').insert(credits_data).execute()
             
             if result.data:
+                self.invalidate_user_cache(user_id)
                 logger.info(f"✅ Credits initialized for user {user_id}: {initial_credits}")
                 return True
             return False
@@ -539,26 +662,207 @@ class SupabaseService:
             logger.error(f"Error initializing user credits: {e}")
             return False
     
-    def update_user_credits(self, user_id: str, credit_change: int) -> bool:
+    def check_credits(self, user_id: str, required_credits: int, auth_token: str = None) -> tuple:
+        """
+        Pre-action credit check: (enough credits, current credits)
+        
+        Served from the credit cache when it shows enough credits; a short cached
+        balance is re-read from the database (credits may just have been bought).
+        The debit itself (debit_credits) re-checks the balance atomically.
+        """
+        current_credits = self.get_user_credits(user_id, use_cache=True, auth_token=auth_token)
+        if current_credits < required_credits:
+            current_credits = self.get_user_credits(user_id, use_cache=False, auth_token=auth_token)
+        return current_credits >= required_credits, current_credits
+    
+    def debit_credits(self, user_id: str, amount: int, action: str,
+                      metadata: Dict[str, Any] = None, auth_token: str = None) -> Dict[str, Any]:
+        """
+        Debit credits and log the usage in one atomic database call (sql/24)
+        
+        Returns:
+            {'success': bool, 'credits': balance after the debit (or the current
+            balance when it was not enough), 'insufficient': bool}
+        """
+        if not self.client:
+            return {'success': False, 'credits': None, 'insufficient': False}
+        
+        client = self.client_for(auth_token)
+        
+        if self._debit_rpc_available:
+            try:
+                row = self._call_debit_rpc(client, user_id, amount, action, metadata)
+                if row.get('balance') is None and auth_token:
+                    # No credits row yet - create it the way credit reads do, then retry once
+                    self.get_user_credits(user_id, use_cache=False, auth_token=auth_token)
+                    row = self._call_debit_rpc(client, user_id, amount, action, metadata)
+                return self._finish_debit(user_id, amount, action, row.get('debited', False), row.get('balance'))
+            except APIError as e:
+                if e.code not in MISSING_FUNCTION_ERROR_CODES:
+                    logger.error(f"❌ Error debiting credits for {user_id}: {e}")
+                    return {'success': False, 'credits': None, 'insufficient': False}
+                # Migration 24 not applied yet - fall back to separate read, update and log
+                self._debit_rpc_available = False
+                logger.warning("⚠️ debit_user_credits RPC not found, debiting credits in separate steps")
+            except Exception as e:
+                logger.error(f"❌ Error debiting credits for {user_id}: {e}")
+                return {'success': False, 'credits': None, 'insufficient': False}
+        
+        current_credits = self.get_user_credits(user_id, use_cache=False, auth_token=auth_token)
+        if current_credits < amount:
+            return self._finish_debit(user_id, amount, action, False, current_credits)
+        if not self.update_user_credits(user_id, -amount, auth_token=auth_token):
+            return {'success': False, 'credits': None, 'insufficient': False}
+        self.log_usage(user_id, action, amount, metadata, auth_token=auth_token)
+        return self._finish_debit(user_id, amount, action, True, current_credits - amount)
+    
+    def _call_debit_rpc(self, client, user_id: str, amount: int, action: str,
+                        metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        result = client.rpc('debit_user_credits', {
+            'p_user_id': user_id,
+            'p_amount': amount,
+            'p_action': action,
+            'p_metadata': metadata or {}
+        }).execute()
+        rows = result.data or []
+        return rows[0] if rows else {}
+    
+    def _finish_debit(self, user_id: str, amount: int, action: str,
+                      debited: bool, balance: Optional[int]) -> Dict[str, Any]:
+        """Invalidate the cached balance after a debit and build the debit result"""
+        if debited:
+            # Dropped rather than overwritten: another worker may cache a newer balance first
+            self.invalidate_user_cache(user_id)
+            logger.info(f"✅ Debited {amount} credits for {action} by user {user_id} (balance {balance})")
+        else:
+            logger.warning(f"⚠️ Not enough credits for {action} by user {user_id}: {balance} < {amount}")
+        return {
+            'success': debited,
+            'credits': balance,
+            'insufficient': not debited and balance is not None
+        }
+    
+    def reserve_credits(self, user_id: str, amount: int, action: str, auth_token: str = None) -> Dict[str, Any]:
+        """
+        Reserve credits for a job before it starts (sql/25)
+        
+        The hold counts against the balance until it is committed, released or
+        expires, so concurrent jobs cannot both spend the same credits.
+        
+        Returns:
+            Hold dict for commit_credit_hold/release_credit_hold: {'success', 'id',
+            'user_id', 'amount', 'action', 'credits': credits available (after the
+            hold when it was taken), 'insufficient'}
+        """
+        hold = {'success': False, 'id': None, 'user_id': user_id, 'amount': amount,
+                'action': action, 'credits': None, 'insufficient': False}
+        if not self.client:
+            return hold
+        
+        client = self.client_for(auth_token)
+        
+        if self._hold_rpc_available:
+            try:
+                row = self._call_reserve_rpc(client, user_id, amount, action)
+                if row.get('available') is None and auth_token:
+                    # No credits row yet - create it the way credit reads do, then retry once
+                    self.get_user_credits(user_id, use_cache=False, auth_token=auth_token)
+                    row = self._call_reserve_rpc(client, user_id, amount, action)
+                hold.update({
+                    'success': bool(row.get('reserved')),
+                    'id': row.get('hold_id'),
+                    'credits': row.get('available'),
+                    'insufficient': not row.get('reserved') and row.get('available') is not None
+                })
+                if hold['success']:
+                    logger.info(f"🔒 Reserved {amount} credits for {action} by user {user_id} (hold {hold['id']})")
+                return hold
+            except APIError as e:
+                if e.code not in MISSING_FUNCTION_ERROR_CODES:
+                    logger.error(f"❌ Error reserving credits for {user_id}: {e}")
+                    return hold
+                # Migration 25 not applied yet - check now, debit atomically on commit
+                self._hold_rpc_available = False
+                logger.warning("⚠️ reserve_user_credits RPC not found, checking credits without holds")
+            except Exception as e:
+                logger.error(f"❌ Error reserving credits for {user_id}: {e}")
+                return hold
+        
+        has_credits, current_credits = self.check_credits(user_id, amount, auth_token=auth_token)
+        hold.update({'success': has_credits, 'credits': current_credits, 'insufficient': not has_credits})
+        return hold
+    
+    def commit_credit_hold(self, hold: Dict[str, Any], metadata: Dict[str, Any] = None,
+                           auth_token: str = None) -> Dict[str, Any]:
+        """
+        Debit the credits of a successful job and log its usage
+        
+        Returns the same result as debit_credits(). A hold without id (taken while
+        the hold RPCs were missing) is debited with debit_credits().
+        """
+        if not hold.get('id'):
+            return self.debit_credits(hold['user_id'], hold['amount'], hold['action'],
+                                      metadata, auth_token=auth_token)
+        if not self.client:
+            return {'success': False, 'credits': None, 'insufficient': False}
+        
+        try:
+            result = self.client_for(auth_token).rpc('commit_credit_hold', {
+                'p_hold_id': hold['id'],
+                'p_metadata': metadata or {}
+            }).execute()
+            rows = result.data or []
+            row = rows[0] if rows else {}
+            return self._finish_debit(hold['user_id'], hold['amount'], hold['action'],
+                                      row.get('committed', False), row.get('balance'))
+        except Exception as e:
+            logger.error(f"❌ Error committing credit hold {hold['id']}: {e}")
+            return {'success': False, 'credits': None, 'insufficient': False}
+    
+    def release_credit_hold(self, hold: Dict[str, Any], auth_token: str = None) -> bool:
+        """Give back the credits of a failed job (holds without id have nothing to release)"""
+        if not hold.get('id'):
+            return True
+        if not self.client:
+            return False
+        
+        try:
+            result = self.client_for(auth_token).rpc('release_credit_hold', {'p_hold_id': hold['id']}).execute()
+            logger.info(f"🔓 Released {hold['amount']} credits held for {hold['action']} by user {hold['user_id']}")
+            return bool(result.data)
+        except Exception as e:
+            # The hold still expires on its own
+            logger.warning(f"⚠️ Could not release credit hold {hold['id']}: {e}")
+            return False
+    
+    def _call_reserve_rpc(self, client, user_id: str, amount: int, action: str) -> Dict[str, Any]:
+        result = client.rpc('reserve_user_credits', {
+            'p_user_id': user_id,
+            'p_amount': amount,
+            'p_action': action,
+            'p_ttl_seconds': self._credit_hold_ttl
+        }).execute()
+        rows = result.data or []
+        return rows[0] if rows else {}
+    
+    def update_user_credits(self, user_id: str, credit_change: int, auth_token: str = None) -> bool:
         """Update user credits (positive to add, negative to subtract)"""
         if not self.client:
             return False
             
         try:
             # Get current credits (bypass cache to ensure we have fresh data)
-            current_credits = self.get_user_credits(user_id, use_cache=False)
+            current_credits = self.get_user_credits(user_id, use_cache=False, auth_token=auth_token)
             new_credits = max(0, current_credits + credit_change)  # Prevent negative credits
             
-            result = self.client.table('user_credits').update({
+            result = self.client_for(auth_token).table('user_credits').update({
                 'credits': new_credits,
                 'last_updated': datetime.datetime.utcnow().isoformat()
             }).eq('user_id', user_id).execute()
             
             if result.data:
-                # CRITICAL FIX: Clear cache after successful database update
-                if user_id in self._user_init_cache:
-                    del self._user_init_cache[user_id]
-                    logger.debug(f"💎 Cache cleared for user {user_id} after credit update")
+                # CRITICAL FIX: Clear cache after successful database update (for every worker)
+                self.invalidate_user_cache(user_id)
                 
                 logger.info(f"✅ Credits updated for user {user_id}: {current_credits} → {new_credits}")
                 return True
@@ -568,10 +872,17 @@ class SupabaseService:
             logger.error(f"Error updating user credits: {e}")
             return False
     
-    def log_usage(self, user_id: str, action: str, credits_used: int = 0, metadata: Dict[str, Any] = None) -> bool:
-        """Log user action for analytics and billing"""
+    def log_usage(self, user_id: str, action: str, credits_used: int = 0, metadata: Dict[str, Any] = None,
+                  auth_token: str = None) -> bool:
+        """Log user action for analytics and billing (queued for a bulk write when the writer is enabled)"""
         if not self.client:
             return False
+        
+        writer = get_usage_log_writer()
+        if writer is not None:
+            writer.enqueue(user_id, action, credits_used, metadata)
+            logger.info(f"✅ Usage queued for user {user_id}: {action} ({credits_used} credits)")
+            return True
             
         try:
             usage_data = {
@@ -582,7 +893,7 @@ class SupabaseService:
                 'created_at': datetime.datetime.utcnow().isoformat()
             }
             
-            result = self.client.table('usage_logs').insert(usage_data).execute()
+            result = self.client_for(auth_token).table('usage_logs').insert(usage_data).execute()
             
             if result.data:
                 logger.info(f"✅ Usage logged for user {user_id}: {action} ({credits_used} credits)")
@@ -593,26 +904,27 @@ class SupabaseService:
             logger.error(f"Error logging usage: {e}")
             return False
 
-    def _is_cache_valid(self, user_id: str) -> bool:
-        """Check if cached user data is still valid"""
-        if user_id not in self._user_init_cache:
-            return False
-        
-        cache_entry = self._user_init_cache[user_id]
-        return (time.time() - cache_entry['timestamp']) < self._cache_ttl
-    
     def _get_cached_user_data(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get cached user data if valid"""
-        if self._is_cache_valid(user_id):
-            return self._user_init_cache[user_id]['data']
-        return None
-    
-    def _cache_user_data(self, user_id: str, data: Dict[str, Any]) -> None:
-        """Cache user data with timestamp"""
-        self._user_init_cache[user_id] = {
-            'data': data,
-            'timestamp': time.time()
-        }
+        return self.user_cache.get(user_id)
+    
+    def _cache_user_data(self, user_id: str, data: Dict[str, Any], generation: Optional[int] = None) -> bool:
+        """Cache user data for the cache TTL; with a generation, only if not invalidated since"""
+        return self.user_cache.set(user_id, data, generation)
+    
+    def _coalesced_read(self, query: str, user_id: str, auth_token: Optional[str], generation: int, fn):
+        """Run a per-user read, sharing the result with identical concurrent reads of the same generation"""
+        if generation < 0:
+            # Generation unknown (cache unavailable) - nothing tells reads before and after a write apart
+            return fn()
+        # Reads under different tokens see different rows through RLS, so never share them
+        token_digest = hashlib.sha256(auth_token.encode('utf-8')).hexdigest() if auth_token else None
+        return self._read_flights.do((query, user_id, token_digest, generation), fn)
+    
+    def invalidate_user_cache(self, user_id: str) -> None:
+        """Drop a user's cached profile and credits (in every worker sharing the cache)"""
+        self.user_cache.delete(user_id)
+        logger.debug(f"💎 Cache invalidated for user {user_id}")
     
     def warm_cache_for_active_users(self, max_users: int = 50) -> int:
         """
@@ -645,6 +957,7 @@ class SupabaseService:
             for user_id in user_ids:
                 try:
                     # Fetch and cache user profile and credits
+                    generation = self.user_cache.generation(user_id)
                     profile_data = self.get_user_profile(user_id)
                     credits_data = self.get_user_credits(user_id, use_cache=False)  # Skip cache to force DB fetch
                     
@@ -655,9 +968,9 @@ class SupabaseService:
                         if credits_data > 0:
                             cache_data['credits'] = credits_data
                         
-                        self._cache_user_data(user_id, cache_data)
-                        cached_count += 1
-                        logger.debug(f"💎 Cached data for user {user_id}")
+                        if self._cache_user_data(user_id, cache_data, generation):
+                            cached_count += 1
+                            logger.debug(f"💎 Cached data for user {user_id}")
                     
                 except Exception as user_error:
                     logger.warning(f"💎 Failed to cache data for user {user_id}: {user_error}")
@@ -672,29 +985,32 @@ class SupabaseService:
     
     def clear_cache(self) -> None:
         """Clear all cached user data"""
-        cache_size = len(self._user_init_cache)
-        self._user_init_cache.clear()
+        cache_size = self.user_cache.clear()
         logger.info(f"💎 Cache cleared: {cache_size} entries removed")
     
-    def get_cache_stats(self) -> Dict[str, Any]:
-        """Get cache statistics for monitoring"""
-        now = time.time()
-        valid_entries = 0
-        expired_entries = 0
-        
-        for user_id, cache_entry in self._user_init_cache.items():
-            if (now - cache_entry['timestamp']) < self._cache_ttl:
-                valid_entries += 1
-            else:
-                expired_entries += 1
-        
+    def get_token_cache_stats(self) -> Dict[str, Any]:
+        """Get verified-token cache statistics for monitoring"""
+        with self._token_cache_lock:
+            stats = dict(self._token_stats)
+        cache_stats = self._token_cache.stats()
+        verifications = stats['verifications']
         return {
-            'total_entries': len(self._user_init_cache),
-            'valid_entries': valid_entries,
-            'expired_entries': expired_entries,
-            'cache_ttl_seconds': self._cache_ttl,
-            'hit_rate': getattr(self, '_cache_hits', 0) / max(1, getattr(self, '_cache_requests', 1))
+            'entries': cache_stats['entries'],
+            'max_entries': cache_stats['max_entries'],
+            'hits': cache_stats['hits'],
+            'misses': cache_stats['misses'],
+            'hit_ratio': cache_stats['hit_rate'],
+            'evictions': cache_stats['evictions'],
+            'expirations': cache_stats['expirations'],
+            'verifications': verifications,
+            'verification_failures': stats['verification_failures'],
+            'verification_ms_avg': round(stats['verification_seconds_total'] * 1000 / verifications, 3) if verifications else 0.0,
+            'verification_ms_max': round(stats['verification_seconds_max'] * 1000, 3)
         }
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get cache statistics for monitoring"""
+        return {**self.user_cache.stats(), 'coalesced_reads': self._read_flights.stats()}
 
 # Global Supabase service instance
 _supabase_service: Optional[SupabaseService] = None
@@ -709,12 +1025,34 @@ def get_supabase_service() -> SupabaseService:
             app_config.SUPABASE_URL,
             app_config.SUPABASE_KEY,
             app_config.SUPABASE_JWT_SECRET,
-            app_config.SUPABASE_SERVICE_KEY  # Include service key if available
+            app_config.SUPABASE_SERVICE_KEY,  # Include service key if available
+            token_cache_size=app_config.JWT_CACHE_SIZE,
+            credit_hold_ttl=app_config.CREDIT_HOLD_TTL_SECONDS,
+            user_cache=create_user_cache(
+                app_config.USER_CACHE_BACKEND,
+                ttl=app_config.USER_CACHE_TTL_SECONDS,
+                max_entries=app_config.USER_CACHE_MAX_ENTRIES,
+                sqlite_path=app_config.USER_CACHE_SQLITE_PATH,
+                redis_url=app_config.REDIS_URL
+            ),
+            client_pool=SupabaseClientPool(
+                app_config.SUPABASE_URL,
+                app_config.SUPABASE_KEY,
+                size=app_config.SUPABASE_CLIENT_POOL_SIZE,
+                max_connections=app_config.SUPABASE_MAX_CONNECTIONS,
+                keepalive_seconds=app_config.SUPABASE_KEEPALIVE_SECONDS,
+                acquire_timeout=app_config.SUPABASE_CLIENT_POOL_TIMEOUT,
+                http2=app_config.SUPABASE_HTTP2
+            ) if app_config.SUPABASE_URL and app_config.SUPABASE_KEY else None
         )
     return _supabase_service
 
-def init_supabase_service(supabase_url: str, supabase_key: str, jwt_secret: str, service_key: str = None) -> SupabaseService:
+def init_supabase_service(supabase_url: str, supabase_key: str, jwt_secret: str, service_key: str = None,
+                          token_cache_size: int = 1024, credit_hold_ttl: int = 900,
+                          user_cache: Optional[UserCacheBase] = None,
+                          client_pool: Optional[SupabaseClientPool] = None) -> SupabaseService:
     """Initialize the global Supabase service instance with custom configuration"""
     global _supabase_service
-    _supabase_service = SupabaseService(supabase_url, supabase_key, jwt_secret, service_key)
+    _supabase_service = SupabaseService(supabase_url, supabase_key, jwt_secret, service_key,
+                                        token_cache_size, credit_hold_ttl, user_cache, client_pool)
     return _supabase_service 
\ No newline at end of file
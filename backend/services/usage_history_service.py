@@ -0,0 +1,211 @@
+"""
+Usage History Service - paginated reads of a user's usage_logs
+Keyset (cursor) pagination with cached, background-refreshed totals
+"""
+
+import base64
+import binascii
+import datetime
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .io_executor import get_io_executor
+from ..utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+USAGE_LOGS_TABLE = 'usage_logs'
+# Columns the usage history shows (metadata can be large and is not displayed)
+USAGE_HISTORY_COLUMNS = 'id, action, credits_used, created_at'
+
+COUNT_MODES = ('estimated', 'exact', 'none')
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past a row, ordered by (created_at, id) descending"""
+    raw = json.dumps([row['created_at'], row['id']], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """(created_at, id) of a cursor; raises ValueError when it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        datetime.datetime.fromisoformat(created_at)
+        uuid.UUID(row_id)
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    return created_at, row_id
+
+
+class UsageHistoryService:
+    """
+    Pages through a user's usage logs newest first
+
+    Pages after the first continue from a cursor with a (created_at, id) range
+    condition instead of an offset, so deep pages cost the same as the first
+    (backed by the index from sql/27). Page numbers are still accepted for
+    older clients and fall back to an offset.
+
+    Totals are counted by PostgREST ('estimated' uses the planner's estimate for
+    large histories, 'exact' counts every row) and cached per user and filter.
+    A first page without a cached total gets it from the page query itself; a
+    cached total older than count_refresh_seconds is served as is and
+    recounted in the background on the shared I/O executor.
+    """
+
+    def __init__(self, count_mode: str = 'estimated', count_refresh_seconds: float = 60,
+                 count_cache_size: int = 10000):
+        """
+        Args:
+            count_mode: 'estimated', 'exact' or 'none' (no totals)
+            count_refresh_seconds: Age after which a cached total is recounted
+            count_cache_size: Totals kept (per user and filter)
+        """
+        self.count_mode = count_mode if count_mode in COUNT_MODES else 'estimated'
+        self.count_refresh_seconds = count_refresh_seconds
+        # Stale totals stay usable for a while so they can be refreshed in the background
+        self._totals = TTLCache(count_cache_size, ttl=count_refresh_seconds * 10)
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+
+    def get_page(self, client, user_id: str, per_page: int = 20, cursor: str = None,
+                 action: str = None, page: int = 1,
+                 background_client: Callable[[], Any] = None) -> Dict[str, Any]:
+        """
+        One page of a user's usage history
+
+        Args:
+            client: Database client for the request
+            cursor: next_cursor of the previous page (None for the first page)
+            action: Only logs of this action
+            page: Page number; used for the offset when no cursor is given
+            background_client: Returns a client that may outlive the request,
+                               for refreshing totals in the background
+
+        Returns:
+            {'data': rows, 'pagination': {...}}; raises ValueError for a bad cursor
+        """
+        key = (user_id, action)
+        cached = self._totals.get(key)
+        count = self.count_mode if cached is None and not cursor and self.count_mode != 'none' else None
+
+        query = client.table(USAGE_LOGS_TABLE)\
+            .select(USAGE_HISTORY_COLUMNS, count=count)\
+            .eq('user_id', user_id)
+        if action:
+            query = query.eq('action', action)
+        if cursor:
+            created_at, row_id = decode_cursor(cursor)
+            # created_at < c OR (created_at = c AND id < id_c); postgrest-py has no or_() yet
+            query.params = query.params.add(
+                'or', f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id}))'
+            )
+        query = query.order('created_at', desc=True).order('id', desc=True)
+
+        # One row more than the page tells whether another page follows
+        if cursor or page <= 1:
+            result = query.limit(per_page + 1).execute()
+        else:
+            offset = (page - 1) * per_page
+            result = query.range(offset, offset + per_page).execute()
+
+        rows = result.data or []
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+
+        total = None
+        if count is not None and result.count is not None:
+            total = result.count
+            self._totals.set(key, (total, time.time()))
+        elif cached is not None:
+            total, counted_at = cached
+            if time.time() - counted_at >= self.count_refresh_seconds:
+                self._refresh_total(key, background_client)
+        elif self.count_mode != 'none':
+            self._refresh_total(key, background_client)
+
+        return {
+            'data': rows,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'total_is_estimate': total is not None and self.count_mode == 'estimated',
+                'pages': max(1, math.ceil(total / per_page)) if total is not None else None,
+                'has_more': has_more,
+                'next_cursor': encode_cursor(rows[-1]) if has_more and rows else None
+            }
+        }
+
+    def _refresh_total(self, key: Tuple[str, Optional[str]], background_client: Callable[[], Any]) -> None:
+        """Recount a total on the I/O executor (once per key at a time)"""
+        if background_client is None:
+            return
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        try:
+            get_io_executor().submit(self._count_total, key, background_client())
+        except Exception as e:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+            logger.warning(f"⚠️ Could not schedule usage history count refresh: {e}")
+
+    def _count_total(self, key: Tuple[str, Optional[str]], client) -> None:
+        user_id, action = key
+        try:
+            query = client.table(USAGE_LOGS_TABLE)\
+                .select('id', count=self.count_mode)\
+                .eq('user_id', user_id)
+            if action:
+                query = query.eq('action', action)
+            # Only the count is needed
+            result = query.limit(1).execute()
+            if result.count is not None:
+                self._totals.set(key, (result.count, time.time()))
+        except Exception as e:
+            logger.warning(f"⚠️ Usage history count refresh failed for user {user_id}: {e}")
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get total cache statistics for monitoring"""
+        with self._refresh_lock:
+            refreshing = len(self._refreshing)
+        return {
+            'count_mode': self.count_mode,
+            'count_refresh_seconds': self.count_refresh_seconds,
+            'refreshing': refreshing,
+            'totals': self._totals.stats()
+        }
+
+
+# Global usage history service instance
+_usage_history_service: Optional[UsageHistoryService] = None
+
+def get_usage_history_service() -> UsageHistoryService:
+    """Get the global usage history service instance"""
+    global _usage_history_service
+    if _usage_history_service is None:
+        from ..config import config
+        app_config = config['default']()
+        _usage_history_service = UsageHistoryService(
+            count_mode=app_config.USAGE_HISTORY_COUNT_MODE,
+            count_refresh_seconds=app_config.USAGE_HISTORY_COUNT_REFRESH_SECONDS
+        )
+    return _usage_history_service
+
+def init_usage_history_service(count_mode: str = 'estimated', count_refresh_seconds: float = 60) -> UsageHistoryService:
+    """Initialize the global usage history service with custom configuration"""
+    global _usage_history_service
+    _usage_history_service = UsageHistoryService(count_mode, count_refresh_seconds)
+    return _usage_history_service
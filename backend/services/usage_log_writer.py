@@ -0,0 +1,349 @@
+# AudioBook Organizer - Usage Log Writer
+
+"""
+Background writer for usage logs.
+
+log_usage() used to insert one usage_logs row synchronously on the request
+path. With the writer enabled the row is put on an in-process queue and a
+flusher thread writes queued rows as one bulk insert once batch_size rows are
+waiting or flush_seconds have passed since the oldest one was queued.
+
+Rows that cannot be written (database unreachable, queue full) are appended to
+a spool file shared by every gunicorn worker on the host:
+
+    usage_logs.jsonl                     rows waiting to be written, one JSON per line
+    usage_logs.<pid>.<time>.replaying    rows a worker has claimed for replay
+    usage_logs.lock                      flock() target serialising appends and claims
+
+Every replay_seconds a flusher claims the spool and writes it back in batches;
+rows it cannot write go back to the spool. Each row gets its id when it is
+queued and is written with ON CONFLICT DO NOTHING, so a batch that is retried
+after an ambiguous failure is not logged twice. On clean shutdown the queue is
+drained (or spooled); rows of a crashed worker that were already spooled are
+replayed by the next flusher.
+
+Paid actions log their usage inside the credit debit transaction (sql/24, 25)
+and do not go through this writer.
+"""
+
+import atexit
+import datetime
+import fcntl
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from postgrest.types import ReturnMethod
+
+logger = logging.getLogger(__name__)
+
+SPOOL_NAME = 'usage_logs.jsonl'
+LOCK_NAME = 'usage_logs.lock'
+REPLAY_SUFFIX = '.replaying'
+
+# A replay claim older than this is treated as abandoned by a dead worker
+CLAIM_TIMEOUT_SECONDS = 120
+
+
+class UsageLogWriter:
+    """Queues usage log rows and writes them in bulk from a background thread"""
+
+    def __init__(self, client_provider: Callable[[], Any], spool_folder: str, batch_size: int = 100,
+                 flush_seconds: float = 2.0, max_queue: int = 10000, replay_seconds: float = 30.0):
+        """
+        Args:
+            client_provider: Returns the database client used for writes (service role,
+                             since writes run outside any request)
+            spool_folder: Directory for rows that could not be written, shared by all workers
+            batch_size: Rows per bulk insert; a full batch is written immediately
+            flush_seconds: Longest a queued row waits for its batch to fill
+            max_queue: Rows held in memory; beyond this they go straight to the spool
+            replay_seconds: Interval between attempts to write spooled rows
+        """
+        self.client_provider = client_provider
+        self.spool_folder = spool_folder
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.replay_seconds = replay_seconds
+
+        os.makedirs(self.spool_folder, exist_ok=True)
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._next_replay = 0.0
+
+        # Counters for monitoring
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'queued': 0,
+            'written': 0,
+            'batches': 0,
+            'write_failures': 0,
+            'spooled': 0,
+            'replayed': 0
+        }
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get writer statistics for monitoring"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        try:
+            spool_bytes = os.path.getsize(self._path(SPOOL_NAME))
+        except OSError:
+            spool_bytes = 0
+        return {
+            'batch_size': self.batch_size,
+            'flush_seconds': self.flush_seconds,
+            'pending': self._queue.qsize(),
+            'spool_bytes': spool_bytes,
+            **stats
+        }
+
+    # Queueing
+
+    def enqueue(self, user_id: str, action: str, credits_used: int = 0,
+                metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Queue one usage log row; returns the row (its id is final)"""
+        row = {
+            'id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'action': action,
+            'credits_used': credits_used,
+            'metadata': metadata or {},
+            'created_at': datetime.datetime.utcnow().isoformat()
+        }
+        self._ensure_flusher()
+        try:
+            self._queue.put_nowait(row)
+            self._count('queued')
+        except queue.Full:
+            logger.warning("⚠️ Usage log queue full, spooling row to disk")
+            self._spool([row])
+        return row
+
+    # Spool
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.spool_folder, name)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive spool lock across threads and worker processes"""
+        with open(self._path(LOCK_NAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _spool(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        data = ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows)
+        try:
+            with self._locked():
+                with open(self._path(SPOOL_NAME), 'a', encoding='utf-8') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._count('spooled', len(rows))
+        except OSError as e:
+            logger.error(f"❌ Could not spool {len(rows)} usage log row(s), dropping them: {e}")
+
+    def _claim_spool(self) -> List[str]:
+        """Take the spool (and abandoned claims) for replay; returns the claimed files"""
+        claimed = []
+        now = time.time()
+        with self._locked():
+            for path in glob.glob(self._path('*' + REPLAY_SUFFIX)):
+                try:
+                    if now - os.path.getmtime(path) >= CLAIM_TIMEOUT_SECONDS:
+                        os.utime(path)
+                        claimed.append(path)
+                except OSError:
+                    continue
+            spool_path = self._path(SPOOL_NAME)
+            if os.path.exists(spool_path) and os.path.getsize(spool_path) > 0:
+                claim_path = self._path(f'usage_logs.{os.getpid()}.{int(now * 1000)}{REPLAY_SUFFIX}')
+                os.replace(spool_path, claim_path)
+                # The rename keeps the last append's mtime; stamp the claim so it is not taken as abandoned
+                os.utime(claim_path)
+                claimed.append(claim_path)
+        return claimed
+
+    def _read_spooled(self, path: str) -> List[Dict[str, Any]]:
+        rows = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by a crash mid-append
+                    logger.error(f"❌ Skipping unreadable usage log spool line {line_number} in {os.path.basename(path)}")
+        return rows
+
+    def replay_spool(self) -> int:
+        """Write spooled rows back to the database; returns rows written"""
+        replayed = 0
+        for path in self._claim_spool():
+            try:
+                rows = self._read_spooled(path)
+            except OSError as e:
+                logger.error(f"❌ Cannot read usage log spool {os.path.basename(path)}: {e}")
+                continue
+
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size]
+                if not self._insert(batch):
+                    # Still unreachable - keep the rest for the next replay
+                    self._spool(rows[start:])
+                    break
+                replayed += len(batch)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+        if replayed:
+            self._count('replayed', replayed)
+            logger.info(f"📝 Replayed {replayed} spooled usage log row(s)")
+        return replayed
+
+    # Writing
+
+    def _insert(self, rows: List[Dict[str, Any]]) -> bool:
+        """Bulk insert rows, ignoring ids that are already stored"""
+        try:
+            client = self.client_provider() if self.client_provider else None
+            if client is None:
+                raise RuntimeError('Database client not available')
+            client.table('usage_logs').upsert(
+                rows, on_conflict='id', ignore_duplicates=True, returning=ReturnMethod.minimal
+            ).execute()
+        except Exception as e:
+            self._count('write_failures')
+            logger.error(f"❌ Failed to write {len(rows)} usage log row(s): {e}")
+            return False
+        self._count('batches')
+        self._count('written', len(rows))
+        return True
+
+    def _write_batch(self, rows: List[Dict[str, Any]]) -> None:
+        if not self._insert(rows):
+            self._spool(rows)
+            # Give the database a moment before replaying into it
+            self._next_replay = time.time() + self.replay_seconds
+        else:
+            logger.debug(f"📝 Wrote {len(rows)} usage log row(s)")
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        """Wait for the first row, then gather until the batch is full or flush_seconds passed"""
+        try:
+            rows = [self._queue.get(timeout=self.flush_seconds)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(rows) < self.batch_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return rows
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    # Flusher
+
+    def _ensure_flusher(self) -> None:
+        """Start the flusher thread in this process (after gunicorn has forked)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='usage-log-writer', daemon=True)
+                self._thread.start()
+
+    def start(self) -> None:
+        """Start writing, including rows left in the spool by a previous process"""
+        self._ensure_flusher()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                rows = self._take_batch()
+                if rows:
+                    self._write_batch(rows)
+                if time.time() >= self._next_replay:
+                    self._next_replay = time.time() + self.replay_seconds
+                    self.replay_spool()
+            except Exception as e:
+                logger.error(f"❌ Usage log writer pass failed: {e}")
+
+    def flush(self) -> None:
+        """Write everything queued so far from the calling thread"""
+        rows = self._drain()
+        for start in range(0, len(rows), self.batch_size):
+            self._write_batch(rows[start:start + self.batch_size])
+
+    def shutdown(self) -> None:
+        """Stop the flusher and write (or spool) every queued row"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=self.flush_seconds + 5)
+        pending = self._queue.qsize()
+        self.flush()
+        if pending:
+            logger.info(f"📝 Wrote {pending} queued usage log row(s) at shutdown")
+
+
+# Global instance
+_usage_log_writer: Optional[UsageLogWriter] = None
+
+def get_usage_log_writer() -> Optional[UsageLogWriter]:
+    """Get the global usage log writer, or None when usage logs are written synchronously"""
+    return _usage_log_writer
+
+def init_usage_log_writer(client_provider: Callable[[], Any], spool_folder: str, enabled: bool = True,
+                          batch_size: int = 100, flush_seconds: float = 2.0) -> Optional[UsageLogWriter]:
+    """Initialize background usage log writes; disabled keeps the synchronous insert"""
+    global _usage_log_writer
+    if _usage_log_writer is not None:
+        _usage_log_writer.shutdown()
+        _usage_log_writer = None
+
+    if enabled:
+        _usage_log_writer = UsageLogWriter(client_provider, spool_folder, batch_size, flush_seconds)
+        _usage_log_writer.start()
+    return _usage_log_writer
+
+@atexit.register
+def _shutdown_usage_log_writer() -> None:
+    if _usage_log_writer is not None:
+        _usage_log_writer.shutdown()
@@ -0,0 +1,400 @@
+# AudioBook Organizer - User Cache
+
+"""
+Cache of per-user data (profile and credit balance) served to the auth and
+credit routes.
+
+Each gunicorn worker used to keep its own dict, so a credit change handled by
+one worker left the other workers serving the old balance until the entry
+expired, and every worker warmed its own copy. The backends here share one
+cache between the workers:
+
+    sqlite  a WAL-mode SQLite file on the host (default); every worker on the
+            host reads and invalidates the same entries
+    redis   a Redis-compatible server (REDIS_URL, needs the redis package);
+            shared by every host
+    local   a bounded per-process TTL+LRU cache, for single-process setups
+
+Entries expire after ttl seconds and each backend is trimmed to max_entries
+(SQLite every EVICT_EVERY_WRITES writes), dropping the oldest writes first
+(the least recently used entries for local).
+delete() is the invalidation: since the entry is shared it is gone for every
+worker at once. It also bumps the user's generation; a reader that fetched the
+generation before querying the database passes it to set(), and the write is
+skipped when an invalidation landed in between, so a value read before a
+change can never be cached after it. Values are JSON, so callers always get
+their own copy.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import redis
+except ImportError:  # Optional dependency - the SQLite cache is always available
+    redis = None
+
+from ..utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Evict down to max_entries once every this many writes (SQLite)
+EVICT_EVERY_WRITES = 64
+SQLITE_BUSY_TIMEOUT_MS = 2000
+REDIS_KEY_PREFIX = 'audiobook:user_cache:'
+REDIS_INDEX_KEY = 'audiobook:user_cache:index'
+REDIS_GENERATION_PREFIX = 'audiobook:user_cache:generation:'
+
+
+class UserCacheBase:
+    """Shared interface and hit/miss counters of the cache backends"""
+
+    backend = 'base'
+
+    def __init__(self, ttl: float = 300, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'stale_sets': 0, 'invalidations': 0, 'errors': 0}
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Cached data of a user, or None when missing or expired"""
+        try:
+            data = self._get(user_id)
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"⚠️ User cache read failed ({self.backend}): {e}")
+            data = None
+        self._count('hits' if data is not None else 'misses')
+        return data
+
+    def generation(self, user_id: str) -> int:
+        """A user's invalidation counter; read it before the database, pass it to set()"""
+        try:
+            return self._generation(user_id)
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"⚠️ User cache generation read failed ({self.backend}): {e}")
+            return -1  # Never matches, so the guarded write is skipped
+
+    def set(self, user_id: str, data: Dict[str, Any], generation: Optional[int] = None) -> bool:
+        """
+        Cache a user's data for ttl seconds
+
+        With a generation the write only happens if the user was not invalidated
+        since it was read. Returns whether the data was written.
+        """
+        try:
+            written = self._set(user_id, data, generation)
+            self._count('sets' if written else 'stale_sets')
+            return written
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"⚠️ User cache write failed ({self.backend}): {e}")
+            return False
+
+    def delete(self, user_id: str) -> None:
+        """Invalidate a user's entry for every worker sharing the cache"""
+        try:
+            self._delete(user_id)
+            self._count('invalidations')
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"⚠️ User cache invalidation failed ({self.backend}): {e}")
+
+    def clear(self) -> int:
+        """Drop every entry; returns how many there were"""
+        try:
+            return self._clear()
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"⚠️ User cache clear failed ({self.backend}): {e}")
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        try:
+            entries = self._size()
+        except Exception:
+            entries = None
+        lookups = stats['hits'] + stats['misses']
+        return {
+            'backend': self.backend,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'cache_ttl_seconds': self.ttl,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+            **stats
+        }
+
+    def _get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _generation(self, user_id: str) -> int:
+        raise NotImplementedError
+
+    def _set(self, user_id: str, data: Dict[str, Any], generation: Optional[int]) -> bool:
+        raise NotImplementedError
+
+    def _delete(self, user_id: str) -> None:
+        raise NotImplementedError
+
+    def _clear(self) -> int:
+        raise NotImplementedError
+
+    def _size(self) -> int:
+        raise NotImplementedError
+
+
+class LocalUserCache(UserCacheBase):
+    """Per-process cache; invalidations only reach this worker"""
+
+    backend = 'local'
+
+    def __init__(self, ttl: float = 300, max_entries: int = 10000):
+        super().__init__(ttl, max_entries)
+        self._entries = TTLCache(max_entries, ttl)
+        self._generations = TTLCache(max_entries, ttl)
+        self._write_lock = threading.Lock()
+
+    def _get(self, user_id):
+        value = self._entries.get(user_id)
+        return json.loads(value) if value is not None else None
+
+    def _generation(self, user_id):
+        return self._generations.get(user_id, 0)
+
+    def _set(self, user_id, data, generation):
+        value = json.dumps(data, default=str)
+        with self._write_lock:
+            if generation is not None and self._generations.get(user_id, 0) != generation:
+                return False
+            self._entries.set(user_id, value)
+            return True
+
+    def _delete(self, user_id):
+        with self._write_lock:
+            self._entries.delete(user_id)
+            self._generations.set(user_id, self._generations.get(user_id, 0) + 1)
+
+    def _clear(self):
+        return self._entries.clear()
+
+    def _size(self):
+        return len(self._entries)
+
+    def stats(self):
+        entry_stats = self._entries.stats()
+        return {
+            **super().stats(),
+            'evictions': entry_stats['evictions'],
+            'expirations': entry_stats['expirations']
+        }
+
+
+class SqliteUserCache(UserCacheBase):
+    """Cache in a SQLite file shared by the workers of one host"""
+
+    backend = 'sqlite'
+
+    def __init__(self, path: str, ttl: float = 300, max_entries: int = 10000):
+        super().__init__(ttl, max_entries)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS user_cache ('
+                'user_id TEXT PRIMARY KEY, data TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, written_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS user_cache_written_at ON user_cache (written_at)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS user_cache_generations ('
+                'user_id TEXT PRIMARY KEY, generation INTEGER NOT NULL, written_at REAL NOT NULL)'
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread and process (connections must not cross a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _get(self, user_id):
+        row = self._connection().execute(
+            'SELECT data FROM user_cache WHERE user_id = ? AND expires_at > ?',
+            (user_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _generation(self, user_id):
+        row = self._connection().execute(
+            'SELECT generation FROM user_cache_generations WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _set(self, user_id, data, generation):
+        now = time.time()
+        value = json.dumps(data, default=str)
+        conn = self._connection()
+        # IMMEDIATE takes the write lock, so no invalidation lands between the check and the write
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if generation is not None and self._generation(user_id) != generation:
+                conn.execute('ROLLBACK')
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO user_cache (user_id, data, expires_at, written_at) VALUES (?, ?, ?, ?)',
+                (user_id, value, now + self.ttl, now)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._writes += 1
+        if self._writes % EVICT_EVERY_WRITES == 0:
+            self._evict(conn, now)
+        return True
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop expired entries, then the oldest writes beyond max_entries"""
+        conn.execute('DELETE FROM user_cache WHERE expires_at <= ?', (now,))
+        # Generations only guard reads in flight; older ones are no longer needed
+        conn.execute('DELETE FROM user_cache_generations WHERE written_at <= ?', (now - self.ttl,))
+        conn.execute(
+            'DELETE FROM user_cache WHERE user_id IN ('
+            'SELECT user_id FROM user_cache ORDER BY written_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+    def _delete(self, user_id):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM user_cache WHERE user_id = ?', (user_id,))
+            conn.execute(
+                'INSERT INTO user_cache_generations (user_id, generation, written_at) VALUES (?, 1, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET generation = generation + 1, written_at = excluded.written_at',
+                (user_id, time.time())
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _clear(self):
+        return self._connection().execute('DELETE FROM user_cache').rowcount
+
+    def _size(self):
+        return self._connection().execute('SELECT COUNT(*) FROM user_cache').fetchone()[0]
+
+
+class RedisUserCache(UserCacheBase):
+    """Cache on a Redis-compatible server shared by every worker and host"""
+
+    backend = 'redis'
+
+    def __init__(self, url: str, ttl: float = 300, max_entries: int = 10000):
+        super().__init__(ttl, max_entries)
+        self._redis = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+
+    def _key(self, user_id: str) -> str:
+        return REDIS_KEY_PREFIX + user_id
+
+    def _get(self, user_id):
+        value = self._redis.get(self._key(user_id))
+        return json.loads(value) if value is not None else None
+
+    def _generation(self, user_id):
+        return int(self._redis.get(REDIS_GENERATION_PREFIX + user_id) or 0)
+
+    def _set(self, user_id, data, generation):
+        now = time.time()
+        value = json.dumps(data, default=str)
+        with self._redis.pipeline() as pipe:
+            try:
+                if generation is not None:
+                    # The transaction fails if an invalidation bumps the generation meanwhile
+                    pipe.watch(REDIS_GENERATION_PREFIX + user_id)
+                    if int(pipe.get(REDIS_GENERATION_PREFIX + user_id) or 0) != generation:
+                        return False
+                    pipe.multi()
+                pipe.set(self._key(user_id), value, px=int(self.ttl * 1000))
+                # Write-time index bounds the number of entries
+                pipe.zadd(REDIS_INDEX_KEY, {user_id: now})
+                pipe.zremrangebyscore(REDIS_INDEX_KEY, '-inf', now - self.ttl)
+                pipe.zcard(REDIS_INDEX_KEY)
+                size = pipe.execute()[-1]
+            except redis.WatchError:
+                return False
+        if size > self.max_entries:
+            oldest = self._redis.zpopmin(REDIS_INDEX_KEY, size - self.max_entries)
+            if oldest:
+                self._redis.delete(*(self._key(member.decode()) for member, _ in oldest))
+        return True
+
+    def _delete(self, user_id):
+        pipe = self._redis.pipeline()
+        pipe.delete(self._key(user_id))
+        pipe.zrem(REDIS_INDEX_KEY, user_id)
+        pipe.incr(REDIS_GENERATION_PREFIX + user_id)
+        # Generations only guard reads in flight
+        pipe.pexpire(REDIS_GENERATION_PREFIX + user_id, int(self.ttl * 1000))
+        pipe.execute()
+
+    def _clear(self):
+        members = self._redis.zrange(REDIS_INDEX_KEY, 0, -1)
+        pipe = self._redis.pipeline()
+        if members:
+            pipe.delete(*(self._key(member.decode()) for member in members))
+        pipe.delete(REDIS_INDEX_KEY)
+        pipe.execute()
+        return len(members)
+
+    def _size(self):
+        return self._redis.zcount(REDIS_INDEX_KEY, time.time() - self.ttl, '+inf')
+
+
+def create_user_cache(backend: str = 'local', ttl: float = 300, max_entries: int = 10000,
+                      sqlite_path: str = None, redis_url: str = None) -> UserCacheBase:
+    """
+    Build the configured cache backend, falling back to the next simpler one
+    (redis -> sqlite -> local) when it cannot be used
+    """
+    backend = (backend or 'local').lower()
+    if backend == 'redis':
+        if redis is None or not redis_url:
+            logger.warning("⚠️ Redis user cache needs REDIS_URL and the redis package, using SQLite")
+            backend = 'sqlite'
+        else:
+            try:
+                cache = RedisUserCache(redis_url, ttl, max_entries)
+                cache._redis.ping()
+                return cache
+            except Exception as e:
+                logger.warning(f"⚠️ Redis user cache unavailable ({e}), using SQLite")
+                backend = 'sqlite'
+    if backend == 'sqlite' and sqlite_path:
+        try:
+            return SqliteUserCache(sqlite_path, ttl, max_entries)
+        except Exception as e:
+            logger.warning(f"⚠️ SQLite user cache unavailable ({e}), using a per-process cache")
+    return LocalUserCache(ttl, max_entries)
@@ -0,0 +1,121 @@
+"""
+JSON Patch Utilities
+Applies RFC 6902 style patch operations to project documents
+"""
+
+import copy
+from typing import Any, Dict, List, Tuple
+
+SUPPORTED_OPERATIONS = ('add', 'remove', 'replace', 'test')
+MAX_OPERATIONS = 5000
+
+class JsonPatchError(Exception):
+    """Raised when a patch is malformed or does not apply to the document"""
+    pass
+
+def parse_pointer(pointer: str) -> List[str]:
+    """Split a JSON pointer ('/chapters/0/name') into unescaped path tokens"""
+    if not isinstance(pointer, str):
+        raise JsonPatchError("Patch path must be a string")
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer}")
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+def _resolve_parent(document: Any, tokens: List[str]) -> Tuple[Any, str]:
+    """Walk to the container holding the last token"""
+    target = document
+    for token in tokens[:-1]:
+        if isinstance(target, dict):
+            if token not in target:
+                raise JsonPatchError(f"Path segment '{token}' not found")
+            target = target[token]
+        elif isinstance(target, list):
+            target = target[_list_index(target, token)]
+        else:
+            raise JsonPatchError(f"Cannot traverse into scalar at '{token}'")
+    return target, tokens[-1]
+
+def _list_index(container: List, token: str, allow_end: bool = False) -> int:
+    """Convert a pointer token into a list index, '-' meaning the end of the list"""
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith('0')):
+        raise JsonPatchError(f"Invalid array index '{token}'")
+    index = int(token)
+    limit = len(container) if allow_end else len(container) - 1
+    if index > limit:
+        raise JsonPatchError(f"Array index {index} out of range")
+    return index
+
+def _apply_operation(document: Any, operation: Dict[str, Any]) -> Any:
+    """Apply one operation, returning the (possibly replaced) document root"""
+    op = operation.get('op')
+    if op not in SUPPORTED_OPERATIONS:
+        raise JsonPatchError(f"Unsupported patch operation: {op}")
+
+    tokens = parse_pointer(operation.get('path'))
+    if op in ('add', 'replace', 'test') and 'value' not in operation:
+        raise JsonPatchError(f"'{op}' operation requires a value")
+    value = operation.get('value')
+
+    if not tokens:
+        # Whole-document operations
+        if op == 'test':
+            if document != value:
+                raise JsonPatchError("Test operation failed at document root")
+            return document
+        if op == 'remove':
+            raise JsonPatchError("Cannot remove the document root")
+        return copy.deepcopy(value)
+
+    parent, key = _resolve_parent(document, tokens)
+
+    if isinstance(parent, dict):
+        if op == 'add':
+            parent[key] = copy.deepcopy(value)
+        elif key not in parent:
+            raise JsonPatchError(f"Path '{operation['path']}' not found")
+        elif op == 'remove':
+            del parent[key]
+        elif op == 'replace':
+            parent[key] = copy.deepcopy(value)
+        elif parent[key] != value:
+            raise JsonPatchError(f"Test operation failed at '{operation['path']}'")
+
+    elif isinstance(parent, list):
+        if op == 'add':
+            parent.insert(_list_index(parent, key, allow_end=True), copy.deepcopy(value))
+        else:
+            index = _list_index(parent, key)
+            if op == 'remove':
+                del parent[index]
+            elif op == 'replace':
+                parent[index] = copy.deepcopy(value)
+            elif parent[index] != value:
+                raise JsonPatchError(f"Test operation failed at '{operation['path']}'")
+
+    else:
+        raise JsonPatchError(f"Cannot apply '{op}' to a scalar at '{operation['path']}'")
+
+    return document
+
+def apply_patch(document: Any, operations: List[Dict[str, Any]]) -> Any:
+    """
+    Apply a list of patch operations to a copy of document
+
+    Supports add, remove, replace and test. The input document is never mutated;
+    if any operation fails a JsonPatchError is raised and nothing is applied.
+    """
+    if not isinstance(operations, list):
+        raise JsonPatchError("Patch must be a list of operations")
+    if len(operations) > MAX_OPERATIONS:
+        raise JsonPatchError(f"Patch exceeds {MAX_OPERATIONS} operations")
+
+    result = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise JsonPatchError("Patch operations must be objects")
+        result = _apply_operation(result, operation)
+    return result
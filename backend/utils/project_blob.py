@@ -0,0 +1,95 @@
+"""
+Project Blob Utilities
+Compressed encoding of project JSON for the audiobook_projects.settings_blob column
+"""
+
+import base64
+import gzip
+import json
+from typing import Any, Dict, Tuple
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency - gzip is always available
+    zstandard = None
+
+GZIP_ENCODING = 'gzip+base64'
+ZSTD_ENCODING = 'zstd+base64'
+SUPPORTED_CODECS = ('none', 'gzip', 'zstd')
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 9
+
+class ProjectBlobError(Exception):
+    """Raised when a stored project blob cannot be decoded"""
+    pass
+
+def resolve_codec(codec: str) -> str:
+    """Normalise a configured codec name, falling back to gzip when zstandard is not installed"""
+    codec = (codec or 'none').strip().lower()
+    if codec not in SUPPORTED_CODECS:
+        raise ValueError(f"Unsupported project blob codec '{codec}' (expected one of {', '.join(SUPPORTED_CODECS)})")
+    if codec == 'zstd' and zstandard is None:
+        return 'gzip'
+    return codec
+
+def serialize_project(project_data: Dict[str, Any]) -> bytes:
+    """Compact UTF-8 JSON for a project"""
+    return json.dumps(project_data, separators=(',', ':'), ensure_ascii=False)\
+        .encode('utf-8', errors='surrogatepass')
+
+def encode_project_blob(raw: bytes, codec: str) -> Tuple[str, str]:
+    """
+    Compress serialized project JSON
+
+    Returns:
+        (base64 text, encoding label stored in settings_encoding)
+    """
+    if codec == 'zstd':
+        compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+        encoding = ZSTD_ENCODING
+    elif codec == 'gzip':
+        # mtime=0 keeps the output deterministic for identical projects
+        compressed = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+        encoding = GZIP_ENCODING
+    else:
+        raise ValueError(f"Codec '{codec}' does not produce a blob")
+    return base64.b64encode(compressed).decode('ascii'), encoding
+
+def decode_project_blob(blob: str, encoding: str) -> Dict[str, Any]:
+    """Decode a settings_blob value back into the project dict"""
+    try:
+        compressed = base64.b64decode(blob)
+        if encoding == GZIP_ENCODING:
+            raw = gzip.decompress(compressed)
+        elif encoding == ZSTD_ENCODING:
+            if zstandard is None:
+                raise ProjectBlobError("Project is zstd-compressed but zstandard is not installed")
+            raw = zstandard.ZstdDecompressor().decompress(compressed)
+        else:
+            raise ProjectBlobError(f"Unknown project blob encoding '{encoding}'")
+        return json.loads(raw.decode('utf-8', errors='surrogatepass'))
+    except ProjectBlobError:
+        raise
+    except Exception as e:
+        raise ProjectBlobError(f"Could not decode {encoding} project blob: {e}")
+
+def _book_text_length(project_data: Dict[str, Any]) -> int:
+    """Length of the embedded book text, or of the stored text it references"""
+    text_ref = project_data.get('bookTextRef')
+    if 'bookText' not in project_data and isinstance(text_ref, dict):
+        return text_ref.get('length') or 0
+    return len(project_data.get('bookText') or '')
+
+def build_project_summary(project_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Small uncompressed description of a project, kept queryable next to the blob"""
+    chapters = project_data.get('chapters') or []
+    formatting_data = project_data.get('formattingData') or {}
+    return {
+        'chapterCount': len(chapters),
+        'sectionCount': sum(len(chapter.get('sections') or []) for chapter in chapters if isinstance(chapter, dict)),
+        'bookTextLength': _book_text_length(project_data),
+        'highlightCount': len(project_data.get('highlights') or []),
+        'formattingRangeCount': len(formatting_data.get('ranges') or []) if isinstance(formatting_data, dict) else 0,
+        'timestamp': project_data.get('timestamp')
+    }
@@ -0,0 +1,50 @@
+"""
+Project Part Utilities
+Splits project documents into independently stored parts and joins them back
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+# Part name -> top-level project fields it holds; 'structure' takes every other field
+PART_FIELDS = {
+    'text': ('bookText', 'bookTextRef'),
+    'annotations': ('highlights', 'formattingData')
+}
+STRUCTURE_PART = 'structure'
+PROJECT_PARTS = ('text', STRUCTURE_PART, 'annotations')
+
+_FIELD_PARTS = {field: part for part, fields in PART_FIELDS.items() for field in fields}
+
+def split_project_parts(project_data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Split a project into {part name: fields}; every part is present, possibly empty"""
+    parts = {part: {} for part in PROJECT_PARTS}
+    for field, value in project_data.items():
+        parts[_FIELD_PARTS.get(field, STRUCTURE_PART)][field] = value
+    return parts
+
+def merge_project_parts(parts: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Join part contents back into one project document"""
+    project_data = {}
+    for content in parts:
+        project_data.update(content or {})
+    return project_data
+
+def parse_parts_param(value: Optional[str]) -> Optional[List[str]]:
+    """
+    Parse a comma-separated ?parts= value
+
+    Returns:
+        List of part names in canonical order, or None for the whole project
+
+    Raises:
+        ValueError: Unknown part name
+    """
+    if not value:
+        return None
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested.difference(PROJECT_PARTS)
+    if unknown:
+        raise ValueError(f"Unknown project part(s): {', '.join(sorted(unknown))}")
+    if not requested or requested == set(PROJECT_PARTS):
+        return None
+    return [part for part in PROJECT_PARTS if part in requested]
@@ -0,0 +1,205 @@
+"""
+Text Decoding Utilities
+Detects the encoding of uploaded text files and decodes them incrementally
+"""
+
+import codecs
+import logging
+from typing import Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per step; only this much raw input is held at a time
+DECODE_CHUNK_SIZE = 64 * 1024
+# Bytes looked at to pick an encoding when there is no BOM
+SNIFF_BYTES = 64 * 1024
+
+# Longest first: the UTF-32 LE BOM starts with the UTF-16 LE one
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be')
+)
+
+# Bytes cp1252 leaves undefined; text containing them is read as latin-1
+CP1252_UNDEFINED = frozenset(b'\x81\x8d\x8f\x90\x9d')
+
+# Undefined cp1252 bytes decode to the latin-1 character of the same value
+# (what browsers do), so single-byte decoding never fails
+SINGLE_BYTE_ERRORS = 'audiobook-latin1-fallback'
+
+def _latin1_fallback(error):
+    if not isinstance(error, UnicodeDecodeError):
+        raise error
+    return error.object[error.start:error.end].decode('latin-1'), error.end
+
+codecs.register_error(SINGLE_BYTE_ERRORS, _latin1_fallback)
+
+
+class TextDecodeError(ValueError):
+    """Raised when an upload is not text in any supported encoding"""
+    pass
+
+
+def _utf16_without_bom(prefix: bytes) -> Optional[str]:
+    """Spot BOM-less UTF-16 by its zero high bytes (mostly-Latin text)"""
+    pairs = len(prefix) // 2
+    if pairs < 2:
+        return None
+    even_zeros = prefix[0:pairs * 2:2].count(0)
+    odd_zeros = prefix[1:pairs * 2:2].count(0)
+    if odd_zeros > pairs * 0.4 and even_zeros < pairs * 0.05:
+        return 'utf-16-le'
+    if even_zeros > pairs * 0.4 and odd_zeros < pairs * 0.05:
+        return 'utf-16-be'
+    return None
+
+
+def _single_byte_encoding(data: bytes) -> str:
+    return 'latin-1' if CP1252_UNDEFINED.intersection(data) else 'cp1252'
+
+
+def detect_encoding(prefix: bytes) -> Tuple[str, int]:
+    """
+    Pick the encoding of a text from its first bytes
+
+    Returns:
+        (codec name, length of the byte order mark to skip)
+
+    Raises:
+        TextDecodeError: The bytes look binary rather than like text
+    """
+    for bom, encoding in BOMS:
+        if prefix.startswith(bom):
+            return encoding, len(bom)
+
+    utf16 = _utf16_without_bom(prefix)
+    if utf16:
+        return utf16, 0
+
+    if b'\x00' in prefix:
+        raise TextDecodeError('File does not look like text')
+
+    try:
+        # final=False: a character cut off at the end of the prefix is fine
+        codecs.utf_8_decode(prefix, 'strict', False)
+        return 'utf-8', 0
+    except UnicodeDecodeError:
+        return _single_byte_encoding(prefix), 0
+
+
+class TextStreamDecoder:
+    """
+    Incremental decoder for uploaded text files
+
+    Iterating yields the text in pieces with '\\r\\n' and '\\r' line endings
+    turned into '\\n'. The encoding comes from a BOM, else from the first
+    SNIFF_BYTES (UTF-16 without BOM, UTF-8, cp1252, latin-1). A file that looked
+    like UTF-8 but turns out not to be switches to cp1252/latin-1 at the first
+    invalid byte when everything before it was ASCII (so both readings agree);
+    otherwise the rest is read as UTF-8 with invalid bytes turned into U+FFFD
+    and `replaced` is set.
+
+    char_count, line_count and byte_count are updated as the text is read.
+    """
+
+    def __init__(self, stream, chunk_size: int = DECODE_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.encoding = None
+        self.bom = False
+        self.replaced = False
+        self.char_count = 0
+        self.line_count = 0
+        self.byte_count = 0
+        self._ascii_only = True
+        self._decoder = None
+        self._pending_cr = False
+        self._ends_with_newline = True
+
+    def _read(self, size: int) -> bytes:
+        data = self.stream.read(size)
+        self.byte_count += len(data)
+        return data
+
+    def _normalize(self, piece: str, final: bool = False) -> str:
+        """Normalise line endings, holding back a trailing '\\r' that may start '\\r\\n'"""
+        if self._pending_cr:
+            piece = '\r' + piece
+            self._pending_cr = False
+        if piece.endswith('\r') and not final:
+            piece = piece[:-1]
+            self._pending_cr = True
+        piece = piece.replace('\r\n', '\n').replace('\r', '\n')
+        if piece:
+            self.char_count += len(piece)
+            self.line_count += piece.count('\n')
+            self._ends_with_newline = piece.endswith('\n')
+        return piece
+
+    def _decode_utf8(self, data: bytes, final: bool) -> Tuple[str, bytes]:
+        """Decode UTF-8 up to the first invalid byte; returns (text, undecoded rest)"""
+        try:
+            text, consumed = codecs.utf_8_decode(data, 'strict', final)
+        except UnicodeDecodeError as error:
+            text, _ = codecs.utf_8_decode(data[:error.start], 'strict', True)
+            consumed = error.start
+            ascii_so_far = self._ascii_only and text.isascii()
+            if ascii_so_far:
+                self.encoding = _single_byte_encoding(data[consumed:])
+            else:
+                self.encoding = 'utf-8'
+                self.replaced = True
+            logger.warning(
+                f"⚠️ Text upload is not valid UTF-8, reading the rest as "
+                f"{self.encoding if ascii_so_far else 'UTF-8 with replacement characters'}"
+            )
+            self._decoder = codecs.getincrementaldecoder(self.encoding)(
+                errors=SINGLE_BYTE_ERRORS if ascii_so_far else 'replace'
+            )
+        self._ascii_only = self._ascii_only and text.isascii()
+        return text, data[consumed:]
+
+    def __iter__(self) -> Iterator[str]:
+        prefix = self._read(SNIFF_BYTES)
+        self.encoding, bom_length = detect_encoding(prefix)
+        self.bom = bom_length > 0
+        if self.encoding != 'utf-8':
+            errors = SINGLE_BYTE_ERRORS if self.encoding in ('cp1252', 'latin-1') else 'strict'
+            self._decoder = codecs.getincrementaldecoder(self.encoding)(errors=errors)
+
+        data = prefix[bom_length:]
+        final = False
+        while not final:
+            chunk = self._read(self.chunk_size)
+            final = not chunk
+            data += chunk
+
+            text = ''
+            if self._decoder is None:
+                text, data = self._decode_utf8(data, final)
+            if self._decoder is not None:
+                try:
+                    text += self._decoder.decode(data, final)
+                except UnicodeDecodeError as error:
+                    raise TextDecodeError(f'File is not valid {self.encoding}: {error.reason}') from error
+                data = b''
+
+            piece = self._normalize(text, final)
+            if piece:
+                yield piece
+
+        if self.char_count and not self._ends_with_newline:
+            # The last line has no line break but is still a line
+            self.line_count += 1
+
+    def describe(self) -> dict:
+        """Encoding details for upload metadata"""
+        return {
+            'encoding': self.encoding,
+            'bom': self.bom,
+            'replaced_invalid_bytes': self.replaced,
+            'line_count': self.line_count
+        }
@@ -0,0 +1,33 @@
+"""
+Text Token Utilities
+Splits book text into normalised search tokens with their character positions
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Iterator, List, Tuple
+
+# Words are runs of letters, digits and underscores in any script
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Longer "words" (hashes, runaway digit strings) are indexed by their prefix
+MAX_TOKEN_LENGTH = 64
+
+@lru_cache(maxsize=65536)
+def normalize_token(word: str) -> str:
+    """Case- and accent-insensitive form of a word ('Café' and 'cafe' both give 'cafe')"""
+    decomposed = unicodedata.normalize('NFKD', word)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return stripped.casefold()[:MAX_TOKEN_LENGTH]
+
+def tokenize(text: str) -> Iterator[Tuple[str, int, int]]:
+    """(normalised token, start, end) for every word in the text; positions count characters"""
+    for match in TOKEN_PATTERN.finditer(text):
+        token = normalize_token(match.group())
+        if token:
+            yield token, match.start(), match.end()
+
+def query_tokens(query: str) -> List[str]:
+    """Normalised tokens of a search query, in order"""
+    return [token for token, _, _ in tokenize(query)]
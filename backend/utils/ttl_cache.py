@@ -0,0 +1,174 @@
+"""
+TTL Cache Utilities
+Bounded, thread-safe in-memory cache with per-entry expiry and LRU eviction
+"""
+
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# Lock stripes; keys are spread over this many independently locked segments
+DEFAULT_STRIPES = 8
+
+_MISSING = object()
+
+
+def _stripe_index(key: Hashable, stripes: int) -> int:
+    if isinstance(key, bytes):
+        return zlib.crc32(key) % stripes
+    if isinstance(key, str):
+        return zlib.crc32(key.encode('utf-8', 'surrogatepass')) % stripes
+    return hash(key) % stripes
+
+
+class _Stripe:
+    __slots__ = ('lock', 'entries', 'capacity', 'next_sweep')
+
+    def __init__(self, capacity: int):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self.capacity = capacity
+        self.next_sweep = 0.0
+
+
+class TTLCache:
+    """
+    In-memory cache bounded by entry count, with expiry and LRU eviction
+
+    Keys are spread over lock stripes so concurrent threads rarely wait on each
+    other; each stripe holds an equal share of max_entries and evicts its least
+    recently used entry when full (so eviction order is LRU per stripe).
+    Expired entries are dropped when read and by a sweep of the stripe that a
+    write runs at most every sweep_seconds, so they do not linger until evicted.
+
+    Values are returned as stored; callers that mutate them should store copies.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None,
+                 stripes: int = DEFAULT_STRIPES, sweep_seconds: Optional[float] = None):
+        """
+        Args:
+            max_entries: Most entries held across all stripes
+            ttl: Default lifetime of an entry in seconds (None: until evicted)
+            stripes: Number of lock stripes (fewer for small caches)
+            sweep_seconds: Least time between expiry sweeps of a stripe
+                           (default: half the TTL, at most a minute)
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        stripe_count = max(1, min(stripes, self.max_entries))
+        base, extra = divmod(self.max_entries, stripe_count)
+        self._stripes = [_Stripe(base + (1 if i < extra else 0)) for i in range(stripe_count)]
+        if sweep_seconds is None:
+            sweep_seconds = min(ttl / 2, 60.0) if ttl else 60.0
+        self.sweep_seconds = sweep_seconds
+
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'expirations': 0}
+
+    def _stripe(self, key: Hashable) -> _Stripe:
+        return self._stripes[_stripe_index(key, len(self._stripes))]
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Value of an unexpired entry (marking it recently used), else default"""
+        stripe = self._stripe(key)
+        expired = False
+        with stripe.lock:
+            entry = stripe.entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                if entry[0] is None or time.time() < entry[0]:
+                    stripe.entries.move_to_end(key)
+                    value = entry[1]
+                else:
+                    del stripe.entries[key]
+                    entry = _MISSING
+                    expired = True
+        if entry is _MISSING:
+            self._count('misses')
+            if expired:
+                self._count('expirations')
+            return default
+        self._count('hits')
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value for ttl seconds (default: the cache TTL)"""
+        lifetime = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + lifetime if lifetime is not None else None
+        stripe = self._stripe(key)
+        evicted = expired = 0
+        with stripe.lock:
+            if now >= stripe.next_sweep:
+                expired = self._sweep(stripe, now)
+                stripe.next_sweep = now + self.sweep_seconds
+            stripe.entries[key] = (expires_at, value)
+            stripe.entries.move_to_end(key)
+            while len(stripe.entries) > stripe.capacity:
+                stripe.entries.popitem(last=False)
+                evicted += 1
+        self._count('sets')
+        if evicted:
+            self._count('evictions', evicted)
+        if expired:
+            self._count('expirations', expired)
+
+    @staticmethod
+    def _sweep(stripe: _Stripe, now: float) -> int:
+        expired_keys = [key for key, (expires_at, _) in stripe.entries.items()
+                        if expires_at is not None and expires_at <= now]
+        for key in expired_keys:
+            del stripe.entries[key]
+        return len(expired_keys)
+
+    def delete(self, key: Hashable) -> bool:
+        """Remove an entry; returns whether it was present"""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            return stripe.entries.pop(key, _MISSING) is not _MISSING
+
+    def clear(self) -> int:
+        """Remove every entry; returns how many there were"""
+        removed = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                removed += len(stripe.entries)
+                stripe.entries.clear()
+        return removed
+
+    def expire(self) -> int:
+        """Drop every expired entry now; returns how many were dropped"""
+        now = time.time()
+        expired = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                expired += self._sweep(stripe, now)
+                stripe.next_sweep = now + self.sweep_seconds
+        if expired:
+            self._count('expirations', expired)
+        return expired
+
+    def __len__(self) -> int:
+        total = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                total += len(stripe.entries)
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count and hit/miss/eviction counters for monitoring"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        return {
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+            **stats
+        }
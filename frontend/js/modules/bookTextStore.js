@@ -0,0 +1,100 @@
+// AudioBook Organizer - Book Text Store Client
+// Imported book text lives server-side as content-addressed chunks; projects keep
+// a small reference ({hash, length, title, ...}) and fetch the text in ranges.
+
+const TEXT_STORE_ENDPOINT = '/texts';
+
+/**
+ * Fetch part of a stored text
+ * @param {string} hash - Text hash from a text reference
+ * @param {Object} range - {offset, length}, {line, count} or {paragraph, count}
+ * @returns {Promise<Object>} {text, offset, length, total_length, ...}
+ */
+export async function fetchBookTextRange(hash, range = {}) {
+    const query = new URLSearchParams();
+    Object.entries(range).forEach(([key, value]) => {
+        if (value !== undefined && value !== null) {
+            query.set(key, String(value));
+        }
+    });
+
+    const response = await window.authModule.apiRequest(`${TEXT_STORE_ENDPOINT}/${hash}/range?${query}`, {
+        method: 'GET'
+    });
+    if (!response.ok) {
+        throw new Error(`Could not load book text (status ${response.status})`);
+    }
+    return response.json();
+}
+
+/**
+ * Fetch a complete stored text, page by page
+ * @param {Object} textRef - Text reference ({hash, length})
+ * @returns {Promise<string>} The full text
+ */
+export async function fetchBookText(textRef) {
+    const pieces = [];
+    let offset = 0;
+    do {
+        const page = await fetchBookTextRange(textRef.hash, { offset });
+        if (!page.length) {
+            break;
+        }
+        pieces.push(page.text);
+        offset = page.offset + page.length;
+    } while (offset < textRef.length);
+
+    const text = pieces.join('');
+    if (text.length !== textRef.length) {
+        console.warn('⚠️ Stored book text length differs from its reference');
+    }
+    return text;
+}
+
+/**
+ * Store a text server-side and get its reference
+ * @param {string} text - Book text
+ * @returns {Promise<Object|null>} Text reference, or null when the store is unavailable
+ */
+export async function storeBookText(text) {
+    try {
+        let body = JSON.stringify({ text });
+        const headers = {};
+        if (typeof CompressionStream !== 'undefined') {
+            const stream = new Blob([body]).stream().pipeThrough(new CompressionStream('gzip'));
+            body = await new Response(stream).blob();
+            headers['Content-Encoding'] = 'gzip';
+        }
+
+        const response = await window.authModule.apiRequest(TEXT_STORE_ENDPOINT, {
+            method: 'POST',
+            headers: headers,
+            body: body
+        });
+        if (!response.ok) {
+            return null;
+        }
+        const result = await response.json();
+        return result.success ? result.text_ref : null;
+    } catch (error) {
+        console.warn('⚠️ Could not store book text:', error);
+        return null;
+    }
+}
+
+/**
+ * Search the book text of the current project
+ * @param {string} query - Words to find (case- and accent-insensitive)
+ * @param {Object} options - {mode: 'all'|'phrase', page, perPage}
+ * @returns {Promise<Object>} {total, page, has_more, results: [{offset, length, score, snippet}]}
+ */
+export async function searchProject(query, { mode = 'all', page = 1, perPage = 20 } = {}) {
+    const params = new URLSearchParams({ q: query, mode, page: String(page), per_page: String(perPage) });
+    const response = await window.authModule.apiRequest(`/projects/search?${params}`, {
+        method: 'GET'
+    });
+    if (!response.ok) {
+        throw new Error(`Search failed (status ${response.status})`);
+    }
+    return response.json();
+}
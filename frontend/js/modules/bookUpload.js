@@ -1,11 +1,12 @@
 // AudioBook Organizer - Book Upload Module
 
-import { setBookText, clearChapters, chapters } from './state.js';
+import { setBookText, setBookTextRef, clearChapters, chapters } from './state.js';
 import { updateChaptersList, updateSelectionColor } from './ui.js';
 import { initializeSmartSelect } from './smartSelect.js';
 import { showError } from './notifications.js';
 import { clearFormatting } from './formattingState.js';
 import { apiFetch } from './api.js';
+import { fetchBookText } from './bookTextStore.js';
 import { checkCreditsForAction, updateUserCredits, consumeTestCredits } from './appUI.js';
 import { getCreditCost } from './creditConfig.js';
 
@@ -406,14 +407,20 @@ console.log('📊 Text lengths analyzed for backend and frontend comparison');
     
     console.log(`📊 Merged result: ${mergedRanges.length} total formatting ranges`);
     
+    // The backend outline indexes the backend text, so only keep it when that text won
+    const outline = baseText === backendText ? backendResult.formatting_data?.outline : undefined;
+    
     return {
         success: true,
         text: baseText,
         formatting_data: {
             ranges: mergedRanges,
+            ...(outline ? { outline } : {}),
             version: '2.0',
             source: 'hybrid_processing'
         },
+        // The stored (and search-indexed) text is the backend's
+        textRef: baseText === backendText ? backendResult.textRef || null : null,
         metadata: {
             processing_method: 'hybrid',
             primary_source: baseText === backendText ? 'backend' : 'frontend',
@@ -427,15 +434,48 @@ console.log('📊 Text lengths analyzed for backend and frontend comparison');
     };
 }
 
+// Read a newline-delimited JSON response, calling onRecord for every parsed line
+async function readNdjsonStream(response, onRecord) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        let newlineIndex;
+        while ((newlineIndex = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newlineIndex).trim();
+            buffer = buffer.slice(newlineIndex + 1);
+            if (line) onRecord(JSON.parse(line));
+        }
+    }
+
+    buffer += decoder.decode();
+    if (buffer.trim()) onRecord(JSON.parse(buffer));
+}
+
+// Show streamed text immediately while the rest of the document is still being extracted
+function appendStreamPreview(text) {
+    const bookContent = document.getElementById('bookContent');
+    if (bookContent) {
+        bookContent.appendChild(document.createTextNode(text));
+    }
+}
+
 // Process DOCX file with backend (for backward compatibility and plain text)
 async function processDocxFile(file) {
     const formData = new FormData();
     formData.append('file', file);
 
     try {
-        const response = await apiFetch('/upload/docx', {
+        // Ask for progressive NDJSON so the first pages render before extraction finishes
+        const response = await apiFetch('/upload/docx?stream=ndjson', {
             method: 'POST',
             body: formData,
+            headers: { 'Accept': 'application/x-ndjson' }
         });
 
         if (!response.ok) {
@@ -445,17 +485,59 @@ async function processDocxFile(file) {
             throw new Error(errorData.message || `HTTP error! status: ${response.status}`);
         }
 
-        const data = await response.json();
-        
-        if (!data.success) {
-            throw new Error(data.message || 'Failed to process DOCX file on backend');
+        // Non-streaming backends answer with a single JSON document
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!contentType.includes('application/x-ndjson') || !response.body) {
+            const data = await response.json();
+            
+            if (!data.success) {
+                throw new Error(data.message || 'Failed to process DOCX file on backend');
+            }
+
+            return {
+                success: true,
+                text: data.text,
+                formatting_data: data.formatting_data,
+                textRef: data.text_ref || null,
+                metadata: data.metadata || { processing_method: 'backend' }
+            };
+        }
+
+        const textParts = [];
+        const ranges = [];
+        let finalRecord = null;
+        let errorRecord = null;
+
+        await readNdjsonStream(response, (record) => {
+            if (record.type === 'chunk') {
+                textParts.push(record.text);
+                for (const range of record.ranges) {
+                    ranges.push(range);
+                }
+                appendStreamPreview(record.text);
+            } else if (record.type === 'metadata') {
+                finalRecord = record;
+            } else if (record.type === 'error') {
+                errorRecord = record;
+            }
+        });
+
+        if (errorRecord) {
+            throw new Error(errorRecord.error || 'Failed to process DOCX file on backend');
+        }
+        if (!finalRecord || !finalRecord.success) {
+            throw new Error('DOCX stream ended before processing completed');
         }
 
         return {
             success: true,
-            text: data.text,
-            formatting_data: data.formatting_data,
-            metadata: data.metadata || { processing_method: 'backend' }
+            text: textParts.join(''),
+            formatting_data: {
+                ...finalRecord.formatting_data,
+                ranges
+            },
+            textRef: finalRecord.text_ref || null,
+            metadata: finalRecord.metadata || { processing_method: 'backend' }
         };
     } catch (error) {
         console.error('❌ Backend DOCX processing error:', error);
@@ -574,7 +656,7 @@ async function processFileUpload(file) {
     showLoading(file);
     
     try {
-        let text, formattingData = null, metadata = null;
+        let text, formattingData = null, metadata = null, textRef = null;
         
         // Check credits before processing DOCX
         if (file.type === 'application/vnd.openxmlformats-officedocument.wordprocessingml.document') {
@@ -597,6 +679,7 @@ async function processFileUpload(file) {
             text = result.text;
             formattingData = result.formatting_data;
             metadata = result.metadata;
+            textRef = result.textRef || null;
             
             // **SECURITY FIX: Removed text length logging to prevent user content exposure**
 console.log(`✅ DOCX processed: ${formattingData.ranges.length} formatting ranges`);
@@ -618,9 +701,14 @@ console.log(`✅ DOCX processed: ${formattingData.ranges.length} formatting rang
             console.log('✅ Backend TXT processing completed:', result);
             text = result.text;
             metadata = result.metadata;
+            textRef = result.textRef;
         }
         
         await handleUploadSuccess(text, formattingData, metadata);
+        if (textRef) {
+            // Saves reference the stored text instead of re-sending it
+            setBookTextRef(textRef);
+        }
         
     } catch (error) {
         handleUploadError(error);
@@ -636,7 +724,8 @@ async function processTextFile(file) {
 
     try {
         // **SECURITY FIX: Removed API endpoint logging**
-        const response = await apiFetch('/upload/txt', {
+        // inline=0: when the server keeps the text in the book text store it only returns a reference
+        const response = await apiFetch('/upload/txt?inline=0', {
             method: 'POST',
             body: formData,
         });
@@ -657,9 +746,11 @@ async function processTextFile(file) {
         }
 
         console.log('✅ TXT file processed successfully by backend');
+        const text = typeof data.text === 'string' ? data.text : await fetchBookText(data.text_ref);
         return {
             success: true,
-            text: data.text,
+            text: text,
+            textRef: data.text_ref || null,
             metadata: data.metadata || { processing_method: 'backend_txt' }
         };
     } catch (error) {
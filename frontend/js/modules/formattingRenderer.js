@@ -3,6 +3,20 @@
 import { formattingData } from './formattingState.js';
 import { bookText } from './state.js';
 import { getNodeOffset } from '../utils/helpers.js';
+import { apiFetch } from './api.js';
+
+// Large books are rendered server-side into HTML segments that are hydrated as they scroll into view
+const SERVER_RENDER_MIN_TEXT_LENGTH = 200000;
+const SERVER_RENDER_MIN_RANGES = 5000;
+const SERVER_RENDER_TYPES = new Set([
+    'title', 'subtitle', 'section', 'subsection', 'heading',
+    'quote', 'bold', 'italic', 'underline'
+]);
+const SEGMENT_PREFETCH_MARGIN = '1500px 0px';
+
+// Incremented on every render so late responses from a superseded render are ignored
+let renderGeneration = 0;
+let segmentObserver = null;
 
 // Apply formatting to the book content DOM with enhanced DOCX support
 export function applyFormattingToDOM() {
@@ -12,6 +26,19 @@ export function applyFormattingToDOM() {
         return;
     }
     
+    renderGeneration++;
+    disconnectSegmentObserver();
+    
+    if (shouldUseServerRendering(bookContent)) {
+        applyServerRenderedFormatting(bookContent, renderGeneration);
+        return;
+    }
+    
+    applyClientRenderedFormatting(bookContent);
+}
+
+// Render every formatting range in the browser
+function applyClientRenderedFormatting(bookContent) {
     console.log('🎨 FORMATTING: Starting enhanced DOM formatting application...');
     // **SECURITY FIX: Removed text content length logging to prevent user content exposure**
 console.log('🎨 FORMATTING: Book content loaded and ready for formatting');
@@ -51,6 +78,133 @@ console.log('🎨 FORMATTING: Book content loaded and ready for formatting');
     validateDocxFormatting();
 }
 
+// Server rendering only covers big books whose ranges are all plain styled spans
+function shouldUseServerRendering(bookContent) {
+    if (typeof IntersectionObserver === 'undefined' || typeof bookText !== 'string') {
+        return false;
+    }
+    if (bookText.length < SERVER_RENDER_MIN_TEXT_LENGTH && formattingData.ranges.length < SERVER_RENDER_MIN_RANGES) {
+        return false;
+    }
+    // Comment indicators are inserted into the text and would be lost on hydration
+    if (formattingData.comments.length > 0) {
+        return false;
+    }
+    if (Math.abs(bookText.length - bookContent.textContent.length) >= 10) {
+        return false;
+    }
+    return formattingData.ranges.every(range => SERVER_RENDER_TYPES.has(range.type));
+}
+
+// Lay the book out as plain-text segments, then swap in server HTML as segments approach the viewport
+async function applyServerRenderedFormatting(bookContent, generation) {
+    const text = bookText;
+    
+    try {
+        const response = await apiFetch('/formatting/render', {
+            method: 'POST',
+            body: JSON.stringify({
+                text: text,
+                ranges: formattingData.ranges.map(({ start, end, type }) => ({ start, end, type }))
+            })
+        });
+        
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        
+        const manifest = await response.json();
+        if (generation !== renderGeneration) return;
+        if (manifest.text_length !== text.length) {
+            throw new Error('Rendered text length does not match the book');
+        }
+        
+        const cursorPosition = getCurrentCursorPosition();
+        const sectionHighlights = saveExistingSectionHighlights(bookContent);
+        
+        // Placeholders hold the exact segment text, so offsets are correct before hydration
+        const fragment = document.createDocumentFragment();
+        const segments = manifest.segments.map(segment => {
+            const element = document.createElement('span');
+            element.className = 'formatted-segment';
+            element.dataset.segmentIndex = segment.index.toString();
+            element.textContent = text.substring(segment.start, segment.end);
+            fragment.appendChild(element);
+            return { ...segment, element, text: element.textContent };
+        });
+        
+        bookContent.innerHTML = '';
+        bookContent.appendChild(fragment);
+        
+        if (cursorPosition !== -1) {
+            setCursorPosition(cursorPosition);
+        }
+        if (sectionHighlights.length > 0) {
+            restoreSectionHighlightsAfterFormatting(bookContent, sectionHighlights);
+        }
+        
+        observeSegmentsForHydration(manifest.content_hash, segments, generation);
+        console.log(`🎨 FORMATTING: Server rendered ${formattingData.ranges.length} ranges into ${segments.length} segments`);
+        
+    } catch (error) {
+        console.warn('⚠️ FORMATTING: Server rendering unavailable, rendering in browser:', error.message);
+        if (generation === renderGeneration) {
+            applyClientRenderedFormatting(bookContent);
+        }
+    }
+}
+
+// Fetch and apply each segment's HTML the first time it nears the viewport
+function observeSegmentsForHydration(contentHash, segments, generation) {
+    const segmentsByElement = new Map(segments.map(segment => [segment.element, segment]));
+    
+    segmentObserver = new IntersectionObserver((entries, observer) => {
+        entries.forEach(entry => {
+            if (!entry.isIntersecting) return;
+            
+            const segment = segmentsByElement.get(entry.target);
+            observer.unobserve(entry.target);
+            segmentsByElement.delete(entry.target);
+            hydrateSegment(contentHash, segment, generation);
+        });
+    }, { rootMargin: SEGMENT_PREFETCH_MARGIN });
+    
+    segments.forEach(segment => segmentObserver.observe(segment.element));
+}
+
+async function hydrateSegment(contentHash, segment, generation) {
+    try {
+        const response = await apiFetch(`/formatting/render/${contentHash}/${segment.index}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        
+        const data = await response.json();
+        const element = segment.element;
+        
+        // Skip segments that were re-rendered or edited since the placeholder was laid out
+        if (generation !== renderGeneration || !element.isConnected || element.textContent !== segment.text) {
+            return;
+        }
+        
+        // Section highlights inside the segment are re-applied on top of the formatted HTML
+        const sectionHighlights = saveExistingSectionHighlights(element);
+        element.innerHTML = data.html;
+        if (sectionHighlights.length > 0) {
+            restoreSectionHighlightsAfterFormatting(element, sectionHighlights);
+        }
+    } catch (error) {
+        console.warn(`⚠️ FORMATTING: Failed to load rendered segment ${segment.index}:`, error.message);
+    }
+}
+
+function disconnectSegmentObserver() {
+    if (segmentObserver) {
+        segmentObserver.disconnect();
+        segmentObserver = null;
+    }
+}
+
 // Enhanced DOM preparation specifically optimized for DOCX imports
 function prepareCleanDOMForDocx(bookContent) {
     console.log('🔧 DOCX FORMATTING: Preparing optimized DOM for DOCX import...');
@@ -7,6 +7,16 @@ export let formattingData = {
     version: '1.0'
 };
 
+// Heading types that make up the table of contents outline
+const OUTLINE_HEADING_TYPES = ['title', 'subtitle', 'section', 'subsection'];
+
+// Drop the server-built outline once headings are edited by hand; the TOC rescans ranges instead
+function invalidateOutlineForType(type) {
+    if (formattingData.outline && OUTLINE_HEADING_TYPES.includes(type)) {
+        delete formattingData.outline;
+    }
+}
+
 // Formatting range class for type safety and consistent structure
 export class FormattingRange {
     constructor(start, end, type, level = 1, data = {}) {
@@ -77,6 +87,7 @@ export function addFormattingRange(start, end, type, level = 1, data = {}) {
     // Create and add the new range
     const range = new FormattingRange(start, end, type, level, data);
     formattingData.ranges.push(range);
+    invalidateOutlineForType(type);
     
     // Sort ranges by start position and length for consistent rendering
     formattingData.ranges.sort((a, b) => {
@@ -99,6 +110,7 @@ export function removeFormattingRange(id) {
     const index = formattingData.ranges.findIndex(range => range.id === id);
     if (index !== -1) {
         const removedRange = formattingData.ranges.splice(index, 1)[0];
+        invalidateOutlineForType(removedRange.type);
         console.log(`🎨 FORMATTING STATE: Removed formatting range ${id} (${removedRange.type})`);
         return true;
     }
@@ -174,6 +186,18 @@ export function updateFormattingPositions(insertPosition, insertLength, deleteLe
         // If change is after the range, no update needed
     });
     
+    // Update outline entries the same way so the TOC keeps pointing at its headings
+    if (formattingData.outline) {
+        formattingData.outline.forEach(entry => {
+            if (insertPosition <= entry.start) {
+                entry.start += netChange;
+                entry.end += netChange;
+            } else if (insertPosition < entry.end) {
+                entry.end = Math.max(entry.start + 1, entry.end + netChange);
+            }
+        });
+    }
+    
     // Update comment positions
     formattingData.comments.forEach(comment => {
         if (comment.position >= insertPosition) {
@@ -211,6 +235,7 @@ export function clearFormatting() {
     
     formattingData.ranges = [];
     formattingData.comments = [];
+    delete formattingData.outline;
     
     console.log(`Cleared ${rangeCount} formatting ranges and ${commentCount} comments`);
 }
@@ -230,6 +255,11 @@ export function setFormattingData(newData) {
         version: newData.version || '1.0'
     };
     
+    // Heading outline produced during DOCX import (level, title, offsets)
+    if (Array.isArray(newData.outline)) {
+        formattingData.outline = newData.outline;
+    }
+    
     // Clean up any invalid ranges after loading
     cleanupFormattingRanges();
     
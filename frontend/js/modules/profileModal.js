@@ -13,6 +13,7 @@ class ProfileModal {
         this.userData = null;
         this.usageHistory = null;
         this.currentPage = 1;
+        this.historyCursors = [null]; // historyCursors[i] is the cursor that starts page i + 1
         this.actionFilter = null;
         this.isLoading = false;
         this.isDeleting = false; // Prevent multiple deletion attempts
@@ -56,9 +57,10 @@ class ProfileModal {
     async fetchUserData() {
         try {
             // Fetch profile and usage history in parallel
-            const [profileResponse, historyResponse, creditsResponse] = await Promise.all([
+            this.historyCursors = [null];
+            const [profileResponse, historyData, creditsResponse] = await Promise.all([
                 apiFetch('/auth/profile'),
-                apiFetch('/auth/usage-history?page=1&per_page=10'),
+                this.fetchUsageHistory(1, this.actionFilter),
                 apiFetch('/auth/credits')
             ]);
 
@@ -66,17 +68,12 @@ class ProfileModal {
                 throw new Error('Failed to fetch profile data');
             }
 
-            if (!historyResponse.ok) {
-                throw new Error('Failed to fetch usage history');
-            }
-
             if (!creditsResponse.ok) {
                 throw new Error('Failed to fetch credits data');
             }
 
-            const [profileData, historyData, creditsData] = await Promise.all([
+            const [profileData, creditsData] = await Promise.all([
                 profileResponse.json(),
-                historyResponse.json(),
                 creditsResponse.json()
             ]);
 
@@ -91,7 +88,12 @@ class ProfileModal {
 
     async fetchUsageHistory(page = 1, actionFilter = null) {
         try {
+            // Pages continue from the cursor returned with the previous page
             let url = `/auth/usage-history?page=${page}&per_page=10`;
+            const cursor = this.historyCursors[page - 1];
+            if (cursor) {
+                url += `&cursor=${encodeURIComponent(cursor)}`;
+            }
             if (actionFilter) {
                 url += `&action_filter=${actionFilter}`;
             }
@@ -101,7 +103,11 @@ class ProfileModal {
                 throw new Error('Failed to fetch usage history');
             }
 
-            return await response.json();
+            const history = await response.json();
+            if (history.pagination?.next_cursor) {
+                this.historyCursors[page] = history.pagination.next_cursor;
+            }
+            return history;
         } catch (error) {
             console.error('Error fetching usage history:', error);
             throw error;
@@ -123,6 +129,7 @@ class ProfileModal {
                 this.isOpen = false;
                 this.currentTab = 'profile';
                 this.currentPage = 1;
+                this.historyCursors = [null];
                 this.actionFilter = null;
             }, 300);
         } else {
@@ -131,6 +138,7 @@ class ProfileModal {
             this.isOpen = false;
             this.currentTab = 'profile';
             this.currentPage = 1;
+            this.historyCursors = [null];
             this.actionFilter = null;
         }
     }
@@ -532,11 +540,12 @@ class ProfileModal {
     }
 
     getPaginationHTML(pagination) {
-        if (!pagination || pagination.pages <= 1) {
+        if (!pagination || (pagination.page <= 1 && !pagination.has_more)) {
             return '';
         }
 
-        const { page, pages } = pagination;
+        // Pages are fetched by cursor, so only the neighbouring pages can be reached
+        const { page, pages, has_more, total_is_estimate } = pagination;
         let paginationHTML = '<div class="pagination">';
 
         // Previous button
@@ -544,14 +553,12 @@ class ProfileModal {
             paginationHTML += `<button onclick="window.safeProfileChangePage(${page - 1})">Previous</button>`;
         }
 
-        // Page numbers
-        for (let i = Math.max(1, page - 2); i <= Math.min(pages, page + 2); i++) {
-            const activeClass = i === page ? 'active' : '';
-            paginationHTML += `<button class="${activeClass}" onclick="window.safeProfileChangePage(${i})">${i}</button>`;
-        }
+        // Current page (the total may be an estimate, or still being counted)
+        const ofPages = pages ? ` of ${total_is_estimate ? '~' : ''}${Math.max(pages, page)}` : '';
+        paginationHTML += `<button class="active" disabled>Page ${page}${ofPages}</button>`;
 
         // Next button
-        if (page < pages) {
+        if (has_more) {
             paginationHTML += `<button onclick="window.safeProfileChangePage(${page + 1})">Next</button>`;
         }
 
@@ -620,6 +627,9 @@ class ProfileModal {
     }
 
     async changePage(page) {
+        if (page > 1 && !this.historyCursors[page - 1]) {
+            return; // No cursor leads to that page
+        }
         try {
             this.currentPage = page;
             
@@ -651,6 +661,7 @@ class ProfileModal {
         try {
             this.actionFilter = filterValue || null;
             this.currentPage = 1;
+            this.historyCursors = [null];
             
             // Show loading state in the table body only
             const tableBody = document.querySelector('.usage-history-table tbody');
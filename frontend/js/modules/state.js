@@ -2,6 +2,8 @@
 
 // Global application state - preserving exact structure from original
 export let bookText = '';
+// Reference to bookText in the server-side book text store, while the two match
+export let bookTextRef = null;
 export let chapters = [];
 export let currentColorIndex = 1;
 export const MAX_COLORS = 8;
@@ -39,9 +41,15 @@ function triggerAutoSaveIfEnabled() {
 // State setters with auto-save triggers
 export function setBookText(text) {
     bookText = text;
+    bookTextRef = null;
     triggerAutoSaveIfEnabled();
 }
 
+// Set after setBookText() once the same text is known to be stored server-side
+export function setBookTextRef(textRef) {
+    bookTextRef = textRef;
+}
+
 export function setChapters(newChapters) {
     chapters = newChapters;
     triggerAutoSaveIfEnabled();
@@ -1,6 +1,6 @@
 // AudioBook Organizer - Storage Management
 
-import { bookText, chapters, currentColorIndex, setBookText, setChapters, setCurrentColorIndex, setAutoSaveTrigger, findChapter } from './state.js';
+import { bookText, bookTextRef, chapters, currentColorIndex, setBookText, setBookTextRef, setChapters, setCurrentColorIndex, setAutoSaveTrigger, findChapter } from './state.js';
 import { updateChaptersList } from './ui.js';
 import { getNodeOffset, findTextNodeWithContent } from '../utils/helpers.js';
 import { createBlob, createObjectURL, revokeObjectURL, createDownloadLink } from '../utils/dom.js';
@@ -8,6 +8,7 @@ import { showError, showSuccess, showConfirm, showWarning } from './notification
 import { initializeSmartSelect } from './smartSelect.js';
 import { formattingData, setFormattingData, clearFormatting } from './formattingState.js';
 import { apiFetch } from './api.js';
+import { fetchBookText, storeBookText } from './bookTextStore.js';
 
 // Save/Load functions - preserving exact logic from original
 export function saveProgress() {
@@ -569,11 +570,196 @@ let autoSaveInterval = null;
 const AUTO_SAVE_DELAY = 2000; // 2 seconds debounce
 const AUTO_SAVE_INTERVAL = 30000; // 30 seconds periodic save
 
+/**
+ * Delta save state - the last project state the server acknowledged and its version.
+ * Saves send patch operations against it; a full save is used when there is no base
+ * yet, the patch is not meaningfully smaller, or the server reports a conflict.
+ */
+let lastSavedProject = null;
+let lastSavedVersion = null;
+let lastSavedHash = null;
+let saveInProgress = false;
+let saveQueued = false;
+const DELTA_MAX_SIZE_RATIO = 0.5; // Send a delta only if it is under half the full payload
+const GZIP_SAVE_MIN_BYTES = 64 * 1024; // Full saves above this are sent gzip-encoded
+const BOOK_TEXT_REF_MIN_CHARS = 256 * 1024; // Larger texts are kept in the server-side text store
+let bookTextStoreFailedFor = null; // Text the store last rejected, so it is not re-sent on every save
+
+// Refreshed on every save - a change in these alone does not need saving
+const VOLATILE_PROJECT_PATHS = new Set(['/timestamp', '/projectMetadata/lastModified']);
+
+function escapePointerToken(key) {
+    return String(key).replace(/~/g, '~0').replace(/\//g, '~1');
+}
+
+function isPlainObject(value) {
+    return value !== null && typeof value === 'object' && !Array.isArray(value);
+}
+
+/**
+ * Build JSON-patch operations that turn `before` into `after`
+ * Objects are diffed per key and arrays per index (appends use '/-')
+ */
+function buildProjectPatch(before, after, path = '', operations = []) {
+    if (before === after) {
+        return operations;
+    }
+    
+    if (isPlainObject(before) && isPlainObject(after)) {
+        Object.keys(before).forEach(key => {
+            if (!(key in after)) {
+                operations.push({ op: 'remove', path: `${path}/${escapePointerToken(key)}` });
+            }
+        });
+        Object.keys(after).forEach(key => {
+            const keyPath = `${path}/${escapePointerToken(key)}`;
+            if (!(key in before)) {
+                operations.push({ op: 'add', path: keyPath, value: after[key] });
+            } else {
+                buildProjectPatch(before[key], after[key], keyPath, operations);
+            }
+        });
+        return operations;
+    }
+    
+    if (Array.isArray(before) && Array.isArray(after)) {
+        const common = Math.min(before.length, after.length);
+        for (let i = 0; i < common; i++) {
+            buildProjectPatch(before[i], after[i], `${path}/${i}`, operations);
+        }
+        for (let i = common; i < after.length; i++) {
+            operations.push({ op: 'add', path: `${path}/-`, value: after[i] });
+        }
+        // Remove from the end so earlier indexes stay valid
+        for (let i = before.length - 1; i >= after.length; i--) {
+            operations.push({ op: 'remove', path: `${path}/${i}` });
+        }
+        return operations;
+    }
+    
+    operations.push({ op: 'replace', path: path, value: after });
+    return operations;
+}
+
+/**
+ * Remember the state the server now holds, as the base for the next delta save
+ */
+function setSavedProjectBase(projectSnapshot, version, contentHash = null) {
+    if (typeof version === 'number') {
+        lastSavedProject = projectSnapshot;
+        lastSavedVersion = version;
+        lastSavedHash = contentHash;
+    } else {
+        lastSavedProject = null;
+        lastSavedVersion = null;
+        lastSavedHash = null;
+    }
+}
+
+/**
+ * Replace the embedded book text with its reference in the server-side text store
+ * Large texts without a reference are stored first; if that fails the text stays embedded
+ */
+async function withBookTextRef(projectData) {
+    let textRef = bookTextRef;
+    const text = projectData.bookText;
+    if (!textRef && text.length >= BOOK_TEXT_REF_MIN_CHARS && text !== bookTextStoreFailedFor) {
+        textRef = await storeBookText(text);
+        if (!textRef) {
+            bookTextStoreFailedFor = text;
+        } else if (bookText === text) {
+            // Only keep the reference while the text is still the current one
+            setBookTextRef(textRef);
+        }
+    }
+    
+    if (!textRef || textRef.length !== text.length) {
+        return projectData;
+    }
+    const { bookText: _embeddedText, ...projectWithoutText } = projectData;
+    return { ...projectWithoutText, bookTextRef: textRef };
+}
+
+/**
+ * Gzip a large request body in the browser, or return null to send it as-is
+ */
+async function gzipRequestBody(body) {
+    if (typeof CompressionStream === 'undefined' || body.length < GZIP_SAVE_MIN_BYTES) {
+        return null;
+    }
+    try {
+        const stream = new Blob([body]).stream().pipeThrough(new CompressionStream('gzip'));
+        return await new Response(stream).blob();
+    } catch (error) {
+        console.warn('⚠️ Could not compress save request, sending uncompressed:', error);
+        return null;
+    }
+}
+
+/**
+ * Save the complete project, conditional on the server still holding our last saved hash
+ * A 412 means another tab or device saved in between; the save is then repeated unconditionally
+ */
+async function saveProjectFull(fullBody) {
+    const compressedBody = await gzipRequestBody(fullBody);
+    const encodingHeaders = compressedBody ? { 'Content-Encoding': 'gzip' } : {};
+    const body = compressedBody || fullBody;
+    
+    const headers = lastSavedHash ? { ...encodingHeaders, 'If-Match': `"${lastSavedHash}"` } : encodingHeaders;
+    const response = await window.authModule.apiRequest('/projects/save', {
+        method: 'POST',
+        headers: headers,
+        body: body
+    });
+    
+    if (response.status !== 412) {
+        return response;
+    }
+    
+    console.warn('⚠️ Project changed elsewhere since last save, overwriting with current state');
+    setSavedProjectBase(null, null);
+    return window.authModule.apiRequest('/projects/save', {
+        method: 'POST',
+        headers: encodingHeaders,
+        body: body
+    });
+}
+
+/**
+ * Try to save the project as a delta against the last acknowledged version
+ * Returns the response, or null when a full save should be sent instead
+ */
+async function saveProjectDelta(operations, fullBodyLength) {
+    if (!operations) {
+        return null;
+    }
+    
+    const body = JSON.stringify({ base_version: lastSavedVersion, operations });
+    if (body.length >= fullBodyLength * DELTA_MAX_SIZE_RATIO) {
+        return null;
+    }
+    
+    const response = await window.authModule.apiRequest('/projects/save/delta', {
+        method: 'POST',
+        body: body
+    });
+    
+    if (response.status === 409 || response.status === 404) {
+        // Another tab or device saved in between (or the project is gone) - resend everything
+        console.log('🔄 Delta save rejected, falling back to full save');
+        setSavedProjectBase(null, null);
+        return null;
+    }
+    
+    return response;
+}
+
 /**
  * Save current project to database (auto-save)
  * This extends the existing saveProgress() functionality
  */
 export async function saveToDatabase() {
+    let ownsSave = false;
     try {
         // Get current project data using existing function
         const projectData = getCurrentProjectData();
@@ -596,15 +782,43 @@ export async function saveToDatabase() {
             return false;
         }
         
-        // Make API call to save project using authenticated request
-        const response = await window.authModule.apiRequest('/projects/save', {
-            method: 'POST',
-            body: JSON.stringify(projectData)
-        });
+        // One save at a time so every delta is computed against an acknowledged version
+        if (saveInProgress) {
+            saveQueued = true;
+            return false;
+        }
+        saveInProgress = true;
+        ownsSave = true;
+        
+        const fullBody = JSON.stringify(await withBookTextRef(projectData));
+        const projectSnapshot = JSON.parse(fullBody);
+        
+        // Nothing but save timestamps changed since the last acknowledged save
+        const operations = lastSavedProject && lastSavedVersion !== null
+            ? buildProjectPatch(lastSavedProject, projectSnapshot)
+            : null;
+        if (operations && operations.every(operation => VOLATILE_PROJECT_PATHS.has(operation.path))) {
+            console.log('🔄 Skipping auto-save: Project unchanged since last save');
+            return true;
+        }
+        
+        // Make API call to save project using authenticated request (delta when possible)
+        let response = await saveProjectDelta(operations, fullBody.length);
+        if (!response) {
+            response = await saveProjectFull(fullBody);
+        }
+        
+        if (response.status === 422) {
+            // The referenced text is no longer stored - store or embed it again on the next save
+            setBookTextRef(null);
+            saveQueued = true;
+            return false;
+        }
         
         if (response.ok) {
             const result = await response.json();
-            console.log('✅ Project auto-saved to database');
+            setSavedProjectBase(projectSnapshot, result.version, result.content_hash);
+            console.log(result.unchanged ? '✅ Project already up to date in database' : '✅ Project auto-saved to database');
             
             // Track save time for unsaved audio detection
             localStorage.setItem('lastProjectSaveTime', new Date().toISOString());
@@ -624,6 +838,14 @@ export async function saveToDatabase() {
     } catch (error) {
         console.error('❌ Auto-save error:', error);
         return false;
+    } finally {
+        if (ownsSave) {
+            saveInProgress = false;
+            if (saveQueued) {
+                saveQueued = false;
+                triggerAutoSave();
+            }
+        }
     }
 }
 
@@ -694,8 +916,20 @@ export async function loadFromDatabase() {
             if (result.success && result.project) {
                 console.log('📂 Restoring project from database...');
                 
+                // Projects may reference their text in the book text store instead of embedding it
+                const textRef = result.project.bookTextRef;
+                const projectData = textRef && typeof result.project.bookText !== 'string'
+                    ? { ...result.project, bookText: await fetchBookText(textRef) }
+                    : result.project;
+                
                 // Use existing loadProjectDirectly function
-                loadProjectDirectly(result.project);
+                loadProjectDirectly(projectData);
+                if (textRef && projectData !== result.project) {
+                    setBookTextRef(textRef);
+                }
+                
+                // The restored project is what the server holds - future saves patch against it
+                setSavedProjectBase(result.project, result.metadata?.version, result.metadata?.content_hash);
                 
                 // Show restore notification
                 showSuccess(`📂 Project restored! Last saved: ${new Date(result.metadata.updated_at).toLocaleString()}`);
@@ -722,6 +956,29 @@ export async function loadFromDatabase() {
     }
 }
 
+/**
+ * Fetch only some parts of the saved project
+ * @param {string[]} parts - Any of 'text' (bookText), 'structure' (chapters and
+ *   remaining fields) and 'annotations' (highlights, formattingData)
+ * @returns {Promise<{project: Object, metadata: Object}|null>} Partial project data, or null
+ */
+export async function fetchProjectParts(parts) {
+    try {
+        const query = encodeURIComponent(parts.join(','));
+        const response = await window.authModule.apiRequest(`/projects/latest?parts=${query}`, {
+            method: 'GET'
+        });
+        if (!response.ok) {
+            return null;
+        }
+        const result = await response.json();
+        return result.success ? { project: result.project, metadata: result.metadata } : null;
+    } catch (error) {
+        console.error('❌ Error fetching project parts:', error);
+        return null;
+    }
+}
+
 /**
  * Load project data from localStorage (testing mode)
  */
@@ -293,10 +293,37 @@ function extractAndDisplayHeaders() {
     }
 }
 
+/**
+ * Build headers straight from the outline index produced during DOCX import
+ */
+function buildHeadersFromOutline(outline) {
+    return outline
+        .filter(entry => HEADER_CONFIG[entry.type])
+        .map(entry => {
+            const config = HEADER_CONFIG[entry.type];
+            return {
+                id: `${entry.type}-${entry.start}-${entry.end}`,
+                type: entry.type,
+                level: config.level,
+                icon: config.icon,
+                text: entry.title || 'Untitled Header',
+                position: entry.start,
+                endPosition: entry.end,
+                element: null // Will be populated when creating DOM elements
+            };
+        });
+}
+
 /**
  * Extract headers from formatting data
  */
 function extractTableOfContents() {
+    // Server-built outline is already ordered and titled, no need to rescan the text
+    if (Array.isArray(formattingData?.outline) && formattingData.outline.length > 0) {
+        console.log(`📋 Using imported outline with ${formattingData.outline.length} headings`);
+        return buildHeadersFromOutline(formattingData.outline);
+    }
+    
     if (!formattingData?.ranges) {
         console.log('📋 No formatting data available');
         return [];
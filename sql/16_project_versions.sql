@@ -0,0 +1,20 @@
+-- AudioBook Organizer - Project Versions for Delta Autosave
+-- Purpose: Give every saved project a monotonically increasing version so the
+-- client can send patches against a known base and the server can detect
+-- concurrent writes (optimistic concurrency on audiobook_projects.version)
+
+ALTER TABLE public.audiobook_projects
+ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
+COMMENT ON COLUMN public.audiobook_projects.version IS
+    'Incremented on every save; delta saves must name the version they were computed against';
+
+-- Verify the change
+SELECT
+    column_name,
+    is_nullable,
+    data_type,
+    column_default
+FROM information_schema.columns
+WHERE table_name = 'audiobook_projects'
+  AND column_name = 'version';
@@ -0,0 +1,21 @@
+-- AudioBook Organizer - Project Content Hashes
+-- Purpose: Store a hash of each saved project so unchanged autosaves become
+-- no-ops and /api/projects/latest can answer conditional requests with 304.
+-- The hash is computed by the backend (sha256 of the canonical project JSON,
+-- excluding save timestamps) and is NULL until a row is next saved.
+
+ALTER TABLE public.audiobook_projects
+ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+COMMENT ON COLUMN public.audiobook_projects.content_hash IS
+    'sha256 of the canonical project JSON; used as the ETag for project saves and loads';
+
+-- Verify the change
+SELECT
+    column_name,
+    is_nullable,
+    data_type
+FROM information_schema.columns
+WHERE table_name = 'audiobook_projects'
+  AND column_name IN ('version', 'content_hash')
+ORDER BY column_name;
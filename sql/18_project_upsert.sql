@@ -0,0 +1,133 @@
+-- AudioBook Organizer - Single Round-Trip Project Saves
+-- Purpose: Each user has exactly one auto-saved project. Saving used to select the
+-- row and then issue a separate update or insert, which took two PostgREST round
+-- trips and could create duplicate rows when two saves raced. This migration makes
+-- user_id unique and adds save_audiobook_project(), which does the whole save
+-- (If-Match check, unchanged-content skip, version bump, insert-or-update) in one
+-- atomic statement and returns the saved row's id.
+
+-- =================================================================
+-- Step 1: Remove duplicate projects, keeping the most recently updated per user
+-- =================================================================
+DELETE FROM public.audiobook_projects p
+USING (
+    SELECT id,
+           ROW_NUMBER() OVER (
+               PARTITION BY user_id
+               ORDER BY updated_at DESC NULLS LAST, created_at DESC NULLS LAST, id
+           ) AS row_rank
+    FROM public.audiobook_projects
+) ranked
+WHERE p.id = ranked.id
+  AND ranked.row_rank > 1;
+
+-- =================================================================
+-- Step 2: One project row per user
+-- =================================================================
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conname = 'audiobook_projects_user_id_key'
+          AND conrelid = 'public.audiobook_projects'::regclass
+    ) THEN
+        ALTER TABLE public.audiobook_projects
+        ADD CONSTRAINT audiobook_projects_user_id_key UNIQUE (user_id);
+    END IF;
+END;
+$$;
+
+-- =================================================================
+-- Step 3: Atomic save function
+-- =================================================================
+-- p_if_match: stored content hashes the caller accepts ('*' = any existing project);
+--             NULL skips the precondition check
+-- Output columns are prefixed so they cannot clash with table columns inside the body.
+-- Returns one row; precondition_failed rows carry the stored id/version/hash and
+-- nothing is written. unchanged rows mean the stored hash already matched.
+CREATE OR REPLACE FUNCTION public.save_audiobook_project(
+    p_user_id UUID,
+    p_title TEXT,
+    p_description TEXT,
+    p_settings JSONB,
+    p_chapters JSONB,
+    p_content_hash TEXT,
+    p_if_match TEXT[] DEFAULT NULL
+)
+RETURNS TABLE (
+    project_id UUID,
+    project_version INTEGER,
+    project_hash TEXT,
+    unchanged BOOLEAN,
+    precondition_failed BOOLEAN
+)
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = ''
+AS $$
+DECLARE
+    v_id UUID;
+    v_version INTEGER;
+    v_stored_hash TEXT;
+BEGIN
+    IF p_if_match IS NOT NULL THEN
+        -- Lock the row so the check and the write see the same project
+        SELECT p.id, p.version, p.content_hash
+        INTO v_id, v_version, v_stored_hash
+        FROM public.audiobook_projects p
+        WHERE p.user_id = p_user_id
+        FOR UPDATE;
+
+        IF v_id IS NULL
+           OR NOT ('*' = ANY(p_if_match)
+                   OR (v_stored_hash IS NOT NULL AND v_stored_hash = ANY(p_if_match))) THEN
+            RETURN QUERY SELECT v_id, v_version, v_stored_hash, FALSE, TRUE;
+            RETURN;
+        END IF;
+    END IF;
+
+    INSERT INTO public.audiobook_projects AS p (
+        user_id, title, description, status, settings, chapters, content_hash, version
+    )
+    VALUES (
+        p_user_id, p_title, p_description, 'draft', p_settings, p_chapters, p_content_hash, 1
+    )
+    ON CONFLICT (user_id) DO UPDATE
+    SET title = EXCLUDED.title,
+        description = EXCLUDED.description,
+        status = EXCLUDED.status,
+        settings = EXCLUDED.settings,
+        chapters = EXCLUDED.chapters,
+        content_hash = EXCLUDED.content_hash,
+        version = p.version + 1
+    WHERE p.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+    RETURNING p.id, p.version INTO v_id, v_version;
+
+    IF NOT FOUND THEN
+        -- Conflict row already holds this content; the update was skipped
+        SELECT p.id, p.version
+        INTO v_id, v_version
+        FROM public.audiobook_projects p
+        WHERE p.user_id = p_user_id;
+
+        RETURN QUERY SELECT v_id, v_version, p_content_hash, TRUE, FALSE;
+        RETURN;
+    END IF;
+
+    RETURN QUERY SELECT v_id, v_version, p_content_hash, FALSE, FALSE;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.save_audiobook_project(UUID, TEXT, TEXT, JSONB, JSONB, TEXT, TEXT[]) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.save_audiobook_project(UUID, TEXT, TEXT, JSONB, JSONB, TEXT, TEXT[]) TO service_role;
+
+-- Verify the changes
+SELECT conname, pg_get_constraintdef(oid) AS definition
+FROM pg_constraint
+WHERE conrelid = 'public.audiobook_projects'::regclass
+  AND conname = 'audiobook_projects_user_id_key';
+
+SELECT routine_name, security_type
+FROM information_schema.routines
+WHERE routine_schema = 'public'
+  AND routine_name = 'save_audiobook_project';
@@ -0,0 +1,138 @@
+-- AudioBook Organizer - Compressed Project Blobs
+-- Purpose: Large projects can be stored as a compressed blob instead of plain JSONB.
+-- settings holds the full project JSON and chapters duplicates part of it, so every
+-- save of a big book rewrites (and WAL-logs) the whole document twice. With
+-- PROJECT_BLOB_COMPRESSION enabled the backend writes:
+--   settings_blob      base64 of the gzip/zstd-compressed project JSON
+--   settings_encoding  'gzip+base64' or 'zstd+base64' (NULL = project is in settings)
+--   settings_size      uncompressed JSON size in bytes, for size metrics
+--   summary            small uncompressed description (chapter/section counts, ...)
+-- and leaves settings = '{}' and chapters = '[]'. Loads decode the blob transparently.
+--
+-- Existing rows keep working unchanged (settings_encoding IS NULL) and are compressed
+-- on their next save. To convert them up front run:
+--   python -m backend.scripts.compress_project_settings --execute
+
+ALTER TABLE public.audiobook_projects
+ADD COLUMN IF NOT EXISTS settings_blob TEXT,
+ADD COLUMN IF NOT EXISTS settings_encoding TEXT,
+ADD COLUMN IF NOT EXISTS settings_size INTEGER,
+ADD COLUMN IF NOT EXISTS summary JSONB;
+
+COMMENT ON COLUMN public.audiobook_projects.settings_blob IS
+    'Compressed project JSON (base64); used instead of settings when settings_encoding is set';
+COMMENT ON COLUMN public.audiobook_projects.settings_encoding IS
+    'Encoding of settings_blob (gzip+base64 or zstd+base64); NULL when the project is stored in settings';
+COMMENT ON COLUMN public.audiobook_projects.settings_size IS
+    'Uncompressed project JSON size in bytes';
+COMMENT ON COLUMN public.audiobook_projects.summary IS
+    'Small uncompressed project summary (chapter, section and highlight counts)';
+
+-- =================================================================
+-- Save function: same behaviour as migration 18, plus the blob columns.
+-- Callers that omit the blob parameters store plain JSONB and clear any old blob.
+-- =================================================================
+DROP FUNCTION IF EXISTS public.save_audiobook_project(UUID, TEXT, TEXT, JSONB, JSONB, TEXT, TEXT[]);
+
+CREATE OR REPLACE FUNCTION public.save_audiobook_project(
+    p_user_id UUID,
+    p_title TEXT,
+    p_description TEXT,
+    p_settings JSONB,
+    p_chapters JSONB,
+    p_content_hash TEXT,
+    p_if_match TEXT[] DEFAULT NULL,
+    p_settings_blob TEXT DEFAULT NULL,
+    p_settings_encoding TEXT DEFAULT NULL,
+    p_settings_size INTEGER DEFAULT NULL,
+    p_summary JSONB DEFAULT NULL
+)
+RETURNS TABLE (
+    project_id UUID,
+    project_version INTEGER,
+    project_hash TEXT,
+    unchanged BOOLEAN,
+    precondition_failed BOOLEAN
+)
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = ''
+AS $$
+DECLARE
+    v_id UUID;
+    v_version INTEGER;
+    v_stored_hash TEXT;
+BEGIN
+    IF p_if_match IS NOT NULL THEN
+        -- Lock the row so the check and the write see the same project
+        SELECT p.id, p.version, p.content_hash
+        INTO v_id, v_version, v_stored_hash
+        FROM public.audiobook_projects p
+        WHERE p.user_id = p_user_id
+        FOR UPDATE;
+
+        IF v_id IS NULL
+           OR NOT ('*' = ANY(p_if_match)
+                   OR (v_stored_hash IS NOT NULL AND v_stored_hash = ANY(p_if_match))) THEN
+            RETURN QUERY SELECT v_id, v_version, v_stored_hash, FALSE, TRUE;
+            RETURN;
+        END IF;
+    END IF;
+
+    INSERT INTO public.audiobook_projects AS p (
+        user_id, title, description, status, settings, chapters, content_hash, version,
+        settings_blob, settings_encoding, settings_size, summary
+    )
+    VALUES (
+        p_user_id, p_title, p_description, 'draft', p_settings, p_chapters, p_content_hash, 1,
+        p_settings_blob, p_settings_encoding, p_settings_size, p_summary
+    )
+    ON CONFLICT (user_id) DO UPDATE
+    SET title = EXCLUDED.title,
+        description = EXCLUDED.description,
+        status = EXCLUDED.status,
+        settings = EXCLUDED.settings,
+        chapters = EXCLUDED.chapters,
+        content_hash = EXCLUDED.content_hash,
+        settings_blob = EXCLUDED.settings_blob,
+        settings_encoding = EXCLUDED.settings_encoding,
+        settings_size = EXCLUDED.settings_size,
+        summary = EXCLUDED.summary,
+        version = p.version + 1
+    WHERE p.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+    RETURNING p.id, p.version INTO v_id, v_version;
+
+    IF NOT FOUND THEN
+        -- Conflict row already holds this content; the update was skipped
+        SELECT p.id, p.version
+        INTO v_id, v_version
+        FROM public.audiobook_projects p
+        WHERE p.user_id = p_user_id;
+
+        RETURN QUERY SELECT v_id, v_version, p_content_hash, TRUE, FALSE;
+        RETURN;
+    END IF;
+
+    RETURN QUERY SELECT v_id, v_version, p_content_hash, FALSE, FALSE;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.save_audiobook_project(UUID, TEXT, TEXT, JSONB, JSONB, TEXT, TEXT[], TEXT, TEXT, INTEGER, JSONB) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.save_audiobook_project(UUID, TEXT, TEXT, JSONB, JSONB, TEXT, TEXT[], TEXT, TEXT, INTEGER, JSONB) TO service_role;
+
+-- Verify the changes
+SELECT
+    column_name,
+    data_type
+FROM information_schema.columns
+WHERE table_name = 'audiobook_projects'
+  AND column_name IN ('settings_blob', 'settings_encoding', 'settings_size', 'summary')
+ORDER BY column_name;
+
+-- Storage before/after: plain rows vs compressed rows
+SELECT
+    settings_encoding IS NOT NULL AS compressed,
+    COUNT(*) AS projects,
+    pg_size_pretty(SUM(pg_column_size(settings) + pg_column_size(chapters) + COALESCE(pg_column_size(settings_blob), 0))) AS stored_size
+FROM public.audiobook_projects
+GROUP BY 1;
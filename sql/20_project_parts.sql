@@ -0,0 +1,220 @@
+-- AudioBook Organizer - Split Project Parts
+-- Purpose: Store each project as independently versioned parts so loads can fetch
+-- only what the client needs and saves only write what changed:
+--   text         bookText - by far the largest part, never changes after import
+--   structure    chapters, sections and the remaining project fields
+--   annotations  highlights and formattingData
+-- The audiobook_projects row keeps the title, summary, overall content_hash and
+-- version; its settings/chapters/settings_blob are emptied once a project is
+-- saved in parts. Projects saved before this migration stay readable from
+-- settings and are split on their next save.
+
+-- =================================================================
+-- Step 1: Parts table
+-- =================================================================
+CREATE TABLE IF NOT EXISTS public.audiobook_project_parts (
+    project_id UUID REFERENCES public.audiobook_projects(id) ON DELETE CASCADE NOT NULL,
+    user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+    part TEXT NOT NULL CHECK (part IN ('text', 'structure', 'annotations')),
+    content JSONB NOT NULL DEFAULT '{}',
+    content_blob TEXT,
+    content_encoding TEXT,
+    content_size INTEGER,
+    content_hash TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT audiobook_project_parts_pkey PRIMARY KEY (project_id, part)
+);
+
+COMMENT ON TABLE public.audiobook_project_parts IS
+    'Independently versioned parts of an audiobook project (text, structure, annotations)';
+COMMENT ON COLUMN public.audiobook_project_parts.content_blob IS
+    'Compressed part JSON (base64); used instead of content when content_encoding is set';
+
+CREATE INDEX IF NOT EXISTS idx_audiobook_project_parts_user_id ON public.audiobook_project_parts(user_id);
+
+ALTER TABLE public.audiobook_project_parts ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own project parts" ON public.audiobook_project_parts;
+CREATE POLICY "Users can view own project parts"
+ON public.audiobook_project_parts FOR SELECT
+USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can insert own project parts" ON public.audiobook_project_parts;
+CREATE POLICY "Users can insert own project parts"
+ON public.audiobook_project_parts FOR INSERT
+WITH CHECK (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can update own project parts" ON public.audiobook_project_parts;
+CREATE POLICY "Users can update own project parts"
+ON public.audiobook_project_parts FOR UPDATE
+USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can delete own project parts" ON public.audiobook_project_parts;
+CREATE POLICY "Users can delete own project parts"
+ON public.audiobook_project_parts FOR DELETE
+USING (auth.uid() = user_id);
+
+DROP TRIGGER IF EXISTS audiobook_project_parts_updated_at ON public.audiobook_project_parts;
+CREATE TRIGGER audiobook_project_parts_updated_at
+    BEFORE UPDATE ON public.audiobook_project_parts
+    FOR EACH ROW EXECUTE PROCEDURE public.handle_updated_at();
+
+GRANT ALL ON public.audiobook_project_parts TO authenticated;
+GRANT ALL ON public.audiobook_project_parts TO service_role;
+
+-- =================================================================
+-- Step 2: Atomic parts save
+-- =================================================================
+-- p_parts: JSON array of {part, content_hash, content | content_blob + content_encoding,
+--          content_size}. A part sent with only its content_hash is asserted to be
+--          unchanged; if the stored part differs it is reported in missing_parts and
+--          nothing is written, so the caller can resend it with content.
+-- Parts whose stored hash already matches are not rewritten; written_parts lists
+-- the ones that were. If-Match and the unchanged-project skip behave as in
+-- save_audiobook_project (migration 18).
+CREATE OR REPLACE FUNCTION public.save_audiobook_project_parts(
+    p_user_id UUID,
+    p_title TEXT,
+    p_description TEXT,
+    p_content_hash TEXT,
+    p_parts JSONB,
+    p_settings_size INTEGER DEFAULT NULL,
+    p_summary JSONB DEFAULT NULL,
+    p_if_match TEXT[] DEFAULT NULL
+)
+RETURNS TABLE (
+    project_id UUID,
+    project_version INTEGER,
+    project_hash TEXT,
+    unchanged BOOLEAN,
+    precondition_failed BOOLEAN,
+    missing_parts TEXT[],
+    written_parts TEXT[]
+)
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = ''
+AS $$
+DECLARE
+    v_id UUID;
+    v_version INTEGER;
+    v_stored_hash TEXT;
+    v_part JSONB;
+    v_stored_part_hash TEXT;
+    v_missing TEXT[] := '{}';
+    v_written TEXT[] := '{}';
+BEGIN
+    -- Lock the project so the checks below and the writes see the same state
+    SELECT p.id, p.version, p.content_hash
+    INTO v_id, v_version, v_stored_hash
+    FROM public.audiobook_projects p
+    WHERE p.user_id = p_user_id
+    FOR UPDATE;
+
+    IF p_if_match IS NOT NULL
+       AND (v_id IS NULL
+            OR NOT ('*' = ANY(p_if_match)
+                    OR (v_stored_hash IS NOT NULL AND v_stored_hash = ANY(p_if_match)))) THEN
+        RETURN QUERY SELECT v_id, v_version, v_stored_hash, FALSE, TRUE, NULL::TEXT[], NULL::TEXT[];
+        RETURN;
+    END IF;
+
+    IF v_id IS NOT NULL AND v_stored_hash = p_content_hash THEN
+        RETURN QUERY SELECT v_id, v_version, v_stored_hash, TRUE, FALSE, NULL::TEXT[], NULL::TEXT[];
+        RETURN;
+    END IF;
+
+    -- Parts sent by hash only must match what is stored
+    FOR v_part IN SELECT value FROM pg_catalog.jsonb_array_elements(p_parts) LOOP
+        CONTINUE WHEN v_part ? 'content' OR v_part ? 'content_blob';
+
+        SELECT pp.content_hash
+        INTO v_stored_part_hash
+        FROM public.audiobook_project_parts pp
+        WHERE pp.project_id = v_id
+          AND pp.part = v_part->>'part';
+
+        IF v_stored_part_hash IS DISTINCT FROM v_part->>'content_hash' THEN
+            v_missing := pg_catalog.array_append(v_missing, v_part->>'part');
+        END IF;
+    END LOOP;
+
+    IF pg_catalog.cardinality(v_missing) > 0 THEN
+        RETURN QUERY SELECT v_id, v_version, v_stored_hash, FALSE, FALSE, v_missing, NULL::TEXT[];
+        RETURN;
+    END IF;
+
+    INSERT INTO public.audiobook_projects AS p (
+        user_id, title, description, status, settings, chapters, content_hash, version,
+        settings_blob, settings_encoding, settings_size, summary
+    )
+    VALUES (
+        p_user_id, p_title, p_description, 'draft', '{}'::JSONB, '[]'::JSONB, p_content_hash, 1,
+        NULL, NULL, p_settings_size, p_summary
+    )
+    ON CONFLICT (user_id) DO UPDATE
+    SET title = EXCLUDED.title,
+        description = EXCLUDED.description,
+        status = EXCLUDED.status,
+        settings = EXCLUDED.settings,
+        chapters = EXCLUDED.chapters,
+        content_hash = EXCLUDED.content_hash,
+        settings_blob = NULL,
+        settings_encoding = NULL,
+        settings_size = EXCLUDED.settings_size,
+        summary = EXCLUDED.summary,
+        version = p.version + 1
+    RETURNING p.id, p.version INTO v_id, v_version;
+
+    FOR v_part IN SELECT value FROM pg_catalog.jsonb_array_elements(p_parts) LOOP
+        CONTINUE WHEN NOT (v_part ? 'content' OR v_part ? 'content_blob');
+
+        INSERT INTO public.audiobook_project_parts AS pp (
+            project_id, user_id, part, content, content_blob, content_encoding, content_size, content_hash
+        )
+        VALUES (
+            v_id,
+            p_user_id,
+            v_part->>'part',
+            COALESCE(v_part->'content', '{}'::JSONB),
+            v_part->>'content_blob',
+            v_part->>'content_encoding',
+            (v_part->>'content_size')::INTEGER,
+            v_part->>'content_hash'
+        )
+        -- Constraint name rather than column list: project_id is also an output column
+        ON CONFLICT ON CONSTRAINT audiobook_project_parts_pkey DO UPDATE
+        SET content = EXCLUDED.content,
+            content_blob = EXCLUDED.content_blob,
+            content_encoding = EXCLUDED.content_encoding,
+            content_size = EXCLUDED.content_size,
+            content_hash = EXCLUDED.content_hash,
+            version = pp.version + 1
+        WHERE pp.content_hash IS DISTINCT FROM EXCLUDED.content_hash;
+
+        IF FOUND THEN
+            v_written := pg_catalog.array_append(v_written, v_part->>'part');
+        END IF;
+    END LOOP;
+
+    RETURN QUERY SELECT v_id, v_version, p_content_hash, FALSE, FALSE, NULL::TEXT[], v_written;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.save_audiobook_project_parts(UUID, TEXT, TEXT, TEXT, JSONB, INTEGER, JSONB, TEXT[]) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.save_audiobook_project_parts(UUID, TEXT, TEXT, TEXT, JSONB, INTEGER, JSONB, TEXT[]) TO service_role;
+
+-- Verify the changes
+SELECT
+    column_name,
+    data_type
+FROM information_schema.columns
+WHERE table_name = 'audiobook_project_parts'
+ORDER BY ordinal_position;
+
+SELECT routine_name, security_type
+FROM information_schema.routines
+WHERE routine_schema = 'public'
+  AND routine_name = 'save_audiobook_project_parts';
@@ -0,0 +1,151 @@
+-- AudioBook Organizer - Explicit Versions for Buffered Project Saves
+-- Purpose: With write-behind autosave (PROJECT_WRITE_BEHIND_SECONDS > 0) the backend
+-- acknowledges saves from a local spool and flushes only the latest state, so several
+-- acknowledged versions collapse into one database write. save_audiobook_project_parts
+-- gains p_version so the flush stores the version the client was last given (never
+-- lower than the current version + 1), keeping delta saves against it valid.
+
+DROP FUNCTION IF EXISTS public.save_audiobook_project_parts(UUID, TEXT, TEXT, TEXT, JSONB, INTEGER, JSONB, TEXT[]);
+
+CREATE OR REPLACE FUNCTION public.save_audiobook_project_parts(
+    p_user_id UUID,
+    p_title TEXT,
+    p_description TEXT,
+    p_content_hash TEXT,
+    p_parts JSONB,
+    p_settings_size INTEGER DEFAULT NULL,
+    p_summary JSONB DEFAULT NULL,
+    p_if_match TEXT[] DEFAULT NULL,
+    p_version INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    project_id UUID,
+    project_version INTEGER,
+    project_hash TEXT,
+    unchanged BOOLEAN,
+    precondition_failed BOOLEAN,
+    missing_parts TEXT[],
+    written_parts TEXT[]
+)
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = ''
+AS $$
+DECLARE
+    v_id UUID;
+    v_version INTEGER;
+    v_stored_hash TEXT;
+    v_part JSONB;
+    v_stored_part_hash TEXT;
+    v_missing TEXT[] := '{}';
+    v_written TEXT[] := '{}';
+BEGIN
+    -- Lock the project so the checks below and the writes see the same state
+    SELECT p.id, p.version, p.content_hash
+    INTO v_id, v_version, v_stored_hash
+    FROM public.audiobook_projects p
+    WHERE p.user_id = p_user_id
+    FOR UPDATE;
+
+    IF p_if_match IS NOT NULL
+       AND (v_id IS NULL
+            OR NOT ('*' = ANY(p_if_match)
+                    OR (v_stored_hash IS NOT NULL AND v_stored_hash = ANY(p_if_match)))) THEN
+        RETURN QUERY SELECT v_id, v_version, v_stored_hash, FALSE, TRUE, NULL::TEXT[], NULL::TEXT[];
+        RETURN;
+    END IF;
+
+    IF v_id IS NOT NULL AND v_stored_hash = p_content_hash THEN
+        RETURN QUERY SELECT v_id, v_version, v_stored_hash, TRUE, FALSE, NULL::TEXT[], NULL::TEXT[];
+        RETURN;
+    END IF;
+
+    -- Parts sent by hash only must match what is stored
+    FOR v_part IN SELECT value FROM pg_catalog.jsonb_array_elements(p_parts) LOOP
+        CONTINUE WHEN v_part ? 'content' OR v_part ? 'content_blob';
+
+        SELECT pp.content_hash
+        INTO v_stored_part_hash
+        FROM public.audiobook_project_parts pp
+        WHERE pp.project_id = v_id
+          AND pp.part = v_part->>'part';
+
+        IF v_stored_part_hash IS DISTINCT FROM v_part->>'content_hash' THEN
+            v_missing := pg_catalog.array_append(v_missing, v_part->>'part');
+        END IF;
+    END LOOP;
+
+    IF pg_catalog.cardinality(v_missing) > 0 THEN
+        RETURN QUERY SELECT v_id, v_version, v_stored_hash, FALSE, FALSE, v_missing, NULL::TEXT[];
+        RETURN;
+    END IF;
+
+    INSERT INTO public.audiobook_projects AS p (
+        user_id, title, description, status, settings, chapters, content_hash, version,
+        settings_blob, settings_encoding, settings_size, summary
+    )
+    VALUES (
+        p_user_id, p_title, p_description, 'draft', '{}'::JSONB, '[]'::JSONB, p_content_hash,
+        GREATEST(COALESCE(p_version, 1), 1),
+        NULL, NULL, p_settings_size, p_summary
+    )
+    ON CONFLICT (user_id) DO UPDATE
+    SET title = EXCLUDED.title,
+        description = EXCLUDED.description,
+        status = EXCLUDED.status,
+        settings = EXCLUDED.settings,
+        chapters = EXCLUDED.chapters,
+        content_hash = EXCLUDED.content_hash,
+        settings_blob = NULL,
+        settings_encoding = NULL,
+        settings_size = EXCLUDED.settings_size,
+        summary = EXCLUDED.summary,
+        version = GREATEST(p.version + 1, COALESCE(p_version, 0))
+    RETURNING p.id, p.version INTO v_id, v_version;
+
+    FOR v_part IN SELECT value FROM pg_catalog.jsonb_array_elements(p_parts) LOOP
+        CONTINUE WHEN NOT (v_part ? 'content' OR v_part ? 'content_blob');
+
+        INSERT INTO public.audiobook_project_parts AS pp (
+            project_id, user_id, part, content, content_blob, content_encoding, content_size, content_hash
+        )
+        VALUES (
+            v_id,
+            p_user_id,
+            v_part->>'part',
+            COALESCE(v_part->'content', '{}'::JSONB),
+            v_part->>'content_blob',
+            v_part->>'content_encoding',
+            (v_part->>'content_size')::INTEGER,
+            v_part->>'content_hash'
+        )
+        -- Constraint name rather than column list: project_id is also an output column
+        ON CONFLICT ON CONSTRAINT audiobook_project_parts_pkey DO UPDATE
+        SET content = EXCLUDED.content,
+            content_blob = EXCLUDED.content_blob,
+            content_encoding = EXCLUDED.content_encoding,
+            content_size = EXCLUDED.content_size,
+            content_hash = EXCLUDED.content_hash,
+            version = pp.version + 1
+        WHERE pp.content_hash IS DISTINCT FROM EXCLUDED.content_hash;
+
+        IF FOUND THEN
+            v_written := pg_catalog.array_append(v_written, v_part->>'part');
+        END IF;
+    END LOOP;
+
+    RETURN QUERY SELECT v_id, v_version, p_content_hash, FALSE, FALSE, NULL::TEXT[], v_written;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.save_audiobook_project_parts(UUID, TEXT, TEXT, TEXT, JSONB, INTEGER, JSONB, TEXT[], INTEGER) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.save_audiobook_project_parts(UUID, TEXT, TEXT, TEXT, JSONB, INTEGER, JSONB, TEXT[], INTEGER) TO service_role;
+
+-- Verify the change
+SELECT
+    p.proname,
+    pg_get_function_identity_arguments(p.oid) AS arguments
+FROM pg_proc p
+JOIN pg_namespace n ON n.oid = p.pronamespace
+WHERE n.nspname = 'public'
+  AND p.proname = 'save_audiobook_project_parts';
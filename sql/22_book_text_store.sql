@@ -0,0 +1,96 @@
+-- AudioBook Organizer - Book Text Store
+-- Purpose: Store imported book text once, server-side, as content-addressed chunks so
+-- projects can reference it by hash instead of embedding (and re-sending) it:
+--   book_text_chunks  chunk content keyed by its SHA-256, shared by every text of the
+--                     same user that contains it (re-imports store nothing new)
+--   book_texts        one row per text: total length, line/paragraph counts and the
+--                     ordered chunk list with the offset, line and paragraph each chunk
+--                     starts at (a sparse index for the range API)
+-- Chunk boundaries are content-defined (word ends), so an edited text shares all
+-- chunks away from the edit with the original.
+
+-- =================================================================
+-- Step 1: Chunks
+-- =================================================================
+CREATE TABLE IF NOT EXISTS public.book_text_chunks (
+    user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    content TEXT NOT NULL,
+    char_length INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT book_text_chunks_pkey PRIMARY KEY (user_id, chunk_hash)
+);
+
+COMMENT ON TABLE public.book_text_chunks IS
+    'Content-addressed chunks of imported book text (SHA-256 of the UTF-8 chunk)';
+
+ALTER TABLE public.book_text_chunks ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own text chunks" ON public.book_text_chunks;
+CREATE POLICY "Users can view own text chunks"
+ON public.book_text_chunks FOR SELECT
+USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can insert own text chunks" ON public.book_text_chunks;
+CREATE POLICY "Users can insert own text chunks"
+ON public.book_text_chunks FOR INSERT
+WITH CHECK (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can delete own text chunks" ON public.book_text_chunks;
+CREATE POLICY "Users can delete own text chunks"
+ON public.book_text_chunks FOR DELETE
+USING (auth.uid() = user_id);
+
+GRANT SELECT, INSERT, DELETE ON public.book_text_chunks TO authenticated;
+GRANT ALL ON public.book_text_chunks TO service_role;
+
+-- =================================================================
+-- Step 2: Texts and their chunk index
+-- =================================================================
+-- chunks: [{"hash", "offset", "length", "line", "paragraph", "blank_before",
+--           "continues_line"}, ...] in text order; offsets and lengths count
+--           Unicode characters, line/paragraph are the number of line breaks and
+--           paragraph starts before the chunk
+CREATE TABLE IF NOT EXISTS public.book_texts (
+    user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+    text_hash TEXT NOT NULL,
+    char_length INTEGER NOT NULL,
+    line_count INTEGER NOT NULL,
+    paragraph_count INTEGER NOT NULL,
+    title TEXT,
+    chunks JSONB NOT NULL DEFAULT '[]',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT book_texts_pkey PRIMARY KEY (user_id, text_hash)
+);
+
+COMMENT ON TABLE public.book_texts IS
+    'Imported book texts (SHA-256 of the UTF-8 text) with their chunk, line and paragraph index';
+
+ALTER TABLE public.book_texts ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own texts" ON public.book_texts;
+CREATE POLICY "Users can view own texts"
+ON public.book_texts FOR SELECT
+USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can insert own texts" ON public.book_texts;
+CREATE POLICY "Users can insert own texts"
+ON public.book_texts FOR INSERT
+WITH CHECK (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can delete own texts" ON public.book_texts;
+CREATE POLICY "Users can delete own texts"
+ON public.book_texts FOR DELETE
+USING (auth.uid() = user_id);
+
+GRANT SELECT, INSERT, DELETE ON public.book_texts TO authenticated;
+GRANT ALL ON public.book_texts TO service_role;
+
+-- Verify the changes
+SELECT
+    table_name,
+    column_name,
+    data_type
+FROM information_schema.columns
+WHERE table_name IN ('book_text_chunks', 'book_texts')
+ORDER BY table_name, ordinal_position;
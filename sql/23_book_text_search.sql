@@ -0,0 +1,134 @@
+-- AudioBook Organizer - Book Text Search Index
+-- Purpose: Positional inverted index over the book text store (sql/22) for
+-- /api/projects/search. The index is kept per chunk, not per text: chunks are
+-- content-addressed and shared by every text that contains them, so after an edit
+-- only the few new chunks are tokenized and indexed and the rest of the book keeps
+-- its postings.
+--   book_text_chunk_index  one row per indexed chunk (marks the chunk as done)
+--   book_text_postings     one row per (token, chunk): the ordinal and character
+--                          offset of every occurrence of the token in the chunk
+-- Tokens are normalised by the backend (NFKD, accents stripped, casefolded) and
+-- offsets count Unicode characters from the start of the chunk.
+
+-- =================================================================
+-- Step 1: Indexed chunks
+-- =================================================================
+CREATE TABLE IF NOT EXISTS public.book_text_chunk_index (
+    user_id UUID NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    token_count INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT book_text_chunk_index_pkey PRIMARY KEY (user_id, chunk_hash),
+    CONSTRAINT book_text_chunk_index_chunk_fkey FOREIGN KEY (user_id, chunk_hash)
+        REFERENCES public.book_text_chunks(user_id, chunk_hash) ON DELETE CASCADE
+);
+
+COMMENT ON TABLE public.book_text_chunk_index IS
+    'Book text chunks whose tokens are in book_text_postings';
+
+ALTER TABLE public.book_text_chunk_index ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own chunk index" ON public.book_text_chunk_index;
+CREATE POLICY "Users can view own chunk index"
+ON public.book_text_chunk_index FOR SELECT
+USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can insert own chunk index" ON public.book_text_chunk_index;
+CREATE POLICY "Users can insert own chunk index"
+ON public.book_text_chunk_index FOR INSERT
+WITH CHECK (auth.uid() = user_id);
+
+GRANT SELECT, INSERT ON public.book_text_chunk_index TO authenticated;
+GRANT ALL ON public.book_text_chunk_index TO service_role;
+
+-- =================================================================
+-- Step 2: Postings
+-- =================================================================
+-- Keyed token first: a search reads the rows of its few tokens and nothing else,
+-- however long the book is
+CREATE TABLE IF NOT EXISTS public.book_text_postings (
+    user_id UUID NOT NULL,
+    token TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    ordinals INTEGER[] NOT NULL,
+    offsets INTEGER[] NOT NULL,
+    CONSTRAINT book_text_postings_pkey PRIMARY KEY (user_id, token, chunk_hash),
+    CONSTRAINT book_text_postings_chunk_fkey FOREIGN KEY (user_id, chunk_hash)
+        REFERENCES public.book_text_chunk_index(user_id, chunk_hash) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_book_text_postings_chunk
+ON public.book_text_postings(user_id, chunk_hash);
+
+COMMENT ON TABLE public.book_text_postings IS
+    'Positional postings of book text chunks: token ordinals and character offsets per chunk';
+
+ALTER TABLE public.book_text_postings ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own postings" ON public.book_text_postings;
+CREATE POLICY "Users can view own postings"
+ON public.book_text_postings FOR SELECT
+USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can insert own postings" ON public.book_text_postings;
+CREATE POLICY "Users can insert own postings"
+ON public.book_text_postings FOR INSERT
+WITH CHECK (auth.uid() = user_id);
+
+GRANT SELECT, INSERT ON public.book_text_postings TO authenticated;
+GRANT ALL ON public.book_text_postings TO service_role;
+
+-- =================================================================
+-- Step 3: Index chunks in one round trip
+-- =================================================================
+-- p_chunks: [{"hash": ..., "token_count": N,
+--             "postings": [[token, [ordinal, ...], [offset, ...]], ...]}, ...]
+-- Chunks that are already indexed are skipped, so concurrent or repeated calls
+-- are harmless. Returns the number of chunks newly indexed.
+CREATE OR REPLACE FUNCTION public.index_book_text_chunks(
+    p_user_id UUID,
+    p_chunks JSONB
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = ''
+AS $$
+DECLARE
+    v_chunk JSONB;
+    v_indexed INTEGER := 0;
+BEGIN
+    FOR v_chunk IN SELECT value FROM pg_catalog.jsonb_array_elements(p_chunks) LOOP
+        INSERT INTO public.book_text_chunk_index (user_id, chunk_hash, token_count)
+        VALUES (p_user_id, v_chunk->>'hash', (v_chunk->>'token_count')::INTEGER)
+        ON CONFLICT ON CONSTRAINT book_text_chunk_index_pkey DO NOTHING;
+
+        CONTINUE WHEN NOT FOUND;
+
+        INSERT INTO public.book_text_postings (user_id, token, chunk_hash, ordinals, offsets)
+        SELECT
+            p_user_id,
+            posting->>0,
+            v_chunk->>'hash',
+            ARRAY(SELECT pg_catalog.jsonb_array_elements_text(posting->1)::INTEGER),
+            ARRAY(SELECT pg_catalog.jsonb_array_elements_text(posting->2)::INTEGER)
+        FROM pg_catalog.jsonb_array_elements(v_chunk->'postings') AS e(posting);
+
+        v_indexed := v_indexed + 1;
+    END LOOP;
+
+    RETURN v_indexed;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.index_book_text_chunks(UUID, JSONB) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.index_book_text_chunks(UUID, JSONB) TO service_role;
+
+-- Verify the changes
+SELECT
+    table_name,
+    column_name,
+    data_type
+FROM information_schema.columns
+WHERE table_name IN ('book_text_chunk_index', 'book_text_postings')
+ORDER BY table_name, ordinal_position;
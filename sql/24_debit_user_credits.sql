@@ -0,0 +1,67 @@
+-- AudioBook Organizer - Atomic Credit Debit
+-- Purpose: Paid actions used to read the balance, write the new balance and insert
+-- a usage log in separate requests, so two concurrent actions could both debit
+-- from the same starting balance. debit_user_credits does the check, the debit
+-- and the usage log in a single transaction: the conditional UPDATE
+-- only succeeds while the balance covers the amount, and the row lock it takes
+-- serialises concurrent debits of the same user.
+
+CREATE OR REPLACE FUNCTION public.debit_user_credits(
+    p_user_id UUID,
+    p_amount INTEGER,
+    p_action TEXT,
+    p_metadata JSONB DEFAULT '{}'::JSONB
+)
+RETURNS TABLE (
+    debited BOOLEAN,
+    balance INTEGER,
+    usage_log_id UUID
+)
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = ''
+AS $$
+DECLARE
+    v_balance INTEGER;
+    v_log_id UUID;
+BEGIN
+    IF p_amount IS NULL OR p_amount < 0 THEN
+        RAISE EXCEPTION 'Debit amount must be zero or positive, got %', p_amount;
+    END IF;
+
+    UPDATE public.user_credits uc
+    SET credits = uc.credits - p_amount,
+        last_updated = pg_catalog.now()
+    WHERE uc.user_id = p_user_id
+      AND uc.credits >= p_amount
+    RETURNING uc.credits INTO v_balance;
+
+    IF NOT FOUND THEN
+        -- Not enough credits (balance returned) or no credits row (balance NULL)
+        SELECT uc.credits INTO v_balance
+        FROM public.user_credits uc
+        WHERE uc.user_id = p_user_id;
+
+        RETURN QUERY SELECT FALSE, v_balance, NULL::UUID;
+        RETURN;
+    END IF;
+
+    INSERT INTO public.usage_logs (user_id, action, credits_used, metadata)
+    VALUES (p_user_id, p_action, p_amount, COALESCE(p_metadata, '{}'::JSONB))
+    RETURNING id INTO v_log_id;
+
+    RETURN QUERY SELECT TRUE, v_balance, v_log_id;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.debit_user_credits(UUID, INTEGER, TEXT, JSONB) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.debit_user_credits(UUID, INTEGER, TEXT, JSONB) TO service_role;
+
+-- Verify the changes
+SELECT
+    routine_name,
+    routine_type,
+    security_type
+FROM information_schema.routines
+WHERE routine_schema = 'public'
+  AND routine_name = 'debit_user_credits';
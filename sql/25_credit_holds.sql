@@ -0,0 +1,299 @@
+-- AudioBook Organizer - Credit Holds
+-- Purpose: Exports and uploads check credits before long work and debit afterwards,
+-- so two concurrent jobs could both pass the check against the same balance.
+-- A job now reserves its credits up front as a hold:
+--   reserve_user_credits  takes a hold when the balance minus the user's active
+--                         holds covers the amount
+--   commit_credit_hold    debits the held amount and logs the usage (job succeeded)
+--   release_credit_hold   drops the hold without debiting (job failed)
+-- Holds expire (expires_at), so a job that dies without committing or releasing
+-- frees its credits on its own. debit_user_credits (sql/24) is redefined to leave
+-- room for active holds as well.
+
+-- =================================================================
+-- Step 1: Holds
+-- =================================================================
+CREATE TABLE IF NOT EXISTS public.credit_holds (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+    amount INTEGER NOT NULL CHECK (amount >= 0),
+    action TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'held'
+        CHECK (status IN ('held', 'committed', 'released', 'expired')),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    settled_at TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE public.credit_holds IS
+    'Credits reserved by running jobs; only held, unexpired rows reduce the available balance';
+
+-- Active holds of a user are summed on every reservation
+CREATE INDEX IF NOT EXISTS idx_credit_holds_user_active
+ON public.credit_holds (user_id, expires_at)
+WHERE status = 'held';
+
+ALTER TABLE public.credit_holds ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own credit holds" ON public.credit_holds;
+CREATE POLICY "Users can view own credit holds"
+ON public.credit_holds FOR SELECT
+USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can insert own credit holds" ON public.credit_holds;
+CREATE POLICY "Users can insert own credit holds"
+ON public.credit_holds FOR INSERT
+WITH CHECK (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can update own credit holds" ON public.credit_holds;
+CREATE POLICY "Users can update own credit holds"
+ON public.credit_holds FOR UPDATE
+USING (auth.uid() = user_id);
+
+GRANT SELECT, INSERT, UPDATE ON public.credit_holds TO authenticated;
+GRANT ALL ON public.credit_holds TO service_role;
+
+-- =================================================================
+-- Step 2: Reserve
+-- =================================================================
+-- Locks the user's credits row, so reservations and debits of one user are
+-- serialised. available is what is left after the hold (or, when nothing was
+-- reserved, what is available now; NULL when the user has no credits row).
+CREATE OR REPLACE FUNCTION public.reserve_user_credits(
+    p_user_id UUID,
+    p_amount INTEGER,
+    p_action TEXT,
+    p_ttl_seconds INTEGER DEFAULT 900
+)
+RETURNS TABLE (
+    reserved BOOLEAN,
+    hold_id UUID,
+    available INTEGER
+)
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = ''
+AS $$
+DECLARE
+    v_credits INTEGER;
+    v_held INTEGER;
+    v_hold_id UUID;
+BEGIN
+    IF p_amount IS NULL OR p_amount < 0 THEN
+        RAISE EXCEPTION 'Hold amount must be zero or positive, got %', p_amount;
+    END IF;
+
+    SELECT uc.credits INTO v_credits
+    FROM public.user_credits uc
+    WHERE uc.user_id = p_user_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT FALSE, NULL::UUID, NULL::INTEGER;
+        RETURN;
+    END IF;
+
+    -- Expired holds no longer count; mark them so the partial index stays small
+    UPDATE public.credit_holds ch
+    SET status = 'expired',
+        settled_at = pg_catalog.now()
+    WHERE ch.user_id = p_user_id
+      AND ch.status = 'held'
+      AND ch.expires_at <= pg_catalog.now();
+
+    SELECT COALESCE(SUM(ch.amount), 0)::INTEGER INTO v_held
+    FROM public.credit_holds ch
+    WHERE ch.user_id = p_user_id
+      AND ch.status = 'held';
+
+    IF v_credits - v_held < p_amount THEN
+        RETURN QUERY SELECT FALSE, NULL::UUID, v_credits - v_held;
+        RETURN;
+    END IF;
+
+    INSERT INTO public.credit_holds (user_id, amount, action, expires_at)
+    VALUES (
+        p_user_id,
+        p_amount,
+        p_action,
+        pg_catalog.now() + pg_catalog.make_interval(secs => GREATEST(COALESCE(p_ttl_seconds, 900), 1))
+    )
+    RETURNING id INTO v_hold_id;
+
+    RETURN QUERY SELECT TRUE, v_hold_id, v_credits - v_held - p_amount;
+END;
+$$;
+
+-- =================================================================
+-- Step 3: Commit
+-- =================================================================
+-- Debits the held amount, logs the usage under the hold's action and closes the
+-- hold. Committing twice is a no-op that reports success. A hold that expired
+-- before the job finished is still committed while the balance covers it.
+CREATE OR REPLACE FUNCTION public.commit_credit_hold(
+    p_hold_id UUID,
+    p_metadata JSONB DEFAULT '{}'::JSONB
+)
+RETURNS TABLE (
+    committed BOOLEAN,
+    balance INTEGER,
+    usage_log_id UUID
+)
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = ''
+AS $$
+DECLARE
+    v_hold public.credit_holds%ROWTYPE;
+    v_balance INTEGER;
+    v_log_id UUID;
+BEGIN
+    SELECT * INTO v_hold
+    FROM public.credit_holds ch
+    WHERE ch.id = p_hold_id
+    FOR UPDATE;
+
+    IF NOT FOUND OR v_hold.status = 'released' THEN
+        RETURN QUERY SELECT FALSE, NULL::INTEGER, NULL::UUID;
+        RETURN;
+    END IF;
+
+    IF v_hold.status = 'committed' THEN
+        SELECT uc.credits INTO v_balance
+        FROM public.user_credits uc
+        WHERE uc.user_id = v_hold.user_id;
+
+        RETURN QUERY SELECT TRUE, v_balance, NULL::UUID;
+        RETURN;
+    END IF;
+
+    UPDATE public.user_credits uc
+    SET credits = uc.credits - v_hold.amount,
+        last_updated = pg_catalog.now()
+    WHERE uc.user_id = v_hold.user_id
+      AND uc.credits >= v_hold.amount
+    RETURNING uc.credits INTO v_balance;
+
+    IF NOT FOUND THEN
+        -- Only reachable for an expired hold whose credits were spent meanwhile
+        SELECT uc.credits INTO v_balance
+        FROM public.user_credits uc
+        WHERE uc.user_id = v_hold.user_id;
+
+        RETURN QUERY SELECT FALSE, v_balance, NULL::UUID;
+        RETURN;
+    END IF;
+
+    UPDATE public.credit_holds ch
+    SET status = 'committed',
+        settled_at = pg_catalog.now()
+    WHERE ch.id = p_hold_id;
+
+    INSERT INTO public.usage_logs (user_id, action, credits_used, metadata)
+    VALUES (v_hold.user_id, v_hold.action, v_hold.amount, COALESCE(p_metadata, '{}'::JSONB))
+    RETURNING id INTO v_log_id;
+
+    RETURN QUERY SELECT TRUE, v_balance, v_log_id;
+END;
+$$;
+
+-- =================================================================
+-- Step 4: Release
+-- =================================================================
+CREATE OR REPLACE FUNCTION public.release_credit_hold(
+    p_hold_id UUID
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = ''
+AS $$
+BEGIN
+    UPDATE public.credit_holds ch
+    SET status = 'released',
+        settled_at = pg_catalog.now()
+    WHERE ch.id = p_hold_id
+      AND ch.status IN ('held', 'expired');
+
+    RETURN FOUND;
+END;
+$$;
+
+-- =================================================================
+-- Step 5: Direct debits leave room for active holds
+-- =================================================================
+CREATE OR REPLACE FUNCTION public.debit_user_credits(
+    p_user_id UUID,
+    p_amount INTEGER,
+    p_action TEXT,
+    p_metadata JSONB DEFAULT '{}'::JSONB
+)
+RETURNS TABLE (
+    debited BOOLEAN,
+    balance INTEGER,
+    usage_log_id UUID
+)
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = ''
+AS $$
+DECLARE
+    v_balance INTEGER;
+    v_held INTEGER;
+    v_log_id UUID;
+BEGIN
+    IF p_amount IS NULL OR p_amount < 0 THEN
+        RAISE EXCEPTION 'Debit amount must be zero or positive, got %', p_amount;
+    END IF;
+
+    SELECT uc.credits INTO v_balance
+    FROM public.user_credits uc
+    WHERE uc.user_id = p_user_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT FALSE, NULL::INTEGER, NULL::UUID;
+        RETURN;
+    END IF;
+
+    SELECT COALESCE(SUM(ch.amount), 0)::INTEGER INTO v_held
+    FROM public.credit_holds ch
+    WHERE ch.user_id = p_user_id
+      AND ch.status = 'held'
+      AND ch.expires_at > pg_catalog.now();
+
+    IF v_balance - v_held < p_amount THEN
+        RETURN QUERY SELECT FALSE, v_balance - v_held, NULL::UUID;
+        RETURN;
+    END IF;
+
+    UPDATE public.user_credits uc
+    SET credits = uc.credits - p_amount,
+        last_updated = pg_catalog.now()
+    WHERE uc.user_id = p_user_id
+    RETURNING uc.credits INTO v_balance;
+
+    INSERT INTO public.usage_logs (user_id, action, credits_used, metadata)
+    VALUES (p_user_id, p_action, p_amount, COALESCE(p_metadata, '{}'::JSONB))
+    RETURNING id INTO v_log_id;
+
+    RETURN QUERY SELECT TRUE, v_balance, v_log_id;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.reserve_user_credits(UUID, INTEGER, TEXT, INTEGER) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.reserve_user_credits(UUID, INTEGER, TEXT, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION public.commit_credit_hold(UUID, JSONB) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.commit_credit_hold(UUID, JSONB) TO service_role;
+GRANT EXECUTE ON FUNCTION public.release_credit_hold(UUID) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.release_credit_hold(UUID) TO service_role;
+
+-- Verify the changes
+SELECT
+    routine_name,
+    routine_type,
+    security_type
+FROM information_schema.routines
+WHERE routine_schema = 'public'
+  AND routine_name IN ('reserve_user_credits', 'commit_credit_hold',
+                       'release_credit_hold', 'debit_user_credits');
@@ -0,0 +1,77 @@
+-- AudioBook Organizer - Single-Call User Initialisation
+-- Purpose: /api/auth/init-user used to read the profile and the credits, create
+-- whichever was missing and read both again, in up to six requests. init_user
+-- does the same in one call: it returns the profile and the credit balance,
+-- creating the profile and the credits row first when they do not exist.
+-- Runs with the caller's rights, so the profiles and user_credits RLS policies
+-- still decide what a user may read and create.
+
+CREATE OR REPLACE FUNCTION public.init_user(
+    p_user_id UUID,
+    p_email TEXT,
+    p_full_name TEXT DEFAULT NULL,
+    p_username TEXT DEFAULT NULL,
+    p_avatar_url TEXT DEFAULT NULL,
+    p_initial_credits INTEGER DEFAULT 100
+)
+RETURNS TABLE (
+    profile JSONB,
+    credits INTEGER,
+    is_new_user BOOLEAN
+)
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = ''
+AS $$
+DECLARE
+    v_profile JSONB;
+    v_credits INTEGER;
+    v_new_user BOOLEAN := FALSE;
+BEGIN
+    -- Step 1: Profile, created when missing
+    SELECT pg_catalog.to_jsonb(p) INTO v_profile
+    FROM public.profiles p
+    WHERE p.id = p_user_id;
+
+    IF v_profile IS NULL THEN
+        INSERT INTO public.profiles (id, email, full_name, username, avatar_url, created_at, updated_at)
+        VALUES (p_user_id, p_email, p_full_name, p_username, p_avatar_url, pg_catalog.now(), pg_catalog.now())
+        ON CONFLICT (id) DO NOTHING;
+        -- A concurrent call may have created it first
+        v_new_user := FOUND;
+
+        SELECT pg_catalog.to_jsonb(p) INTO v_profile
+        FROM public.profiles p
+        WHERE p.id = p_user_id;
+    END IF;
+
+    -- Step 2: Credits, created when missing
+    SELECT uc.credits INTO v_credits
+    FROM public.user_credits uc
+    WHERE uc.user_id = p_user_id;
+
+    IF v_credits IS NULL THEN
+        INSERT INTO public.user_credits (user_id, credits, last_updated)
+        VALUES (p_user_id, p_initial_credits, pg_catalog.now())
+        ON CONFLICT (user_id) DO NOTHING;
+
+        SELECT uc.credits INTO v_credits
+        FROM public.user_credits uc
+        WHERE uc.user_id = p_user_id;
+    END IF;
+
+    RETURN QUERY SELECT v_profile, v_credits, v_new_user;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.init_user(UUID, TEXT, TEXT, TEXT, TEXT, INTEGER) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.init_user(UUID, TEXT, TEXT, TEXT, TEXT, INTEGER) TO service_role;
+
+-- Verify the changes
+SELECT
+    routine_name,
+    routine_type,
+    security_type
+FROM information_schema.routines
+WHERE routine_schema = 'public'
+  AND routine_name = 'init_user';
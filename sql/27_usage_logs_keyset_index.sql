@@ -0,0 +1,25 @@
+-- AudioBook Organizer - Usage History Keyset Index
+-- Purpose: /api/auth/usage-history pages through a user's usage logs newest
+-- first and continues each page from the (created_at, id) of the previous
+-- page's last row instead of an OFFSET. These indexes match that order, so
+-- every page (and the action filter) is an index range scan however deep it
+-- is. They also cover the per-user counts of the page totals.
+
+-- Step 1: Per-user history
+CREATE INDEX IF NOT EXISTS idx_usage_logs_user_created_id
+    ON public.usage_logs (user_id, created_at DESC, id DESC);
+
+-- Step 2: Per-user history filtered by action
+CREATE INDEX IF NOT EXISTS idx_usage_logs_user_action_created_id
+    ON public.usage_logs (user_id, action, created_at DESC, id DESC);
+
+-- Step 3: The user_id index is a prefix of the ones above
+DROP INDEX IF EXISTS public.idx_usage_logs_user_id;
+
+-- Verify the changes
+SELECT
+    indexname,
+    indexdef
+FROM pg_indexes
+WHERE schemaname = 'public'
+  AND tablename = 'usage_logs';